@@ -4,100 +4,158 @@
 Для запуска установите: pip install PyQt5 Pillow
 """
 
+import time
+STARTUP_STARTED = time.perf_counter()
+
 import sys
 import os
+import re
+import random
 import sqlite3
 import json
+import statistics
 import shutil
+import hashlib
+import threading
+from html import escape
+from contextlib import contextmanager
 from datetime import datetime
-from pathlib import Path
-from PIL import Image, ImageQt
+from itertools import accumulate
+from collections import OrderedDict
 
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
+# Pillow и QtPrintSupport импортируются при первом использовании
+from PyQt5.QtCore import (
+    Qt, QObject, QTimer, QEvent, QEventLoop, QRect, QSize, QModelIndex, QAbstractListModel,
+    QRunnable, QThreadPool, QT_VERSION_STR, pyqtSignal, pyqtSlot
+)
+from PyQt5.QtGui import (
+    QColor, QFont, QFontMetrics, QIcon, QImage, QPainter, QPalette, QPen, QPixmap,
+    QTextCharFormat, QTextDocument
+)
+from PyQt5.QtWidgets import (
+    QAbstractItemView, QAction, QApplication, QComboBox, QDialog, QFileDialog,
+    QFormLayout, QFrame, QGridLayout, QGroupBox, QHBoxLayout, QLabel, QLineEdit,
+    QListView, QListWidget, QListWidgetItem, QMainWindow, QProgressDialog, QMessageBox, QPushButton, QScrollArea,
+    QStackedWidget, QStyle, QStyledItemDelegate, QTextEdit, QToolBar, QVBoxLayout,
+    QWidget
+)
 
-# ============================================
-# КЛАСС ДЛЯ РАБОТЫ С БАЗОЙ ДАННЫХ
-# ============================================
-class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('school_notes.db', check_same_thread=False)
-        self.create_tables()
-        self.insert_default_data()
-    
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        
-        # Таблица предметов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS subjects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE,
-                color TEXT
-            )
-        ''')
-        
-        # Таблица готовых конспектов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                subject_id INTEGER,
-                title TEXT,
-                content TEXT,
-                grade INTEGER,
-                created_at TIMESTAMP,
-                FOREIGN KEY (subject_id) REFERENCES subjects (id)
-            )
-        ''')
-        
-        # Таблица пользовательских конспектов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_notes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                subject TEXT,
-                title TEXT,
-                content TEXT,
-                images TEXT,
-                grade INTEGER DEFAULT 1,
-                created_at TIMESTAMP
-            )
-        ''')
-        
-        # Таблица изображений
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS images (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                note_id INTEGER,
-                image_data BLOB,
-                FOREIGN KEY (note_id) REFERENCES notes (id)
-            )
-        ''')
-        
-        self.conn.commit()
-    
-    def insert_default_data(self):
-        cursor = self.conn.cursor()
-        
-        # Добавляем предметы с цветами
-        subjects = [
-            ('Математика', '#3498db'),
-            ('Русский язык', '#e74c3c'),
-            ('Чтение', '#2ecc71'),
-            ('Письмо', '#f39c12'),
-            ('Окружающий мир', '#9b59b6'),
-            ('Технология', '#1abc9c'),
-            ('Физкультура', '#e67e22'),
-            ('Музыка', '#34495e')
-        ]
-        
-        for name, color in subjects:
-            cursor.execute('INSERT OR IGNORE INTO subjects (name, color) VALUES (?, ?)', (name, color))
-        
-        # Примерные конспекты для 1 класса
-        default_notes = [
-            (1, 'Сложение и вычитание до 10', 
-             '''📌 СЛОЖЕНИЕ:
+IMPORTS_FINISHED = time.perf_counter()
+
+# Сколько результатов поиска показывать из каждой таблицы
+SEARCH_LIMIT = 200
+
+# Среди скольких первых совпадений ранжировать слишком частый запрос:
+# bm25 по всем совпадениям частого слова занимает сотни миллисекунд
+SEARCH_RANK_CANDIDATES = 5000
+
+# Пауза после ввода символа перед запуском поиска, мс
+SEARCH_DEBOUNCE_MS = 250
+
+# Сколько запросов хранить в кэше результатов поиска
+SEARCH_CACHE_SIZE = 64
+
+# Размер страницы при постраничной загрузке списков
+PAGE_SIZE = 100
+
+# Сколько символов текста загружать для краткого содержания
+PREVIEW_LENGTH = 150
+
+# Сколько страниц со списками держать в памяти
+VIEW_CACHE_SIZE = 8
+
+# Как класть загруженные изображения в хранилище: 'copy', 'reflink' или 'hardlink'
+IMAGE_LINK_MODE = 'reflink'
+
+# Обработка загружаемых фотографий: наибольший размер, качество сжатия
+# и формат ('JPEG' или 'WEBP')
+INGEST_MAX_SIZE = (2560, 2560)
+INGEST_QUALITY = 85
+INGEST_FORMAT = 'JPEG'
+
+# Сколько потоков записывают файлы при экспорте в папку
+EXPORT_WORKERS = 4
+
+# Массовый импорт: расширения файлов, число потоков разбора, размер порции,
+# число строк в предпросмотре и предмет для файлов, где он не определился
+IMPORT_EXTENSIONS = ('.txt', '.md')
+IMPORT_WORKERS = 4
+IMPORT_BATCH = 500
+IMPORT_PREVIEW_SIZE = 200
+IMPORT_DEFAULT_SUBJECT = 'Без предмета'
+
+# Сколько записей архива библиотеки загружается одной транзакцией
+ARCHIVE_BATCH = 500
+
+# Резервные копии: сколько хранить, как часто делать автоматически (часов)
+# и сколько страниц базы копировать за один шаг
+BACKUP_KEEP = 10
+BACKUP_INTERVAL_HOURS = 24
+BACKUP_PAGES = 256
+
+# Файл в папке экспорта со сведениями о выгруженных конспектах
+EXPORT_MANIFEST = '.export_manifest.json'
+
+# Сколько отформатированных конспектов держать в памяти и с какой длины
+# текста сохранять готовый HTML в базе (None - не сохранять)
+RENDER_CACHE_SIZE = 32
+RENDER_PERSIST_LENGTH = 10000
+
+# Нагрузочные замеры (--benchmark): размеры баз, seed генератора, повторы,
+# папка для баз и результатов, размер порции при создании базы, число картинок,
+# до какого размера базы замерять обход всех страниц, число замеряемых записей,
+# допустимое замедление при сравнении и шум измерения, мс
+BENCHMARK_SIZES = (1000, 100000, 1000000)
+BENCHMARK_SEED = 1
+BENCHMARK_REPEAT = 5
+BENCHMARK_DIRECTORY = 'benchmarks'
+BENCHMARK_BATCH = 10000
+BENCHMARK_IMAGES = 16
+BENCHMARK_FULL_SCAN_LIMIT = 200000
+BENCHMARK_WRITES = 100
+BENCHMARK_THRESHOLD = 0.2
+BENCHMARK_NOISE_MS = 0.05
+
+# Замеры интерфейса (--ui-benchmark): размеры баз, сколько раз открывать
+# просмотр, сколько раз прокручивать список, период пульса и с какой
+# задержки цикла событий она считается зависанием, мс, предельное время
+# ожидания одного шага сценария, с
+UI_BENCHMARK_SIZES = (1000, 100000)
+UI_BENCHMARK_VIEWER_RUNS = 100
+UI_BENCHMARK_SCROLLS = 20
+UI_HEARTBEAT_MS = 5
+UI_STALL_MS = 50
+UI_BENCHMARK_TIMEOUT = 120
+
+# Что сравнивается между прогонами замеров
+BENCHMARK_METRICS = ('median_ms', 'wall_ms', 'stall_total_ms')
+
+# Предельный размер папки с миниатюрами изображений и сколько хэшей
+# исходных файлов помнить, чтобы не читать их заново
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+THUMBNAIL_DIGEST_CACHE_SIZE = 2048
+
+# Сколько декодированных кадров хранит карусель и сколько соседей
+# с каждой стороны она загружает заранее
+IMAGE_CACHE_SIZE = 5
+IMAGE_PREFETCH = 2
+
+# Предметы с цветами
+DEFAULT_SUBJECTS = [
+    ('Математика', '#3498db'),
+    ('Русский язык', '#e74c3c'),
+    ('Чтение', '#2ecc71'),
+    ('Письмо', '#f39c12'),
+    ('Окружающий мир', '#9b59b6'),
+    ('Технология', '#1abc9c'),
+    ('Физкультура', '#e67e22'),
+    ('Музыка', '#34495e')
+]
+
+# Примерные конспекты для 1 класса
+DEFAULT_NOTES = [
+    (1, 'Сложение и вычитание до 10', 
+     '''📌 СЛОЖЕНИЕ:
 • Объединение двух чисел
 • Знак: + (плюс)
 • Пример: 3 + 2 = 5
@@ -111,9 +169,9 @@ class Database:
 1. От перестановки слагаемых сумма не меняется
 2. Прибавить 0 - число не изменится
 3. Вычесть 0 - число не изменится''', 1),
-            
-            (1, 'Цифры от 0 до 9',
-             '''0 - ноль (ничего)
+    
+    (1, 'Цифры от 0 до 9',
+     '''0 - ноль (ничего)
 1 - один (точка)
 2 - два (пара)
 3 - три (треугольник)
@@ -126,9 +184,9 @@ class Database:
 
 🔢 Число - количество предметов
 🔢 Цифра - знак для записи числа''', 1),
-            
-            (2, 'Гласные и согласные',
-             '''🎵 ГЛАСНЫЕ ЗВУКИ (6):
+    
+    (2, 'Гласные и согласные',
+     '''🎵 ГЛАСНЫЕ ЗВУКИ (6):
 А, О, У, Ы, И, Э
 • Можно петь
 • Образуют слог
@@ -139,17 +197,17 @@ class Database:
 
 ❗ Й, Ч, Щ - всегда мягкие
 ❗ Ж, Ш, Ц - всегда твердые''', 1),
-            
-            (2, 'Алфавит',
-             '''А Б В Г Д Е Ё Ж З И Й К Л М Н О П Р С Т У Ф Х Ц Ч Ш Щ Ъ Ы Ь Э Ю Я
+    
+    (2, 'Алфавит',
+     '''А Б В Г Д Е Ё Ж З И Й К Л М Н О П Р С Т У Ф Х Ц Ч Ш Щ Ъ Ы Ь Э Ю Я
 
 Всего 33 буквы:
 • 10 гласных (А, Е, Ё, И, О, У, Ы, Э, Ю, Я)
 • 21 согласная
 • 2 знака (Ъ, Ь)''', 1),
-            
-            (5, 'Времена года',
-             '''❄️ ЗИМА (декабрь, январь, февраль):
+    
+    (5, 'Времена года',
+     '''❄️ ЗИМА (декабрь, январь, февраль):
 • Снег, лед, мороз
 • Новый год, Рождество
 • Зимние забавы
@@ -168,9 +226,9 @@ class Database:
 • Листопад, дожди, заморозки
 • Уборка урожая
 • Птицы улетают на юг''', 1),
-            
-            (5, 'Дни недели',
-             '''📅 ПОРЯДОК ДНЕЙ:
+    
+    (5, 'Дни недели',
+     '''📅 ПОРЯДОК ДНЕЙ:
 1. Понедельник
 2. Вторник
 3. Среда
@@ -184,9 +242,9 @@ class Database:
 В Четверг встретился с Пятницей,
 Суббота с Воскресеньем
 Гуляли целую неделю"''', 1),
-            
-            (3, 'Сказки для чтения',
-             '''📖 РУССКИЕ НАРОДНЫЕ СКАЗКИ:
+    
+    (3, 'Сказки для чтения',
+     '''📖 РУССКИЕ НАРОДНЫЕ СКАЗКИ:
 • "Колобок"
 • "Репка"
 • "Теремок"
@@ -202,9 +260,9 @@ class Database:
 2. Следи за пальцем
 3. Делай паузы на точках
 4. Выражай голосом эмоции''', 1),
-            
-            (4, 'Прописи букв',
-             '''✏️ ПРАВИЛА ПИСЬМА:
+    
+    (4, 'Прописи букв',
+     '''✏️ ПРАВИЛА ПИСЬМА:
 1. Сиди прямо
 2. Держи ручку правильно
 3. Тетрадь под наклоном
@@ -221,9 +279,9 @@ class Database:
 О - овал
 Л - треугольник
 М - две палочки и две перекладины''', 1),
-            
-            (6, 'Аппликация из бумаги',
-             '''✂️ МАТЕРИАЛЫ:
+    
+    (6, 'Аппликация из бумаги',
+     '''✂️ МАТЕРИАЛЫ:
 • Цветная бумага
 • Ножницы (безопасные)
 • Клей-карандаш
@@ -239,421 +297,2415 @@ class Database:
 • Ножницы передавай кольцами вперед
 • Не бери клей в рот
 • Работай на клеенке''', 1)
-        ]
-        
-        for subject_id, title, content, grade in default_notes:
-            cursor.execute('SELECT 1 FROM notes WHERE title = ?', (title,))
-            if not cursor.fetchone():
-                cursor.execute('''
-                    INSERT INTO notes (subject_id, title, content, grade, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (subject_id, title, content, grade, datetime.now()))
-        
-        self.conn.commit()
-    
-    def get_subjects(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM subjects ORDER BY id')
-        return cursor.fetchall()
-    
-    def get_notes_by_subject(self, subject_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT n.*, s.name as subject_name, s.color
-            FROM notes n 
-            JOIN subjects s ON n.subject_id = s.id 
-            WHERE n.subject_id = ? AND n.grade = 1
-            ORDER BY n.title
-        ''', (subject_id,))
-        return cursor.fetchall()
+]
+
+# Меняется вместе со встроенными данными и запускает их повторное заполнение
+DEFAULT_DATA_HASH = hashlib.sha256(
+    json.dumps([DEFAULT_SUBJECTS, DEFAULT_NOTES], ensure_ascii=False).encode('utf-8')
+).hexdigest()
+
+
+def summary_row(row):
+    """Краткая строка списка: (kind, id, title, subject, color, preview)"""
+    kind, note_id, title, subject, color, text = row
+    preview = ' '.join((text or '').split())
+    if len(preview) > 100:
+        preview = preview[:100] + "..."
+    return (kind, note_id, title, subject, color, preview)
+
+
+def search_words(text):
+    """Слова текста в том виде, в каком они попадают в поисковый индекс"""
+    return re.findall(r'\w+', text.lower().replace('ё', 'е'))
+
+
+def fts_text(column):
+    """SQL-выражение, которым текст колонки нормализуется для FTS-индекса"""
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# ============================================
+# СОЕДИНЕНИЯ С БАЗОЙ ДАННЫХ
+# ============================================
+class ConnectionPool:
+    """Соединения с базой в режиме WAL.
     
-    def search_notes(self, keyword):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT n.*, s.name as subject_name, s.color
-            FROM notes n 
-            JOIN subjects s ON n.subject_id = s.id 
-            WHERE (n.title LIKE ? OR n.content LIKE ?) AND n.grade = 1
-            ORDER BY n.title
-        ''', (f'%{keyword}%', f'%{keyword}%'))
-        return cursor.fetchall()
+    Каждый поток читает через собственное соединение, а все записи идут
+    по очереди через одно пишущее соединение. Читатели в WAL не ждут
+    писателя, поэтому фоновые запросы не блокируют запись из интерфейса.
     
-    def get_all_notes(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT n.*, s.name as subject_name, s.color
-            FROM notes n 
-            JOIN subjects s ON n.subject_id = s.id 
-            WHERE n.grade = 1
-            ORDER BY s.name, n.title
-        ''')
-        return cursor.fetchall()
+    Соединения читателей хранятся по идентификатору потока, а не в
+    threading.local: у потоков QThreadPool Python-состояние потока
+    пересоздается на каждую задачу, и локальные данные потока теряются.
+    Потоки Qt не сообщают о завершении, поэтому пулы потоков, которые
+    читают базу, создаются через db_thread_pool() и не завершают потоки.
+    Соединения завершившихся потоков Python (например, из
+    ThreadPoolExecutor) закрываются, когда открывается новое соединение.
     
-    def add_user_note(self, subject, title, content, images, grade=1):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO user_notes (subject, title, content, images, grade, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (subject, title, content, json.dumps(images), grade, datetime.now()))
-        self.conn.commit()
-        return cursor.lastrowid
+    version растет после каждой транзакции записи; по нему кэши узнают,
+    что данные изменились.
+    """
+    PRAGMAS = (
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA mmap_size = 268435456',
+        'PRAGMA cache_size = -20000',
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA busy_timeout = 5000',
+    )
     
-    def get_user_notes(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM user_notes ORDER BY created_at DESC')
-        return cursor.fetchall()
+    def __init__(self, path):
+        self.path = path
+        # Идентификатор потока -> (читающее соединение, объект потока)
+        self.readers = {}
+        self.readers_lock = threading.Lock()
+        self.write_lock = threading.RLock()
+        self.writer = self.connect()
+        self.version = 0
     
-    def delete_user_note(self, note_id):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM user_notes WHERE id = ?', (note_id,))
-        self.conn.commit()
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
     
-    def update_user_note(self, note_id, subject, title, content, images):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE user_notes 
-            SET subject = ?, title = ?, content = ?, images = ?
-            WHERE id = ?
-        ''', (subject, title, content, json.dumps(images), note_id))
-        self.conn.commit()
+    def reader(self):
+        """Читающее соединение текущего потока"""
+        ident = threading.get_ident()
+        thread = threading.current_thread()
+        entry = self.readers.get(ident)
+        if entry is not None:
+            if entry[1] is not thread:
+                # Идентификатор достался новому потоку от завершившегося
+                with self.readers_lock:
+                    self.readers[ident] = (entry[0], thread)
+            return entry[0]
+        
+        self.release_finished()
+        conn = self.connect()
+        conn.execute('PRAGMA query_only = 1')
+        with self.readers_lock:
+            self.readers[ident] = (conn, thread)
+        return conn
     
-    def get_statistics(self):
-        cursor = self.conn.cursor()
-        
-        # Общее количество конспектов
-        cursor.execute('SELECT COUNT(*) FROM notes WHERE grade = 1')
-        default_count = cursor.fetchone()[0]
+    def release_finished(self):
+        """Закрывает соединения завершившихся потоков Python.
         
-        cursor.execute('SELECT COUNT(*) FROM user_notes')
-        user_count = cursor.fetchone()[0]
-        
-        # Конспекты по предметам
-        cursor.execute('''
-            SELECT s.name, COUNT(n.id) 
-            FROM notes n 
-            JOIN subjects s ON n.subject_id = s.id 
-            WHERE n.grade = 1
-            GROUP BY s.name
-        ''')
-        by_subject = cursor.fetchall()
-        
-        return {
-            'default_notes': default_count,
-            'user_notes': user_count,
-            'by_subject': by_subject
-        }
+        Для потоков, запущенных не из Python (QThreadPool), is_alive() всегда
+        True: их соединения живут до close().
+        """
+        with self.readers_lock:
+            finished = [ident for ident, (conn, thread) in self.readers.items()
+                        if not thread.is_alive()]
+            for ident in finished:
+                self.readers.pop(ident)[0].close()
+    
+    @contextmanager
+    def write(self):
+        """Транзакция на пишущем соединении, записи выполняются по одной"""
+        with self.write_lock:
+            try:
+                yield self.writer
+                self.writer.commit()
+            except Exception:
+                self.writer.rollback()
+                raise
+            finally:
+                # После фиксации: читатель, увидевший новый номер, увидит и данные
+                self.version += 1
     
     def close(self):
-        self.conn.close()
+        with self.readers_lock:
+            for conn, thread in self.readers.values():
+                conn.close()
+            self.readers = {}
+        self.writer.close()
+
+
+def db_thread_pool(parent, max_threads):
+    """QThreadPool для задач, читающих базу.
+    
+    Простаивающие потоки не завершаются: новый поток открыл бы еще одно
+    соединение, а соединение завершенного осталось бы в ConnectionPool.
+    """
+    pool = QThreadPool(parent)
+    pool.setMaxThreadCount(max_threads)
+    pool.setExpiryTimeout(-1)
+    return pool
 
 
 # ============================================
-# ВИДЖЕТ ДЛЯ ПРОСМОТРА КОНСПЕКТА
+# КЛАСС ДЛЯ РАБОТЫ С БАЗОЙ ДАННЫХ
 # ============================================
-class NoteViewer(QDialog):
-    def __init__(self, note_data, parent=None):
-        super().__init__(parent)
-        self.note_data = note_data
-        self.images = note_data.get('images', [])
-        self.current_image_index = 0
-        self.initUI()
+class Database:
+    def __init__(self, path='school_notes.db'):
+        self.pool = ConnectionPool(path)
+        # Пишущее соединение: миграции и начальные данные
+        self.conn = self.pool.writer
+        self.create_tables()
+        self.insert_default_data()
     
-    def initUI(self):
-        self.setWindowTitle(self.note_data['title'])
-        self.setMinimumSize(700, 600)
-        
-        layout = QVBoxLayout()
+    @property
+    def data_version(self):
+        """Номер последней записи в базу: меняется при любом изменении данных"""
+        return self.pool.version
+    
+    def create_tables(self):
+        """Доводит схему до последней версии, записанной в PRAGMA user_version"""
+        cursor = self.conn.cursor()
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
         
-        # Заголовок
-        title_label = QLabel(self.note_data['title'])
-        title_label.setStyleSheet('''
-            font-size: 22px;
-            font-weight: bold;
-            color: #2c3e50;
-            padding: 15px;
-            border-bottom: 2px solid #3498db;
-            background-color: #f8f9fa;
+        # Каждая миграция выполняется в своей транзакции вместе со сменой версии
+        for number, migration in enumerate(self.MIGRATIONS[version:], start=version + 1):
+            try:
+                cursor.execute('BEGIN')
+                migration(self, cursor)
+                cursor.execute(f'PRAGMA user_version = {number}')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+    
+    def migrate_base_schema(self, cursor):
+        """Миграция 1: исходные таблицы приложения"""
+        # Таблица предметов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subjects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE,
+                color TEXT
+            )
         ''')
-        title_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(title_label)
-        
-        # Информация о предмете
-        info_layout = QHBoxLayout()
         
-        subject_label = QLabel(f"📚 {self.note_data.get('subject', '')}")
-        subject_label.setStyleSheet('font-size: 14px; color: #7f8c8d; padding: 5px;')
-        
-        grade_label = QLabel(f"1 класс")
-        grade_label.setStyleSheet('''
-            font-size: 12px;
-            color: white;
-            background-color: #3498db;
-            padding: 3px 10px;
-            border-radius: 10px;
+        # Таблица готовых конспектов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subject_id INTEGER,
+                title TEXT,
+                content TEXT,
+                grade INTEGER,
+                created_at TIMESTAMP,
+                FOREIGN KEY (subject_id) REFERENCES subjects (id)
+            )
         ''')
         
-        info_layout.addWidget(subject_label)
-        info_layout.addStretch()
-        info_layout.addWidget(grade_label)
-        layout.addLayout(info_layout)
-        
-        # Контент с прокруткой
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        
-        content_widget = QWidget()
-        content_layout = QVBoxLayout(content_widget)
+        # Таблица пользовательских конспектов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_notes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                subject TEXT,
+                title TEXT,
+                content TEXT,
+                images TEXT,
+                grade INTEGER DEFAULT 1,
+                created_at TIMESTAMP
+            )
+        ''')
         
-        # Текст конспекта
-        content_text = QTextEdit()
-        content_text.setReadOnly(True)
-        content_text.setHtml(self.format_content(self.note_data['content']))
-        content_text.setStyleSheet('''
-            QTextEdit {
-                font-size: 14px;
-                line-height: 1.6;
-                padding: 15px;
-                border: none;
-                background-color: white;
-            }
+        # Таблица изображений
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                note_id INTEGER,
+                image_data BLOB,
+                FOREIGN KEY (note_id) REFERENCES notes (id)
+            )
         ''')
-        content_layout.addWidget(content_text)
+    
+    def migrate_search_index(self, cursor):
+        """Миграция 2: FTS5-индексы по конспектам и триггеры синхронизации"""
+        cursor.execute('''
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name IN ('notes_fts', 'user_notes_fts')
+        ''')
+        existing = {row[0] for row in cursor.fetchall()}
         
-        # Изображения
-        if self.images:
-            images_group = QGroupBox("📷 Изображения")
-            images_group.setStyleSheet('''
-                QGroupBox {
-                    font-size: 14px;
-                    font-weight: bold;
-                    border: 1px solid #bdc3c7;
-                    border-radius: 5px;
-                    margin-top: 10px;
-                }
-                QGroupBox::title {
-                    subcontrol-origin: margin;
-                    left: 10px;
-                    padding: 0 5px 0 5px;
-                }
-            ''')
-            
-            images_layout = QVBoxLayout()
+        for table in ('notes', 'user_notes'):
+            fts = f'{table}_fts'
             
-            # Просмотрщик изображений
-            self.image_label = QLabel()
-            self.image_label.setAlignment(Qt.AlignCenter)
-            self.image_label.setMinimumHeight(300)
-            self.image_label.setStyleSheet('border: 1px solid #ddd; background-color: #f5f5f5;')
-            images_layout.addWidget(self.image_label)
+            # unicode61 приводит кириллицу к нижнему регистру,
+            # префиксные индексы ускоряют поиск по началу слова
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    title, content,
+                    content='{table}', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )
+            ''')
             
-            # Кнопки навигации по изображениям
-            if len(self.images) > 1:
-                nav_layout = QHBoxLayout()
-                nav_layout.addStretch()
-                
-                self.prev_btn = QPushButton("◀ Назад")
-                self.prev_btn.clicked.connect(self.show_prev_image)
-                self.prev_btn.setEnabled(False)
-                
-                self.image_counter = QLabel(f"1 / {len(self.images)}")
-                self.image_counter.setStyleSheet('font-weight: bold;')
-                
-                self.next_btn = QPushButton("Вперед ▶")
-                self.next_btn.clicked.connect(self.show_next_image)
-                if len(self.images) == 1:
-                    self.next_btn.setEnabled(False)
-                
-                nav_layout.addWidget(self.prev_btn)
-                nav_layout.addWidget(self.image_counter)
-                nav_layout.addWidget(self.next_btn)
-                nav_layout.addStretch()
-                
-                images_layout.addLayout(nav_layout)
+            # В индекс попадает текст с «ё», замененной на «е»
+            new_title, new_content = fts_text('new.title'), fts_text('new.content')
+            old_title, old_content = fts_text('old.title'), fts_text('old.content')
             
-            images_group.setLayout(images_layout)
-            content_layout.addWidget(images_group)
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts} (rowid, title, content)
+                    VALUES (new.id, {new_title}, {new_content});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, title, content)
+                    VALUES ('delete', old.id, {old_title}, {old_content});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF title, content ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, title, content)
+                    VALUES ('delete', old.id, {old_title}, {old_content});
+                    INSERT INTO {fts} (rowid, title, content)
+                    VALUES (new.id, {new_title}, {new_content});
+                END
+            ''')
             
-            # Загружаем первое изображение
-            self.load_current_image()
-        
-        content_layout.addStretch()
-        scroll_area.setWidget(content_widget)
-        layout.addWidget(scroll_area)
+            if fts not in existing:
+                # Заголовок весит больше текста при ранжировании
+                cursor.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+                # Индексируем конспекты, которые уже есть в старой базе
+                cursor.execute(f'''
+                    INSERT INTO {fts} (rowid, title, content)
+                    SELECT id, {fts_text('title')}, {fts_text('content')} FROM {table}
+                ''')
+    
+    def migrate_indexes(self, cursor):
+        """Миграция 3: индексы под запросы списков, проверок и статистики"""
+        # Конспекты предмета по названию, подсчет по предметам
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notes_subject_grade_title
+            ON notes (subject_id, grade, title, id)
+        ''')
+        # Проверка существования конспекта по названию
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_title ON notes (title)')
+        # Пользовательские конспекты, новые сверху
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_notes_created
+            ON user_notes (created_at, id)
+        ''')
+    
+    def migrate_app_meta(self, cursor):
+        """Миграция 4: служебные значения приложения (ключ - значение)"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS app_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+    
+    def migrate_image_blobs(self, cursor):
+        """Миграция 5: таблица images как хранилище изображений по хэшу содержимого"""
+        cursor.execute('ALTER TABLE images ADD COLUMN digest TEXT')
+        cursor.execute('ALTER TABLE images ADD COLUMN extension TEXT')
+        cursor.execute('ALTER TABLE images ADD COLUMN size INTEGER')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_images_digest ON images(digest)')
+    
+    def migrate_change_tracking(self, cursor):
+        """Миграция 6: время и номер последнего изменения пользовательских конспектов"""
+        cursor.execute('ALTER TABLE user_notes ADD COLUMN updated_at TIMESTAMP')
+        cursor.execute('ALTER TABLE user_notes ADD COLUMN revision INTEGER NOT NULL DEFAULT 1')
+        cursor.execute('UPDATE user_notes SET updated_at = created_at')
+    
+    def migrate_statistics(self, cursor):
+        """Миграция 7: счетчики конспектов по предметам, обновляемые триггерами"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subject_stats (
+                subject TEXT PRIMARY KEY,
+                default_notes INTEGER NOT NULL DEFAULT 0,
+                user_notes INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
         
-        # Кнопки
-        button_layout = QHBoxLayout()
+        # Готовые конспекты считаются только для 1 класса, как и раньше
+        subject_name = "COALESCE((SELECT name FROM subjects WHERE id = {}.subject_id), '')"
+        triggers = [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS notes_stats_ai AFTER INSERT ON notes BEGIN
+                INSERT INTO subject_stats (subject, default_notes)
+                SELECT {subject_name.format('new')}, 1 WHERE new.grade = 1
+                ON CONFLICT (subject) DO UPDATE SET default_notes = default_notes + 1;
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS notes_stats_ad AFTER DELETE ON notes WHEN old.grade = 1 BEGIN
+                UPDATE subject_stats SET default_notes = default_notes - 1
+                WHERE subject = {subject_name.format('old')};
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS notes_stats_au AFTER UPDATE OF subject_id, grade ON notes BEGIN
+                UPDATE subject_stats SET default_notes = default_notes - 1
+                WHERE old.grade = 1 AND subject = {subject_name.format('old')};
+                INSERT INTO subject_stats (subject, default_notes)
+                SELECT {subject_name.format('new')}, 1 WHERE new.grade = 1
+                ON CONFLICT (subject) DO UPDATE SET default_notes = default_notes + 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS user_notes_stats_ai AFTER INSERT ON user_notes BEGIN
+                INSERT INTO subject_stats (subject, user_notes) VALUES (COALESCE(new.subject, ''), 1)
+                ON CONFLICT (subject) DO UPDATE SET user_notes = user_notes + 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS user_notes_stats_ad AFTER DELETE ON user_notes BEGIN
+                UPDATE subject_stats SET user_notes = user_notes - 1
+                WHERE subject = COALESCE(old.subject, '');
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS user_notes_stats_au AFTER UPDATE OF subject ON user_notes BEGIN
+                UPDATE subject_stats SET user_notes = user_notes - 1
+                WHERE subject = COALESCE(old.subject, '');
+                INSERT INTO subject_stats (subject, user_notes) VALUES (COALESCE(new.subject, ''), 1)
+                ON CONFLICT (subject) DO UPDATE SET user_notes = user_notes + 1;
+            END
+            ''',
+        ]
+        for trigger in triggers:
+            cursor.execute(trigger)
         
-        print_btn = QPushButton("🖨️ Печать")
-        print_btn.clicked.connect(self.print_note)
+        self.fill_statistics(cursor)
+    
+    def migrate_rendered_notes(self, cursor):
+        """Миграция 8: сохраненный HTML длинных конспектов"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rendered_notes (
+                kind TEXT NOT NULL,
+                note_id INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                html TEXT NOT NULL,
+                PRIMARY KEY (kind, note_id)
+            )
+        ''')
+        # Вместе с конспектом удаляется и его HTML
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS notes_rendered_ad AFTER DELETE ON notes BEGIN
+                DELETE FROM rendered_notes WHERE kind = 'note' AND note_id = old.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS user_notes_rendered_ad AFTER DELETE ON user_notes BEGIN
+                DELETE FROM rendered_notes WHERE kind = 'user' AND note_id = old.id;
+            END
+        ''')
+    
+    # Миграция с номером i переводит базу с версии i - 1 на версию i
+    MIGRATIONS = [
+        migrate_base_schema,
+        migrate_search_index,
+        migrate_indexes,
+        migrate_app_meta,
+        migrate_image_blobs,
+        migrate_change_tracking,
+        migrate_statistics,
+        migrate_rendered_notes,
+    ]
+    
+    def hot_queries(self):
+        """Частые запросы приложения с примерными параметрами"""
+        return {
+            'notes_page': self.notes_page_query(None, ('', '', 0), PAGE_SIZE),
+            'subject_notes_page': self.notes_page_query(1, ('', '', 0), PAGE_SIZE),
+            'user_notes_page': self.user_notes_page_query(('', 0), PAGE_SIZE),
+            'get_note': (self.GET_NOTE_SQL, (1,)),
+            'get_user_note': (self.GET_USER_NOTE_SQL, (1,)),
+            'default_note_exists': ('SELECT 1 FROM notes WHERE title = ?', ('',)),
+            'statistics': (self.STATISTICS_SQL, ()),
+            'rendered_note': (self.GET_RENDERED_SQL, ('user', 1)),
+        }
+    
+    def check_query_plans(self):
+        """Возвращает шаги EXPLAIN QUERY PLAN, где частый запрос
+        просматривает таблицу целиком или сортирует во временном B-дереве
+        """
+        problems = []
+        cursor = self.conn.cursor()
         
-        export_btn = QPushButton("💾 Сохранить")
-        export_btn.clicked.connect(self.export_note)
+        for name, (sql, params) in self.hot_queries().items():
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            for row in cursor.fetchall():
+                detail = row[3]
+                # Таблицы предметов и счетчиков крошечные, их полный просмотр допустим
+                scanned = detail.split()[1] if detail.startswith('SCAN ') else None
+                if scanned not in (None, 's', 'subjects', 'subject_stats') or 'TEMP B-TREE' in detail:
+                    problems.append((name, detail))
         
-        close_btn = QPushButton("✕ Закрыть")
-        close_btn.clicked.connect(self.accept)
-        close_btn.setStyleSheet('background-color: #e74c3c; color: white; font-weight: bold;')
+        return problems
+    
+    @staticmethod
+    def fts_query(keyword):
+        """Превращает строку поиска в префиксный запрос FTS5"""
+        return ' '.join(f'"{word}"*' for word in search_words(keyword))
+    
+    def insert_default_data(self):
+        """Заполняет предметы и готовые конспекты, если они изменились.
         
-        button_layout.addWidget(print_btn)
-        button_layout.addWidget(export_btn)
-        button_layout.addStretch()
-        button_layout.addWidget(close_btn)
+        Хэш встроенных данных хранится в app_meta, поэтому при обычном
+        запуске нужен один запрос, а заполнение выполняется одной транзакцией
+        только при первом запуске или после обновления приложения.
+        """
+        if self.get_meta('default_data_hash') == DEFAULT_DATA_HASH:
+            return
         
-        layout.addLayout(button_layout)
-        self.setLayout(layout)
+        with self.pool.write() as conn:
+            # Добавляем предметы с цветами
+            conn.executemany('INSERT OR IGNORE INTO subjects (name, color) VALUES (?, ?)', DEFAULT_SUBJECTS)
+            
+            # Примерные конспекты для 1 класса, кроме уже существующих
+            now = datetime.now()
+            conn.executemany('''
+                INSERT INTO notes (subject_id, title, content, grade, created_at)
+                SELECT ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM notes WHERE title = ?)
+            ''', [(subject_id, title, content, grade, now, title)
+                  for subject_id, title, content, grade in DEFAULT_NOTES])
+            
+            conn.execute('''
+                INSERT OR REPLACE INTO app_meta (key, value) VALUES ('default_data_hash', ?)
+            ''', (DEFAULT_DATA_HASH,))
     
-    def format_content(self, content):
-        """Форматирует текст для отображения в HTML"""
-        # Преобразуем маркеры списка
-        lines = content.split('\n')
-        html_lines = []
-        
-        for line in lines:
-            if line.strip().startswith('•'):
-                html_lines.append(f'<li>{line.strip()[1:].strip()}</li>')
-            elif line.strip().startswith('📌') or line.strip().startswith('🎵') or line.strip().startswith('❗'):
-                html_lines.append(f'<p style="font-weight: bold; color: #2c3e50; margin-top: 10px;">{line}</p>')
-            elif line.strip().startswith('🔢') or line.strip().startswith('🎯'):
-                html_lines.append(f'<p style="color: #3498db; margin-left: 20px;">{line}</p>')
-            elif line.strip().startswith('📅') or line.strip().startswith('📝'):
-                html_lines.append(f'<p style="background-color: #f8f9fa; padding: 8px; border-radius: 5px;">{line}</p>')
-            elif line.strip():
-                html_lines.append(f'<p>{line}</p>')
-            else:
-                html_lines.append('<br>')
+    def get_meta(self, key, default=None):
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT value FROM app_meta WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else default
+    
+    def set_meta(self, key, value):
+        with self.pool.write() as conn:
+            conn.execute('INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)', (key, value))
+    
+    def get_subjects(self):
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT * FROM subjects ORDER BY id')
+        return cursor.fetchall()
+    
+    def search_notes(self, keyword, limit=SEARCH_LIMIT, with_text=False):
+        """Краткие строки готовых конспектов, найденных по запросу, по релевантности.
         
-        html_content = ''.join(html_lines)
-        return f'''
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6;">
-            {html_content}
-        </body>
-        </html>
-        '''
+        С with_text=True возвращает пары (строка, заголовок и текст конспекта).
+        """
+        query = self.fts_query(keyword)
+        if not query:
+            return []
+        
+        cursor = self.pool.reader().cursor()
+        bound = self.rank_bound(cursor, '''
+            SELECT notes_fts.rowid FROM notes_fts
+            JOIN notes ON notes.id = notes_fts.rowid
+            WHERE notes_fts MATCH ? AND notes.grade = 1
+            ORDER BY notes_fts.rowid
+            LIMIT 1 OFFSET ?
+        ''', query)
+        cursor.execute(f'''
+            SELECT 'note', n.id, n.title, s.name, s.color, hits.preview
+                   {", n.title || ' ' || n.content" if with_text else ''}
+            FROM (
+                -- Класс отбирается до LIMIT, иначе конспекты других классов
+                -- занимали бы места в выдаче
+                SELECT notes_fts.rowid, notes_fts.rank,
+                       snippet(notes_fts, 1, '', '', '…', 24) AS preview
+                FROM notes_fts
+                JOIN notes ON notes.id = notes_fts.rowid
+                WHERE notes_fts MATCH ? AND notes.grade = 1 AND notes_fts.rowid <= ?
+                ORDER BY notes_fts.rank
+                LIMIT ?
+            ) AS hits
+            JOIN notes n ON n.id = hits.rowid
+            JOIN subjects s ON n.subject_id = s.id 
+            ORDER BY hits.rank
+        ''', (query, bound, limit))
+        return self.search_rows(cursor.fetchall(), with_text)
     
-    def load_current_image(self):
-        if self.images and self.current_image_index < len(self.images):
-            image_path = self.images[self.current_image_index]
-            try:
-                if os.path.exists(image_path):
-                    pixmap = QPixmap(image_path)
-                    if not pixmap.isNull():
-                        # Масштабируем изображение
-                        scaled_pixmap = pixmap.scaled(600, 400, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                        self.image_label.setPixmap(scaled_pixmap)
-                        
-                        # Обновляем счетчик
-                        self.image_counter.setText(f"{self.current_image_index + 1} / {len(self.images)}")
-                        
-                        # Обновляем состояние кнопок
-                        self.prev_btn.setEnabled(self.current_image_index > 0)
-                        self.next_btn.setEnabled(self.current_image_index < len(self.images) - 1)
-            except Exception as e:
-                print(f"Ошибка загрузки изображения: {e}")
+    def search_user_notes(self, keyword, limit=SEARCH_LIMIT, with_text=False):
+        """Краткие строки пользовательских конспектов, найденных по запросу"""
+        query = self.fts_query(keyword)
+        if not query:
+            return []
+        
+        cursor = self.pool.reader().cursor()
+        bound = self.rank_bound(cursor, '''
+            SELECT rowid FROM user_notes_fts
+            WHERE user_notes_fts MATCH ?
+            ORDER BY rowid
+            LIMIT 1 OFFSET ?
+        ''', query)
+        cursor.execute(f'''
+            SELECT 'user', u.id, u.title, u.subject, s.color, hits.preview
+                   {", u.title || ' ' || u.content" if with_text else ''}
+            FROM (
+                SELECT rowid, rank, snippet(user_notes_fts, 1, '', '', '…', 24) AS preview
+                FROM user_notes_fts
+                WHERE user_notes_fts MATCH ? AND rowid <= ?
+                ORDER BY rank
+                LIMIT ?
+            ) AS hits
+            JOIN user_notes u ON u.id = hits.rowid
+            LEFT JOIN subjects s ON s.name = u.subject
+            ORDER BY hits.rank
+        ''', (query, bound, limit))
+        return self.search_rows(cursor.fetchall(), with_text)
     
-    def show_next_image(self):
-        if self.current_image_index < len(self.images) - 1:
-            self.current_image_index += 1
-            self.load_current_image()
+    @staticmethod
+    def rank_bound(cursor, sql, query, candidates=SEARCH_RANK_CANDIDATES):
+        """Наибольший rowid, до которого ранжируются совпадения запроса.
+        
+        Если совпадений больше candidates, релевантность считается только
+        для первых candidates по rowid, а совпадения в более новых записях
+        в выдачу не попадают. Иначе ранжируются все совпадения.
+        sql выбирает rowid совпадений по возрастанию с LIMIT 1 OFFSET ?.
+        """
+        cursor.execute(sql, (query, candidates - 1))
+        row = cursor.fetchone()
+        return row[0] if row else sys.maxsize
     
-    def show_prev_image(self):
-        if self.current_image_index > 0:
-            self.current_image_index -= 1
-            self.load_current_image()
+    @staticmethod
+    def search_rows(rows, with_text):
+        if with_text:
+            return [(summary_row(row[:6]), row[6]) for row in rows]
+        return [summary_row(row) for row in rows]
     
-    def print_note(self):
-        printer = QPrinter(QPrinter.HighResolution)
-        print_dialog = QPrintDialog(printer, self)
+    def notes_page_query(self, subject_id=None, after=None, limit=PAGE_SIZE):
+        conditions = ['n.grade = 1']
+        params = []
         
-        if print_dialog.exec_() == QPrintDialog.Accepted:
-            # Создаем документ для печати
-            document = QTextDocument()
-            html = f'''
-            <h1>{self.note_data['title']}</h1>
-            <h3>Предмет: {self.note_data.get('subject', '')} | 1 класс</h3>
-            <hr>
-            <div style="white-space: pre-wrap;">{self.note_data['content']}</div>
-            '''
-            document.setHtml(html)
-            document.print_(printer)
-    
-    def export_note(self):
-        file_path, _ = QFileDialog.getSaveFileName(
-            self,
-            "Сохранить конспект",
-            f"{self.note_data['title']}.txt",
-            "Текстовые файлы (*.txt);;Все файлы (*)"
-        )
+        if subject_id is not None:
+            conditions.append('n.subject_id = ?')
+            params.append(subject_id)
         
-        if file_path:
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(f"Конспект: {self.note_data['title']}\n")
-                    f.write(f"Предмет: {self.note_data.get('subject', '')}\n")
-                    f.write(f"Класс: 1\n")
-                    f.write("=" * 50 + "\n\n")
-                    f.write(self.note_data['content'])
-                
-                QMessageBox.information(self, "Успех", f"Конспект сохранен в файл:\n{file_path}")
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл:\n{str(e)}")
-
-
-# ============================================
-# РЕДАКТОР КОНСПЕКТОВ
-# ============================================
-class NoteEditor(QDialog):
-    def __init__(self, parent=None, note_data=None, mode='create'):
-        super().__init__(parent)
-        self.note_data = note_data or {}
-        self.mode = mode
-        self.images = self.note_data.get('images', [])
-        self.initUI()
+        if after is not None:
+            conditions.append('(s.name, n.title, n.id) > (?, ?, ?)')
+            params.extend(after)
         
-        if mode == 'edit' and note_data:
-            self.load_existing_data()
+        # s.id в сортировке позволяет идти по индексам без временной сортировки
+        sql = f'''
+            SELECT 'note', n.id, n.title, s.name, s.color, substr(n.content, 1, {PREVIEW_LENGTH})
+            FROM notes n 
+            JOIN subjects s ON n.subject_id = s.id 
+            WHERE {' AND '.join(conditions)}
+            ORDER BY s.name, s.id, n.title, n.id
+            LIMIT ?
+        '''
+        return sql, params + [limit]
     
-    def initUI(self):
-        self.setWindowTitle("Редактор конспекта" if self.mode == 'edit' else "Создать конспект")
-        self.setMinimumSize(700, 600)
+    def get_notes_page(self, subject_id=None, after=None, limit=PAGE_SIZE):
+        """Страница кратких строк готовых конспектов.
         
-        main_layout = QVBoxLayout()
+        Курсор after - (предмет, заголовок, id) последней строки предыдущей
+        страницы. Возвращает (строки, курсор следующей страницы или None).
+        """
+        cursor = self.pool.reader().cursor()
+        cursor.execute(*self.notes_page_query(subject_id, after, limit))
+        rows = [summary_row(row) for row in cursor.fetchall()]
+        
+        if len(rows) < limit:
+            return rows, None
+        last = rows[-1]
+        return rows, (last[3], last[2], last[1])
+    
+    def user_notes_page_query(self, after=None, limit=PAGE_SIZE):
+        condition = ''
+        params = []
+        
+        if after is not None:
+            condition = 'WHERE (u.created_at, u.id) < (?, ?)'
+            params.extend(after)
+        
+        sql = f'''
+            SELECT 'user', u.id, u.title, u.subject, s.color,
+                   substr(u.content, 1, {PREVIEW_LENGTH}), u.created_at
+            FROM user_notes u
+            LEFT JOIN subjects s ON s.name = u.subject
+            {condition}
+            ORDER BY u.created_at DESC, u.id DESC
+            LIMIT ?
+        '''
+        return sql, params + [limit]
+    
+    def get_user_notes_page(self, after=None, limit=PAGE_SIZE):
+        """Страница кратких строк пользовательских конспектов, новые сверху.
         
-        # Заголовок редактора
-        title_label = QLabel("📝 Редактор конспекта")
-        title_label.setStyleSheet('''
-            font-size: 18px;
-            font-weight: bold;
-            color: #2c3e50;
-            padding: 10px;
-            border-bottom: 2px solid #3498db;
-        ''')
-        main_layout.addWidget(title_label)
+        Курсор after - (created_at, id) последней строки предыдущей страницы.
+        """
+        cursor = self.pool.reader().cursor()
+        cursor.execute(*self.user_notes_page_query(after, limit))
+        fetched = cursor.fetchall()
+        rows = [summary_row(row[:6]) for row in fetched]
+        
+        if len(rows) < limit:
+            return rows, None
+        return rows, (fetched[-1][6], fetched[-1][1])
+    
+    def iter_pages(self, fetch_page, page_size=PAGE_SIZE):
+        """Генератор строк, запрашивающий следующую страницу по мере чтения"""
+        after = None
+        while True:
+            rows, after = fetch_page(after=after, limit=page_size)
+            yield from rows
+            if after is None:
+                break
+    
+    def iter_notes(self, subject_id=None, page_size=PAGE_SIZE):
+        return self.iter_pages(
+            lambda after, limit: self.get_notes_page(subject_id, after, limit), page_size
+        )
+    
+    def iter_user_notes(self, page_size=PAGE_SIZE):
+        return self.iter_pages(self.get_user_notes_page, page_size)
+    
+    GET_NOTE_SQL = '''
+        SELECT n.*, s.name as subject_name, s.color
+        FROM notes n 
+        JOIN subjects s ON n.subject_id = s.id 
+        WHERE n.id = ?
+    '''
+    
+    GET_USER_NOTE_SQL = 'SELECT * FROM user_notes WHERE id = ?'
+    
+    def get_note(self, note_id):
+        """Полная строка готового конспекта вместе с предметом"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute(self.GET_NOTE_SQL, (note_id,))
+        return cursor.fetchone()
+    
+    def get_user_note(self, note_id):
+        cursor = self.pool.reader().cursor()
+        cursor.execute(self.GET_USER_NOTE_SQL, (note_id,))
+        return cursor.fetchone()
+    
+    GET_RENDERED_SQL = 'SELECT digest, html FROM rendered_notes WHERE kind = ? AND note_id = ?'
+    
+    def get_rendered(self, kind, note_id):
+        """Сохраненный HTML конспекта: (digest, html) или None"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute(self.GET_RENDERED_SQL, (kind, note_id))
+        return cursor.fetchone()
+    
+    def set_rendered(self, kind, note_id, digest, html):
+        with self.pool.write() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO rendered_notes (kind, note_id, digest, html)
+                VALUES (?, ?, ?, ?)
+            ''', (kind, note_id, digest, html))
+    
+    def add_user_note(self, subject, title, content, images, grade=1):
+        with self.pool.write() as conn:
+            now = datetime.now()
+            cursor = conn.execute('''
+                INSERT INTO user_notes (subject, title, content, images, grade, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (subject, title, content, json.dumps(images), grade, now, now))
+        return cursor.lastrowid
+    
+    def add_notes(self, rows):
+        """Добавляет готовые конспекты (предмет, заголовок, текст, класс) одной транзакцией"""
+        now = datetime.now()
+        with self.pool.write() as conn:
+            conn.executemany('''
+                INSERT INTO notes (subject_id, title, content, grade, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ((subject_id, title, content, grade, now) for subject_id, title, content, grade in rows))
+    
+    def add_user_notes(self, rows, grade=1):
+        """Добавляет конспекты (предмет, заголовок, текст, изображения) одной транзакцией.
         
-        # Форма
-        form_layout = QFormLayout()
-        form_layout.setLabelAlignment(Qt.AlignRight)
+        rows может быть генератором: строки читаются по мере вставки, пока
+        удерживается блокировка записи, поэтому медленные источники лучше
+        заранее собрать в список.
+        Возвращает число добавленных конспектов.
+        """
+        now = datetime.now()
+        count = 0
+        
+        def values():
+            nonlocal count
+            for subject, title, content, images in rows:
+                count += 1
+                yield subject, title, content, json.dumps(images), grade, now, now
+        
+        with self.pool.write() as conn:
+            conn.executemany('''
+                INSERT INTO user_notes (subject, title, content, images, grade, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', values())
+        return count
+    
+    def count_user_notes(self):
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT COUNT(*) FROM user_notes')
+        return cursor.fetchone()[0]
+    
+    def iter_rows(self, sql, params=(), batch_size=PAGE_SIZE):
+        """Генератор строк запроса, читаемых из курсора порциями"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    
+    def iter_user_note_rows(self, batch_size=PAGE_SIZE):
+        """Полные строки пользовательских конспектов по возрастанию id, читаемые порциями"""
+        return self.iter_rows('SELECT * FROM user_notes ORDER BY id', batch_size=batch_size)
+    
+    def import_archive_batch(self, subjects, notes, user_notes, checkpoint):
+        """Записывает порцию архива и отметку о прогрессе загрузки одной транзакцией.
         
-        # Предмет
-        self.subject_combo = QComboBox()
-        self.subject_combo.addItems([
-            "Математика", "Русский язык", "Чтение", 
-            "Письмо", "Окружающий мир", "Технология",
-            "Физкультура", "Музыка"
-        ])
-        form_layout.addRow("Предмет:", self.subject_combo)
+        Конспекты, которые уже есть в базе, пропускаются: готовые узнаются по
+        названию, пользовательские - по названию, предмету и времени создания,
+        поэтому повторная загрузка того же архива не создает копий. Возвращает
+        число добавленных готовых и пользовательских конспектов.
+        """
+        with self.pool.write() as conn:
+            conn.executemany('INSERT OR IGNORE INTO subjects (name, color) VALUES (?, ?)', subjects)
+            added_notes = conn.executemany('''
+                INSERT INTO notes (subject_id, title, content, grade, created_at)
+                SELECT s.id, ?, ?, ?, ? FROM subjects s
+                WHERE s.name = ? AND NOT EXISTS (SELECT 1 FROM notes WHERE title = ?)
+            ''', [(title, content, grade, created_at, subject, title)
+                  for subject, title, content, grade, created_at in notes]).rowcount
+            added_user_notes = conn.executemany('''
+                INSERT INTO user_notes (subject, title, content, images, grade,
+                                        created_at, updated_at, revision)
+                SELECT ?, ?, ?, ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM user_notes
+                                  WHERE created_at IS ? AND title = ? AND subject = ?)
+            ''', [(subject, title, content, json.dumps(images), grade, created_at, updated_at, revision,
+                   created_at, title, subject)
+                  for subject, title, content, images, grade, created_at, updated_at, revision in user_notes]
+            ).rowcount
+            conn.execute(
+                "INSERT OR REPLACE INTO app_meta (key, value) VALUES ('archive_import', ?)", (checkpoint,)
+            )
+        return added_notes, added_user_notes
+    
+    def image_references(self):
+        """Число ссылок из пользовательских конспектов на каждый файл изображения"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute('''
+            SELECT j.value, COUNT(*)
+            FROM user_notes u, json_each(u.images) j
+            WHERE json_valid(u.images)
+            GROUP BY j.value
+        ''')
+        return dict(cursor.fetchall())
+    
+    def get_user_note_images(self):
+        """Пары (id, список изображений) всех пользовательских конспектов с изображениями"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute('''
+            SELECT id, images FROM user_notes
+            WHERE json_valid(images) AND json_array_length(images) > 0
+        ''')
+        return [(note_id, json.loads(images)) for note_id, images in cursor.fetchall()]
+    
+    def set_user_note_images(self, updates, meta=None):
+        """Заменяет списки изображений конспектов одной транзакцией.
         
-        # Заголовок
-        self.title_edit = QLineEdit()
-        self.title_edit.setPlaceholderText("Введите название конспекта")
-        form_layout.addRow("Заголовок:", self.title_edit)
+        updates - пары (id, список изображений); meta - необязательные
+        пары (ключ, значение) для app_meta, записываемые в той же транзакции.
+        """
+        with self.pool.write() as conn:
+            # Ссылки меняются, но содержимое изображений то же, поэтому
+            # ревизия конспекта не увеличивается
+            conn.executemany(
+                'UPDATE user_notes SET images = ? WHERE id = ?',
+                [(json.dumps(images), note_id) for note_id, images in updates]
+            )
+            if meta:
+                conn.executemany('INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)', meta)
+    
+    def put_image_blob(self, digest, extension, source, chunk_size=1024 * 1024):
+        """Записывает файл в таблицу images по частям, если такого содержимого еще нет"""
+        size = os.path.getsize(source)
+        with self.pool.write() as conn:
+            cursor = conn.execute('SELECT id FROM images WHERE digest = ?', (digest,))
+            if cursor.fetchone():
+                return
+            
+            # Место под BLOB выделяется заранее, затем заполняется без
+            # загрузки файла в память целиком
+            cursor = conn.execute('''
+                INSERT INTO images (digest, extension, size, image_data)
+                VALUES (?, ?, ?, zeroblob(?))
+            ''', (digest, extension, size, size))
+            with conn.blobopen('images', 'image_data', cursor.lastrowid) as blob, open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    blob.write(chunk)
+    
+    def read_image_blob(self, digest, target, chunk_size=1024 * 1024):
+        """Копирует изображение из таблицы images в файл target по частям.
         
-        # Контент
-        self.content_edit = QTextEdit()
-        self.content_edit.setPlaceholderText("Введите текст конспекта...\n\nИспользуйте:\n• для списков\n📌 для важных пунктов\n🎯 для правил")
-        self.content_edit.setMinimumHeight(200)
+        Возвращает False, если такого изображения в базе нет.
+        """
+        conn = self.pool.reader()
+        row = conn.execute('SELECT id FROM images WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            return False
+        
+        with conn.blobopen('images', 'image_data', row[0], readonly=True) as blob, open(target, 'wb') as f:
+            for chunk in iter(lambda: blob.read(chunk_size), b''):
+                f.write(chunk)
+        return True
+    
+    def has_image_blob(self, digest):
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT 1 FROM images WHERE digest = ?', (digest,))
+        return cursor.fetchone() is not None
+    
+    def get_image_blobs(self):
+        """Пары (id, digest || extension) изображений, хранящихся в базе"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute('SELECT id, digest || extension FROM images WHERE digest IS NOT NULL')
+        return cursor.fetchall()
+    
+    def delete_image_blobs(self, image_ids):
+        with self.pool.write() as conn:
+            conn.executemany('DELETE FROM images WHERE id = ?', [(image_id,) for image_id in image_ids])
+    
+    def delete_user_note(self, note_id):
+        with self.pool.write() as conn:
+            conn.execute('DELETE FROM user_notes WHERE id = ?', (note_id,))
+    
+    def update_user_note(self, note_id, subject, title, content, images):
+        with self.pool.write() as conn:
+            conn.execute('''
+                UPDATE user_notes 
+                SET subject = ?, title = ?, content = ?, images = ?,
+                    updated_at = ?, revision = revision + 1
+                WHERE id = ?
+            ''', (subject, title, content, json.dumps(images), datetime.now(), note_id))
+    
+    STATISTICS_SQL = 'SELECT subject, default_notes, user_notes FROM subject_stats ORDER BY subject'
+    
+    def get_statistics(self):
+        """Число конспектов всего и по предметам из счетчиков subject_stats"""
+        cursor = self.pool.reader().cursor()
+        cursor.execute(self.STATISTICS_SQL)
+        rows = cursor.fetchall()
         
-        # Панель форматирования
-        format_toolbar = QToolBar()
+        return {
+            'default_notes': sum(row[1] for row in rows),
+            'user_notes': sum(row[2] for row in rows),
+            'by_subject': [row for row in rows if row[1] or row[2]]
+        }
+    
+    def rebuild_statistics(self):
+        """Пересчитывает счетчики subject_stats по таблицам конспектов"""
+        with self.pool.write() as conn:
+            self.fill_statistics(conn.cursor())
+    
+    @staticmethod
+    def fill_statistics(cursor):
+        cursor.execute('DELETE FROM subject_stats')
+        cursor.execute('''
+            INSERT INTO subject_stats (subject, default_notes, user_notes)
+            SELECT subject, SUM(default_notes), SUM(user_notes) FROM (
+                SELECT COALESCE(s.name, '') AS subject, COUNT(*) AS default_notes, 0 AS user_notes
+                FROM notes n LEFT JOIN subjects s ON s.id = n.subject_id
+                WHERE n.grade = 1
+                GROUP BY n.subject_id
+                UNION ALL
+                SELECT COALESCE(subject, ''), 0, COUNT(*)
+                FROM user_notes
+                GROUP BY subject
+            )
+            GROUP BY subject
+        ''')
+    
+    def close(self):
+        self.pool.close()
+
+
+# ============================================
+# КЭШ РЕЗУЛЬТАТОВ ПОИСКА
+# ============================================
+class SearchCache:
+    """LRU-кэш результатов поиска по нормализованному запросу.
+    
+    Записи устаревают, когда меняется db.data_version. Если новый запрос
+    продолжает предыдущий («зим» -> «зима»), результат получается
+    фильтрацией прежнего без обращения к SQLite.
+    """
+    def __init__(self, db, size=SEARCH_CACHE_SIZE):
+        self.db = db
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(keyword):
+        return ' '.join(search_words(keyword))
+    
+    def lookup(self, keyword):
+        """Результат из кэша или уточнение прежнего; None - нужен запрос к базе"""
+        query = self.normalize(keyword)
+        if not query:
+            return [], []
+        
+        with self.lock:
+            version = self.db.data_version
+            entry = self.entries.get(query)
+            if entry is not None and entry['version'] == version:
+                self.entries.move_to_end(query)
+                return self.result(entry)
+            
+            # Ищем самый длинный свежий запрос, который продолжает новый
+            base = None
+            for cached_query, cached in self.entries.items():
+                if (cached['version'] == version and cached['complete']
+                        and query.startswith(cached_query)
+                        and (base is None or len(cached_query) > len(base[0]))):
+                    base = (cached_query, cached)
+        
+        if base is None:
+            return None
+        
+        words = query.split()
+        entry = {
+            'version': base[1]['version'],
+            'complete': True,
+            'hits': [hit for hit in base[1]['hits'] if self.matches(hit[1], words)],
+            'user_hits': [hit for hit in base[1]['user_hits'] if self.matches(hit[1], words)],
+        }
+        self.store(query, entry)
+        return self.result(entry)
+    
+    def search(self, keyword):
+        """Выполняет поиск в базе и запоминает результат (вызывается в фоне)"""
+        query = self.normalize(keyword)
+        version = self.db.data_version
+        
+        # Лишняя строка сверх SEARCH_LIMIT показывает, что выдача обрезана:
+        # такой результат нельзя уточнять фильтрацией
+        hits = [(row, set(search_words(text)))
+                for row, text in self.db.search_notes(keyword, SEARCH_LIMIT + 1, with_text=True)]
+        user_hits = [(row, set(search_words(text)))
+                     for row, text in self.db.search_user_notes(keyword, SEARCH_LIMIT + 1, with_text=True)]
+        
+        entry = {
+            'version': version,
+            'complete': len(hits) <= SEARCH_LIMIT and len(user_hits) <= SEARCH_LIMIT,
+            'hits': hits[:SEARCH_LIMIT],
+            'user_hits': user_hits[:SEARCH_LIMIT],
+        }
+        self.store(query, entry)
+        return self.result(entry)
+    
+    def store(self, query, entry):
+        with self.lock:
+            self.entries[query] = entry
+            self.entries.move_to_end(query)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+    
+    @staticmethod
+    def matches(words, query_words):
+        # Каждое слово запроса - префикс какого-то слова конспекта, как в FTS
+        return all(any(word.startswith(query_word) for word in words) for query_word in query_words)
+    
+    @staticmethod
+    def result(entry):
+        return ([row for row, words in entry['hits']],
+                [row for row, words in entry['user_hits']])
+
+
+# ============================================
+# ФОРМАТИРОВАНИЕ КОНСПЕКТОВ
+# ============================================
+# Класс строки по ее первому символу; цвета задает тема (NOTE_STYLESHEET)
+NOTE_LINE_CLASSES = {
+    '📌': ' class="heading"',
+    '🎵': ' class="heading"',
+    '❗': ' class="heading"',
+    '🔢': ' class="step"',
+    '🎯': ' class="step"',
+    '📅': ' class="box"',
+    '📝': ' class="box"',
+}
+
+# Меняется вместе с разметкой, чтобы сохраненный HTML не устаревал
+RENDER_VERSION = 2
+
+
+def render_note_body(content):
+    """HTML текста конспекта: один проход по строкам, текст экранируется"""
+    parts = []
+    append = parts.append
+    classes = NOTE_LINE_CLASSES
+    for line in content.split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            append('<br>')
+        elif stripped[0] == '•':
+            append(f'<li>{escape(stripped[1:].strip(), quote=False)}</li>')
+        else:
+            append(f'<p{classes.get(stripped[0], "")}>{escape(line, quote=False)}</p>')
+    return ''.join(parts)
+
+
+def note_document(body):
+    return f'''
+        <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6;">
+            {body}
+        </body>
+        </html>
+        '''
+
+
+def content_digest(content):
+    data = f'{RENDER_VERSION}\n{content}'.encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class RenderCache:
+    """Готовый HTML конспектов по (вид, id) и хэшу текста.
+    
+    В памяти держится LRU последних конспектов; HTML длинных конспектов
+    сохраняется в таблице rendered_notes и переживает перезапуск.
+    Измененный текст дает другой хэш, поэтому запись просто перестает совпадать.
+    """
+    def __init__(self, db=None, size=RENDER_CACHE_SIZE, persist_length=RENDER_PERSIST_LENGTH):
+        self.db = db
+        self.size = size
+        self.persist_length = persist_length
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def render(self, kind, note_id, content):
+        """HTML текста конспекта (можно вызывать из фонового потока)"""
+        key = (kind, note_id)
+        digest = content_digest(content)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == digest:
+                self.entries.move_to_end(key)
+                return entry[1]
+        
+        persist = (self.db is not None and self.persist_length is not None
+                   and len(content) >= self.persist_length)
+        stored = self.db.get_rendered(kind, note_id) if persist else None
+        if stored is not None and stored[0] == digest:
+            body = stored[1]
+        else:
+            body = render_note_body(content)
+            if persist:
+                self.db.set_rendered(kind, note_id, digest, body)
+        
+        with self.lock:
+            self.entries[key] = (digest, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return body
+
+
+# ============================================
+# АСИНХРОННЫЙ ДОСТУП К БАЗЕ ДАННЫХ
+# ============================================
+class DbTask(QRunnable):
+    """Вызов метода Database в пуле потоков"""
+    def __init__(self, task_id, func, args, kwargs, receiver):
+        super().__init__()
+        # Объектом владеет AsyncDatabase, а не QThreadPool
+        self.setAutoDelete(False)
+        self.task_id = task_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.receiver = receiver
+        self.cancelled = False
+        self.connection = None
+        self.lock = threading.Lock()
+    
+    def cancel(self):
+        """Отменяет задачу и прерывает ее запрос, если он уже выполняется"""
+        with self.lock:
+            self.cancelled = True
+            if self.connection is not None:
+                self.connection.interrupt()
+    
+    def run(self):
+        with self.lock:
+            if self.cancelled:
+                return
+            # Запросы задачи идут через читающее соединение этого потока
+            self.connection = self.receiver.db.pool.reader()
+        
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.receiver.failed.emit(self.task_id, e)
+        else:
+            self.receiver.finished.emit(self.task_id, result)
+        finally:
+            with self.lock:
+                self.connection = None
+
+
+class AsyncDatabase(QObject):
+    """Выполняет запросы к базе в фоне и возвращает результат в поток интерфейса.
+    
+    submit() ставит вызов в очередь QThreadPool и возвращает задачу,
+    которую можно отменить. Если у задачи есть ключ, новая задача с тем же
+    ключом отменяет предыдущую: ее результат отбрасывается, а не ждет очереди.
+    """
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+    error = pyqtSignal(str)
+    
+    def __init__(self, db, parent=None, max_threads=4):
+        super().__init__(parent)
+        self.db = db
+        self.thread_pool = db_thread_pool(self, max_threads)
+        self.tasks = {}
+        self.keys = {}
+        self.next_id = 1
+        
+        # Сигналы из рабочих потоков доставляются в поток этого объекта
+        self.finished.connect(self.on_finished)
+        self.failed.connect(self.on_failed)
+    
+    def submit(self, func, *args, callback=None, errback=None, key=None, **kwargs):
+        if key is not None and key in self.keys:
+            self.cancel(self.keys[key])
+        
+        task_id = self.next_id
+        self.next_id += 1
+        
+        task = DbTask(task_id, func, args, kwargs, self)
+        self.tasks[task_id] = (task, callback, errback, key)
+        if key is not None:
+            self.keys[key] = task_id
+        
+        self.thread_pool.start(task)
+        return task
+    
+    def cancel(self, task_id):
+        """Отменяет задачу: убирает из очереди или отбрасывает ее результат"""
+        entry = self.tasks.pop(task_id, None)
+        if entry is None:
+            return
+        
+        task, callback, errback, key = entry
+        task.cancel()
+        self.thread_pool.tryTake(task)
+        if key is not None and self.keys.get(key) == task_id:
+            del self.keys[key]
+    
+    def cancel_key(self, key):
+        if key in self.keys:
+            self.cancel(self.keys[key])
+    
+    def take(self, task_id):
+        entry = self.tasks.pop(task_id, None)
+        if entry is not None and entry[3] is not None and self.keys.get(entry[3]) == task_id:
+            del self.keys[entry[3]]
+        return entry
+    
+    @pyqtSlot(int, object)
+    def on_finished(self, task_id, result):
+        entry = self.take(task_id)
+        if entry is not None and entry[1] is not None:
+            entry[1](result)
+    
+    @pyqtSlot(int, object)
+    def on_failed(self, task_id, exception):
+        entry = self.take(task_id)
+        if entry is None:
+            return
+        
+        if entry[2] is not None:
+            entry[2](exception)
+        else:
+            self.error.emit(str(exception))
+    
+    def shutdown(self):
+        """Отменяет задачи в очереди и ждет завершения выполняющихся"""
+        for task_id in list(self.tasks):
+            self.cancel(task_id)
+        self.thread_pool.waitForDone()
+
+
+# ============================================
+# ХРАНИЛИЩЕ ИЗОБРАЖЕНИЙ
+# ============================================
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 содержимого файла, прочитанного по частям"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def clone_file(source, target):
+    """Копия файла без дублирования данных на диске (reflink).
+    
+    Работает на файловых системах с copy-on-write (Btrfs, XFS, ZFS);
+    в остальных случаях выбрасывает OSError.
+    """
+    import fcntl
+    
+    FICLONE = 0x40049409
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+class ImageStore:
+    """Изображения пользовательских конспектов, адресуемые по содержимому.
+    
+    В режиме 'files' каждый файл лежит в user_images/blobs/<xx>/<sha256><расширение>,
+    в режиме 'database' - в таблице images, а в user_notes.images
+    записывается ссылка вида db:<sha256><расширение>. В обоих случаях
+    одинаковое содержимое хранится один раз, сколько бы конспектов на него
+    ни ссылалось. Ссылки считаются по полю user_notes.images; данные без
+    ссылок удаляет collect_garbage(), а convert() переносит изображения
+    между режимами.
+    
+    link_mode: 'copy' - потоковое копирование, 'reflink' - клонирование
+    на файловых системах с copy-on-write, 'hardlink' - жесткая ссылка на
+    исходный файл (изменение оригинала изменит и вложение).
+    """
+    DB_PREFIX = 'db:'
+    
+    def __init__(self, db=None, directory='user_images', link_mode=IMAGE_LINK_MODE):
+        self.db = db
+        self.directory = os.path.join(directory, 'blobs')
+        # Изображения из базы выгружаются сюда для просмотра и миниатюр
+        self.cache_directory = os.path.join(directory, 'cache')
+        # Временные файлы загрузки до того, как они попадут в хранилище
+        self.incoming_directory = os.path.join(directory, 'incoming')
+        self.link_mode = link_mode
+        self.storage = db.get_meta('image_storage', 'files') if db else 'files'
+        # Изображения, добавленные за этот сеанс: их еще может сохранять открытый редактор
+        self.recent = set()
+        self.lock = threading.Lock()
+    
+    def blob_path(self, digest, extension):
+        return os.path.join(self.directory, digest[:2], digest + extension.lower())
+    
+    def add(self, source):
+        """Добавляет файл в хранилище и возвращает ссылку на него"""
+        if self.storage == 'database':
+            return self.add_to_database(source)
+        return self.add_file(source)
+    
+    def add_file(self, source):
+        extension = os.path.splitext(source)[1]
+        
+        if self.link_mode == 'copy':
+            digest, temp_path = self.copy_hashing(source)
+        else:
+            digest, temp_path = file_digest(source), None
+        
+        target = self.blob_path(digest, extension)
+        with self.lock:
+            self.recent.add(os.path.normpath(target))
+        
+        if os.path.exists(target):
+            if temp_path:
+                os.remove(temp_path)
+            return target
+        
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if temp_path is None:
+            temp_path = f"{target}.{threading.get_ident()}.tmp"
+            try:
+                if self.link_mode == 'hardlink':
+                    os.link(source, temp_path)
+                else:
+                    clone_file(source, temp_path)
+            except (OSError, ImportError):
+                # Другой диск или файловая система без copy-on-write
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                digest, temp_path = self.copy_hashing(source)
+        
+        os.replace(temp_path, target)
+        return target
+    
+    def add_to_database(self, source):
+        extension = os.path.splitext(source)[1].lower()
+        digest = file_digest(source)
+        reference = self.DB_PREFIX + digest + extension
+        with self.lock:
+            self.recent.add(reference)
+        
+        self.db.put_image_blob(digest, extension, source)
+        return reference
+    
+    def copy_hashing(self, source, chunk_size=1024 * 1024):
+        """Копирует файл во временный и одновременно считает его хэш"""
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        temp_path = os.path.join(self.directory, f"upload.{threading.get_ident()}.tmp")
+        with open(source, 'rb') as src, open(temp_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(chunk_size), b''):
+                digest.update(chunk)
+                dst.write(chunk)
+        return digest.hexdigest(), temp_path
+    
+    def find(self, digest, extension):
+        """Ссылка на уже сохраненное изображение с таким хэшем или None"""
+        if self.db is not None and self.db.has_image_blob(digest):
+            return self.DB_PREFIX + digest + extension.lower()
+        path = self.blob_path(digest, extension)
+        if os.path.exists(path):
+            with self.lock:
+                self.recent.add(os.path.normpath(path))
+            return path
+        return None
+    
+    def path(self, reference):
+        """Путь к файлу изображения; изображения из базы сначала выгружаются в кэш"""
+        if not reference.startswith(self.DB_PREFIX):
+            return reference
+        
+        name = reference[len(self.DB_PREFIX):]
+        target = os.path.join(self.cache_directory, name[:2], name)
+        if not os.path.exists(target) and self.db is not None:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp_path = f"{target}.{threading.get_ident()}.tmp"
+            if self.db.read_image_blob(os.path.splitext(name)[0], temp_path):
+                os.replace(temp_path, target)
+        return target
+    
+    def prefetch(self, references):
+        """Выгружает изображения из базы заранее (вызывается в фоновом потоке)"""
+        for reference in references:
+            self.path(reference)
+    
+    def convert(self, storage):
+        """Переносит изображения всех конспектов в режим 'files' или 'database'.
+        
+        Ссылки в конспектах и режим хранилища меняются одной транзакцией,
+        после чего старые копии удаляет сборка мусора. Возвращает число
+        перенесенных изображений.
+        """
+        moved = {}
+        updates = []
+        for note_id, references in self.db.get_user_note_images():
+            converted = []
+            for reference in references:
+                if reference not in moved:
+                    moved[reference] = self.convert_reference(reference, storage)
+                converted.append(moved[reference])
+            if converted != references:
+                updates.append((note_id, converted))
+        
+        self.db.set_user_note_images(updates, meta=[('image_storage', storage)])
+        self.storage = storage
+        self.collect_garbage()
+        return sum(1 for old, new in moved.items() if old != new)
+    
+    def convert_reference(self, reference, storage):
+        in_database = reference.startswith(self.DB_PREFIX)
+        if storage == 'database' and not in_database:
+            if not os.path.exists(reference):
+                return reference
+            return self.add_to_database(reference)
+        
+        if storage == 'files' and in_database:
+            name = reference[len(self.DB_PREFIX):]
+            digest, extension = os.path.splitext(name)
+            target = self.blob_path(digest, extension)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                temp_path = f"{target}.{threading.get_ident()}.tmp"
+                if not self.db.read_image_blob(digest, temp_path):
+                    return reference
+                os.replace(temp_path, target)
+            with self.lock:
+                self.recent.add(os.path.normpath(target))
+            return target
+        
+        return reference
+    
+    def files(self, directory):
+        if not os.path.isdir(directory):
+            return
+        for prefix in os.scandir(directory):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    if not entry.name.endswith('.tmp'):
+                        yield os.path.normpath(entry.path)
+    
+    def collect_garbage(self):
+        """Удаляет изображения, на которые не ссылается ни один конспект.
+        
+        Возвращает (число удаленных изображений, освобожденные байты).
+        """
+        references = {os.path.normpath(path) for path in self.db.image_references()}
+        removed = freed = 0
+        
+        with self.lock:
+            keep = references | self.recent
+            for path in self.files(self.directory):
+                if path in keep:
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += size
+            
+            # Выгруженные копии нужны, только пока на изображение есть ссылки
+            for path in self.files(self.cache_directory):
+                if self.DB_PREFIX + os.path.basename(path) not in keep:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            
+            unused = [image_id for image_id, name in self.db.get_image_blobs()
+                      if self.DB_PREFIX + name not in keep]
+        
+        if unused:
+            self.db.delete_image_blobs(unused)
+            removed += len(unused)
+        return removed, freed
+
+
+# ============================================
+# ОБРАБОТКА ЗАГРУЖАЕМЫХ ИЗОБРАЖЕНИЙ
+# ============================================
+def ingest_image(source, target_dir, max_size=INGEST_MAX_SIZE, quality=INGEST_QUALITY,
+                 image_format=INGEST_FORMAT):
+    """Готовит загруженное изображение к хранению (выполняется в отдельном процессе).
+    
+    Поворачивает снимок по EXIF, уменьшает до max_size, пересжимает в
+    image_format и не переносит метаданные (EXIF с координатами съемки и
+    т.п.). Возвращает путь к новому файлу в target_dir или None, если
+    исходный файл нужно сохранить как есть.
+    """
+    from PIL import Image, ImageOps
+    
+    with Image.open(source) as image:
+        # Анимацию не пересжимаем, чтобы не потерять кадры
+        if getattr(image, 'is_animated', False):
+            return None
+        
+        image.draft('RGB', max_size)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(max_size, Image.LANCZOS, reducing_gap=3.0)
+        icc_profile = image.info.get('icc_profile')
+        
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        if image_format == 'WEBP':
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+            save_format, extension, options = 'WEBP', '.webp', {'quality': quality, 'method': 4}
+        elif has_alpha:
+            # JPEG не умеет прозрачность
+            image = image.convert('RGBA')
+            save_format, extension, options = 'PNG', '.png', {'optimize': True}
+        else:
+            image = image.convert('RGB')
+            save_format, extension, options = 'JPEG', '.jpg', {'quality': quality, 'optimize': True,
+                                                               'progressive': True}
+        
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        
+        name = os.path.splitext(os.path.basename(source))[0]
+        target = os.path.join(target_dir, f"{os.getpid()}_{time.monotonic_ns()}_{name}{extension}")
+        image.save(target, save_format, **options)
+    return target
+
+
+class ImageIngestor(QObject):
+    """Обрабатывает загружаемые изображения в пуле процессов и кладет их в хранилище.
+    
+    Пул создается при первой загрузке. Если обработать файл не удалось
+    (например, не установлен Pillow), в хранилище попадает оригинал.
+    
+    Ingestor общий для всех редакторов, поэтому каждый редактор получает
+    свой номер пакета через new_batch(), и все сигналы несут этот номер.
+    """
+    # Сигнал progress: пакет, обработано файлов, всего файлов в пакете
+    progress = pyqtSignal(int, int, int)
+    # Сигнал finished: пакет, исходный путь, ссылка на изображение в хранилище
+    finished = pyqtSignal(int, str, str)
+    failed = pyqtSignal(int, str, str)
+    
+    def __init__(self, image_store, parent=None):
+        super().__init__(parent)
+        self.image_store = image_store
+        self.executor = None
+        self.incoming = image_store.incoming_directory
+        self.last_batch = 0
+        # Номер пакета -> {'total', 'done', 'futures'}
+        self.batches = {}
+        self.lock = threading.Lock()
+    
+    def new_batch(self):
+        with self.lock:
+            self.last_batch += 1
+            batch = self.last_batch
+            self.batches[batch] = {'total': 0, 'done': 0, 'futures': set()}
+        return batch
+    
+    def cancel(self, batch):
+        """Отменяет еще не начатые файлы пакета; результаты остальных не сохраняются"""
+        with self.lock:
+            state = self.batches.pop(batch, None)
+        if state is not None:
+            for future in state['futures']:
+                future.cancel()
+    
+    def submit(self, batch, sources):
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            
+            # spawn: дочерние процессы не наследуют потоки Qt и SQLite
+            self.executor = ProcessPoolExecutor(
+                max_workers=max(1, min(4, (os.cpu_count() or 2) - 1)),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        os.makedirs(self.incoming, exist_ok=True)
+        
+        with self.lock:
+            state = self.batches.get(batch)
+            if state is None:
+                return
+            if state['done'] >= state['total']:
+                state['total'] = state['done'] = 0
+            state['total'] += len(sources)
+            done, total = state['done'], state['total']
+            
+            for source in sources:
+                future = self.executor.submit(ingest_image, source, self.incoming)
+                state['futures'].add(future)
+                future.add_done_callback(
+                    lambda future, source=source: self.store(batch, source, future))
+        self.progress.emit(batch, done, total)
+    
+    def store(self, batch, source, future):
+        """Переносит результат в хранилище (выполняется в служебном потоке пула)"""
+        if future.cancelled():
+            return
+        
+        processed = None
+        try:
+            processed = future.result()
+        except Exception as e:
+            print(f"Не удалось обработать изображение {source}: {e}")
+        
+        try:
+            with self.lock:
+                cancelled = batch not in self.batches
+            if cancelled:
+                # Редактор закрыт: изображение уже некуда добавить
+                return
+            reference = self.image_store.add(processed or source)
+            self.finished.emit(batch, source, reference)
+        except Exception as e:
+            self.failed.emit(batch, source, str(e))
+        finally:
+            if processed and os.path.exists(processed):
+                os.remove(processed)
+            with self.lock:
+                state = self.batches.get(batch)
+                if state is not None:
+                    state['futures'].discard(future)
+                    state['done'] += 1
+                    done, total = state['done'], state['total']
+            if state is not None:
+                self.progress.emit(batch, done, total)
+    
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+# ============================================
+# МИНИАТЮРЫ ИЗОБРАЖЕНИЙ
+# ============================================
+def make_thumbnail(source, target, size):
+    """Сохраняет в target JPEG-миниатюру source, вписанную в size"""
+    from PIL import Image, ImageOps
+    
+    with Image.open(source) as image:
+        # JPEG сразу декодируется в уменьшенном в 2-8 раз разрешении
+        image.draft('RGB', size)
+        image = ImageOps.exif_transpose(image)
+        # Сначала быстрое уменьшение reduce(), затем точное сглаживание
+        image.thumbnail(size, Image.LANCZOS, reducing_gap=2.0)
+        
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        temp_path = f"{target}.{threading.get_ident()}.tmp"
+        image.save(temp_path, 'JPEG', quality=85)
+    os.replace(temp_path, target)
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, cache, source, size_name):
+        super().__init__()
+        self.cache = cache
+        self.source = source
+        self.size_name = size_name
+    
+    def run(self):
+        try:
+            target = self.cache.generate(self.source, self.size_name)
+        except Exception as e:
+            print(f"Ошибка создания миниатюры {self.source}: {e}")
+            target = ''
+        self.cache.finished.emit(self.source, self.size_name, target)
+
+
+class ThumbnailCache(QObject):
+    """Миниатюры изображений фиксированных размеров в папке на диске.
+    
+    Файлы называются по SHA-256 содержимого исходника, поэтому одинаковые
+    фотографии делят одну миниатюру. Миниатюры создаются в фоновом пуле;
+    когда общий размер папки превышает max_bytes, удаляются давно не
+    использованные.
+    """
+    SIZES = {
+        'view': (600, 400),
+        'list': (160, 120),
+    }
+    
+    # Сигнал ready: исходный путь, имя размера, путь миниатюры
+    ready = pyqtSignal(str, str, str)
+    finished = pyqtSignal(str, str, str)
+    
+    def __init__(self, directory='thumbnails', max_bytes=THUMBNAIL_CACHE_BYTES,
+                 max_digests=THUMBNAIL_DIGEST_CACHE_SIZE, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_digests = max_digests
+        # (путь, размер, время изменения) -> хэш содержимого, LRU
+        self.digests = OrderedDict()
+        self.pending = set()
+        self.total_bytes = None
+        self.lock = threading.Lock()
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(2)
+        self.finished.connect(self.on_finished)
+    
+    def source_key(self, source):
+        stat = os.stat(source)
+        return (os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+    
+    def digest(self, source):
+        """Хэш содержимого исходника; повторно файл читается, только если он изменился"""
+        key = self.source_key(source)
+        with self.lock:
+            if key in self.digests:
+                self.digests.move_to_end(key)
+                return self.digests[key]
+        
+        digest = file_digest(source)
+        with self.lock:
+            self.digests[key] = digest
+            while len(self.digests) > self.max_digests:
+                self.digests.popitem(last=False)
+        return digest
+    
+    def target_path(self, digest, size_name):
+        width, height = self.SIZES[size_name]
+        return os.path.join(self.directory, digest[:2], f"{digest}_{width}x{height}.jpg")
+    
+    def thumbnail_path(self, source, size_name):
+        """Путь готовой миниатюры или None, если ее еще нужно создать"""
+        try:
+            key = self.source_key(source)
+        except OSError:
+            return None
+        
+        with self.lock:
+            digest = self.digests.get(key)
+        if digest is None:
+            return None
+        
+        target = self.target_path(digest, size_name)
+        if not os.path.exists(target):
+            return None
+        
+        # Время изменения отмечает использование для вытеснения
+        os.utime(target)
+        return target
+    
+    def request(self, source, size_name):
+        """Ставит создание миниатюры в очередь; по готовности испускается ready"""
+        if (source, size_name) in self.pending:
+            return
+        self.pending.add((source, size_name))
+        self.thread_pool.start(ThumbnailTask(self, source, size_name))
+    
+    def generate(self, source, size_name):
+        """Создает миниатюру, если ее нет (выполняется в фоновом потоке)"""
+        target = self.target_path(self.digest(source), size_name)
+        if os.path.exists(target):
+            os.utime(target)
+            return target
+        
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        make_thumbnail(source, target, self.SIZES[size_name])
+        self.account(os.path.getsize(target))
+        return target
+    
+    def account(self, added_bytes):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for path, size, mtime in self.cached_files())
+            self.total_bytes += added_bytes
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+    
+    def cached_files(self):
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.scandir(self.directory):
+            if prefix.is_dir():
+                for entry in os.scandir(prefix.path):
+                    if entry.name.endswith('.jpg'):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+    
+    def evict(self):
+        """Удаляет давно не использованные миниатюры до 3/4 лимита"""
+        files = sorted(self.cached_files(), key=lambda item: item[2])
+        total = sum(size for path, size, mtime in files)
+        for path, size, mtime in files:
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.total_bytes = total
+    
+    @pyqtSlot(str, str, str)
+    def on_finished(self, source, size_name, target):
+        self.pending.discard((source, size_name))
+        if target:
+            self.ready.emit(source, size_name, target)
+    
+    def shutdown(self):
+        self.thread_pool.clear()
+        self.thread_pool.waitForDone()
+
+
+# ============================================
+# ТЕМЫ ОФОРМЛЕНИЯ
+# ============================================
+# Цвета оформления; dark - нужна ли темная палитра Qt
+THEMES = {
+    'light': {
+        'dark': False,
+        'text': '#2c3e50',
+        'muted': '#7f8c8d',
+        'accent': '#3498db',
+        'panel': '#f8f9fa',
+        'logo': '#ecf0f1',
+        'base': 'white',
+        'border': '#bdc3c7',
+        'frame': '#dddddd',
+        'image': '#f5f5f5',
+        'card': 'white',
+        'card_hover': '#f8f9fa',
+        'header': '#ecf0f1',
+        'header_text': '#34495e',
+        'button': '#f5f5f5',
+    },
+    'dark': {
+        'dark': True,
+        'text': '#ecf0f1',
+        'muted': '#95a5a6',
+        'accent': '#3498db',
+        'panel': '#2b2b2b',
+        'logo': '#3a3a3a',
+        'base': '#191919',
+        'border': '#555555',
+        'frame': '#444444',
+        'image': '#232323',
+        'card': '#2b2b2b',
+        'card_hover': '#33404d',
+        'header': '#3a3a3a',
+        'header_text': '#ecf0f1',
+        'button': '#3a3a3a',
+    },
+}
+
+APP_STYLESHEET = '''
+QLabel#noteTitle {{
+    font-size: 22px;
+    font-weight: bold;
+    color: {text};
+    padding: 15px;
+    border-bottom: 2px solid {accent};
+    background-color: {panel};
+}}
+QLabel#noteSubject {{ font-size: 14px; color: {muted}; padding: 5px; }}
+QLabel#gradeBadge {{
+    font-size: 12px;
+    color: white;
+    background-color: {accent};
+    padding: 3px 10px;
+    border-radius: 10px;
+}}
+QTextEdit#noteContent {{
+    font-size: 14px;
+    padding: 15px;
+    border: none;
+    background-color: {base};
+    color: {text};
+}}
+QGroupBox#imagesGroup {{
+    font-size: 14px;
+    font-weight: bold;
+    border: 1px solid {border};
+    border-radius: 5px;
+    margin-top: 10px;
+}}
+QGroupBox#imagesGroup::title {{
+    subcontrol-origin: margin;
+    left: 10px;
+    padding: 0 5px 0 5px;
+}}
+QLabel#imageFrame {{ border: 1px solid {frame}; background-color: {image}; }}
+QLabel#imageCounter {{ font-weight: bold; }}
+QPushButton[role="danger"] {{ background-color: #e74c3c; color: white; font-weight: bold; padding: 8px; }}
+QPushButton[role="success"] {{ background-color: #2ecc71; color: white; font-weight: bold; padding: 8px; }}
+QLabel#editorTitle {{
+    font-size: 18px;
+    font-weight: bold;
+    color: {text};
+    padding: 10px;
+    border-bottom: 2px solid {accent};
+}}
+QLabel#ingestLabel, QLabel#statsLabel {{ color: {muted}; }}
+QLabel#statsLabel {{ font-size: 12px; }}
+QLabel#pageTitle {{
+    font-size: 20px;
+    font-weight: bold;
+    color: {text};
+    padding: 15px;
+    border-bottom: 2px solid {accent};
+}}
+QLabel#emptyLabel {{ font-size: 16px; color: {muted}; padding: 50px; }}
+QListView#noteList {{ border: none; background: transparent; }}
+QLabel#logo {{
+    font-size: 20px;
+    font-weight: bold;
+    color: {text};
+    padding: 15px;
+    background-color: {logo};
+    border-radius: 10px;
+}}
+QPushButton[nav="true"] {{
+    text-align: left;
+    padding: 10px;
+    font-size: 14px;
+    border: none;
+    border-radius: 5px;
+}}
+QPushButton#allNotesButton:hover {{ background-color: {accent}; color: white; }}
+QPushButton#myNotesButton {{ background-color: #f39c12; color: white; }}
+QPushButton#myNotesButton:hover {{ background-color: #e67e22; }}
+QPushButton#createNoteButton {{ background-color: #2ecc71; color: white; }}
+QPushButton#createNoteButton:hover {{ background-color: #27ae60; }}
+QPushButton#importNoteButton {{ background-color: #9b59b6; color: white; }}
+QPushButton#importNoteButton:hover {{ background-color: #8e44ad; }}
+QPushButton#refreshStatsButton {{ padding: 5px; }}
+QLabel#welcomeTitle {{ font-size: 32px; font-weight: bold; color: {text}; }}
+QLabel#welcomeSubtitle {{ font-size: 18px; color: {muted}; margin-bottom: 30px; }}
+QFrame#subjectCard {{ border-radius: 10px; padding: 15px; }}
+QFrame#subjectCard QLabel {{ color: white; background: transparent; }}
+QLabel#cardIcon {{ font-size: 24px; }}
+QLabel#cardName {{ font-size: 16px; font-weight: bold; }}
+QLabel#cardDescription {{ font-size: 12px; }}
+QPushButton#quickStartButton {{
+    font-size: 16px;
+    padding: 15px;
+    background-color: #2c3e50;
+    color: white;
+    border-radius: 8px;
+    font-weight: bold;
+}}
+QPushButton#quickStartButton:hover {{ background-color: {accent}; }}
+'''
+
+# Правила для цвета предмета: кнопки в боковой панели и карточки на главном экране
+SUBJECT_STYLESHEET = '''
+QPushButton[subjectColor="{key}"] {{ background-color: rgba({rgb}, 32); color: {color}; }}
+QPushButton[subjectColor="{key}"]:hover {{ background-color: {color}; color: white; }}
+QFrame#subjectCard[subjectColor="{key}"] {{ background-color: {color}; }}
+'''
+
+# Оформление текста конспекта внутри QTextDocument
+NOTE_STYLESHEET = '''
+p.heading {{ font-weight: bold; color: {text}; margin-top: 10px; }}
+p.step {{ color: {accent}; margin-left: 20px; }}
+p.box {{ background-color: {panel}; padding: 8px; border-radius: 5px; }}
+'''
+
+
+def subject_key(color):
+    """Значение свойства subjectColor для цвета предмета"""
+    return (color or '').lstrip('#').lower()
+
+
+def note_stylesheet(name='light'):
+    return NOTE_STYLESHEET.format(**THEMES[name])
+
+
+def dark_palette():
+    palette = QPalette()
+    palette.setColor(QPalette.Window, QColor(53, 53, 53))
+    palette.setColor(QPalette.WindowText, Qt.white)
+    palette.setColor(QPalette.Base, QColor(25, 25, 25))
+    palette.setColor(QPalette.AlternateBase, QColor(53, 53, 53))
+    palette.setColor(QPalette.ToolTipBase, Qt.white)
+    palette.setColor(QPalette.ToolTipText, Qt.white)
+    palette.setColor(QPalette.Text, Qt.white)
+    palette.setColor(QPalette.Button, QColor(53, 53, 53))
+    palette.setColor(QPalette.ButtonText, Qt.white)
+    palette.setColor(QPalette.BrightText, Qt.red)
+    palette.setColor(QPalette.Link, QColor(42, 130, 218))
+    palette.setColor(QPalette.Highlight, QColor(42, 130, 218))
+    palette.setColor(QPalette.HighlightedText, Qt.black)
+    return palette
+
+
+class ThemeEngine(QObject):
+    """Одна таблица стилей на все приложение.
+    
+    Виджеты получают оформление по objectName и динамическим свойствам
+    (role, nav, subjectColor), поэтому смена темы - это одна палитра и одна
+    таблица стилей для QApplication, а не перенастройка каждого виджета.
+    """
+    changed = pyqtSignal(str)
+    
+    def __init__(self, app=None, parent=None):
+        super().__init__(parent)
+        self.app = app or QApplication.instance()
+        self.name = None
+        self.colors = THEMES['light']
+        self.subject_colors = []
+        self.compiled = {}
+        self.add_subject_colors([color for name, color in DEFAULT_SUBJECTS], apply=False)
+    
+    def stylesheet(self):
+        """Собранная таблица стилей текущей темы (собирается один раз)"""
+        key = (self.name, tuple(self.subject_colors))
+        if key not in self.compiled:
+            parts = [APP_STYLESHEET.format(**self.colors)]
+            for color in self.subject_colors:
+                qcolor = QColor(color)
+                parts.append(SUBJECT_STYLESHEET.format(
+                    key=subject_key(color), color=color,
+                    rgb=f'{qcolor.red()}, {qcolor.green()}, {qcolor.blue()}'
+                ))
+            self.compiled[key] = ''.join(parts)
+        return self.compiled[key]
+    
+    def apply(self, name):
+        """Включает тему 'light' или 'dark'"""
+        if name not in THEMES:
+            name = 'light'
+        self.name = name
+        self.colors = THEMES[name]
+        self.app.setPalette(dark_palette() if self.colors['dark'] else self.app.style().standardPalette())
+        self.app.setStyleSheet(self.stylesheet())
+        self.changed.emit(name)
+    
+    def add_subject_colors(self, colors, apply=True):
+        """Добавляет правила для новых цветов предметов"""
+        new_colors = []
+        for color in colors:
+            color = f'#{subject_key(color)}'
+            if color not in self.subject_colors and color not in new_colors:
+                new_colors.append(color)
+        
+        if new_colors:
+            self.subject_colors.extend(new_colors)
+            if apply and self.name is not None:
+                self.app.setStyleSheet(self.stylesheet())
+    
+    def note_stylesheet(self):
+        return note_stylesheet(self.name or 'light')
+
+
+# ============================================
+# ВИДЖЕТ ДЛЯ ПРОСМОТРА КОНСПЕКТА
+# ============================================
+class ImageDecoder(QObject):
+    # Сигнал decoded: индекс изображения, QImage
+    decoded = pyqtSignal(int, object)
+
+
+class ImageDecodeTask(QRunnable):
+    """Декодирует изображение карусели в фоновом потоке.
+    
+    QImage, в отличие от QPixmap, можно создавать вне потока интерфейса;
+    в QPixmap кадр превращается уже при получении сигнала.
+    """
+    def __init__(self, decoder, index, path, thumbnails=None):
+        super().__init__()
+        self.decoder = decoder
+        self.index = index
+        self.path = path
+        self.thumbnails = thumbnails
+    
+    def run(self):
+        image = QImage()
+        try:
+            if os.path.exists(self.path):
+                if self.thumbnails is not None:
+                    # Миниатюра 600x400 уже нужного размера
+                    image = QImage(self.thumbnails.generate(self.path, 'view'))
+                else:
+                    image = QImage(self.path)
+                    if image.width() > 600 or image.height() > 400:
+                        image = image.scaled(600, 400, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        except Exception as e:
+            print(f"Ошибка загрузки изображения: {e}")
+            image = QImage()
+        
+        try:
+            self.decoder.decoded.emit(self.index, image)
+        except RuntimeError:
+            # Окно просмотра уже закрыто
+            pass
+
+
+class NoteViewer(QDialog):
+    # Пул декодирования общий для всех просмотрщиков: собственный пул диалога
+    # при удалении ждал бы свои потоки, не отпуская GIL, который нужен им самим
+    decode_pool = None
+    
+    def __init__(self, note_data, parent=None, thumbnails=None, theme=None):
+        super().__init__(parent)
+        self.note_data = note_data
+        self.images = note_data.get('images', [])
+        self.current_image_index = 0
+        self.thumbnails = thumbnails
+        self.theme = theme
+        
+        # Декодированные кадры карусели: индекс -> QPixmap
+        self.frames = OrderedDict()
+        # Декодируемые кадры: индекс -> задача в пуле
+        self.decoding = {}
+        self.decoder = ImageDecoder(self)
+        self.decoder.decoded.connect(self.on_image_decoded)
+        if NoteViewer.decode_pool is None:
+            NoteViewer.decode_pool = QThreadPool()
+            NoteViewer.decode_pool.setMaxThreadCount(2)
+        self.initUI()
+    
+    def initUI(self):
+        self.setWindowTitle(self.note_data['title'])
+        self.setMinimumSize(700, 600)
+        
+        layout = QVBoxLayout()
+        
+        # Заголовок
+        title_label = QLabel(self.note_data['title'])
+        title_label.setObjectName('noteTitle')
+        title_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title_label)
+        
+        # Информация о предмете
+        info_layout = QHBoxLayout()
+        
+        subject_label = QLabel(f"📚 {self.note_data.get('subject', '')}")
+        subject_label.setObjectName('noteSubject')
+        
+        grade_label = QLabel("1 класс")
+        grade_label.setObjectName('gradeBadge')
+        
+        info_layout.addWidget(subject_label)
+        info_layout.addStretch()
+        info_layout.addWidget(grade_label)
+        layout.addLayout(info_layout)
+        
+        # Контент с прокруткой
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        
+        content_widget = QWidget()
+        content_layout = QVBoxLayout(content_widget)
+        
+        # Текст конспекта
+        content_text = QTextEdit()
+        content_text.setObjectName('noteContent')
+        content_text.setReadOnly(True)
+        content_text.document().setDefaultStyleSheet(
+            self.theme.note_stylesheet() if self.theme else note_stylesheet()
+        )
+        content_text.setHtml(note_document(self.note_body()))
+        content_layout.addWidget(content_text)
+        
+        # Изображения
+        if self.images:
+            images_group = QGroupBox("📷 Изображения")
+            images_group.setObjectName('imagesGroup')
+            
+            images_layout = QVBoxLayout()
+            
+            # Просмотрщик изображений
+            self.image_label = QLabel()
+            self.image_label.setAlignment(Qt.AlignCenter)
+            self.image_label.setMinimumHeight(300)
+            self.image_label.setObjectName('imageFrame')
+            images_layout.addWidget(self.image_label)
+            
+            # Кнопки навигации по изображениям
+            if len(self.images) > 1:
+                nav_layout = QHBoxLayout()
+                nav_layout.addStretch()
+                
+                self.prev_btn = QPushButton("◀ Назад")
+                self.prev_btn.clicked.connect(self.show_prev_image)
+                self.prev_btn.setEnabled(False)
+                
+                self.image_counter = QLabel(f"1 / {len(self.images)}")
+                self.image_counter.setObjectName('imageCounter')
+                
+                self.next_btn = QPushButton("Вперед ▶")
+                self.next_btn.clicked.connect(self.show_next_image)
+                if len(self.images) == 1:
+                    self.next_btn.setEnabled(False)
+                
+                nav_layout.addWidget(self.prev_btn)
+                nav_layout.addWidget(self.image_counter)
+                nav_layout.addWidget(self.next_btn)
+                nav_layout.addStretch()
+                
+                images_layout.addLayout(nav_layout)
+            
+            images_group.setLayout(images_layout)
+            content_layout.addWidget(images_group)
+            
+            # Загружаем первое изображение
+            self.load_current_image()
+        
+        content_layout.addStretch()
+        scroll_area.setWidget(content_widget)
+        layout.addWidget(scroll_area)
+        
+        # Кнопки
+        button_layout = QHBoxLayout()
+        
+        print_btn = QPushButton("🖨️ Печать")
+        print_btn.clicked.connect(self.print_note)
+        
+        export_btn = QPushButton("💾 Сохранить")
+        export_btn.clicked.connect(self.export_note)
+        
+        close_btn = QPushButton("✕ Закрыть")
+        close_btn.clicked.connect(self.accept)
+        close_btn.setProperty('role', 'danger')
+        
+        button_layout.addWidget(print_btn)
+        button_layout.addWidget(export_btn)
+        button_layout.addStretch()
+        button_layout.addWidget(close_btn)
+        
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+    
+    def note_body(self):
+        """HTML текста: заранее подготовленный или отформатированный сейчас"""
+        if self.note_data.get('html') is None:
+            self.note_data['html'] = render_note_body(self.note_data['content'])
+        return self.note_data['html']
+    
+    def load_current_image(self):
+        if self.images and self.current_image_index < len(self.images):
+            index = self.current_image_index
+            if index in self.frames:
+                self.frames.move_to_end(index)
+                self.image_label.setPixmap(self.frames[index])
+            else:
+                self.image_label.setText("Загрузка...")
+                self.request_image(index)
+            
+            # Соседние изображения декодируются заранее
+            for offset in range(1, IMAGE_PREFETCH + 1):
+                for neighbour in (index + offset, index - offset):
+                    if 0 <= neighbour < len(self.images) and neighbour not in self.frames:
+                        self.request_image(neighbour)
+            
+            if len(self.images) > 1:
+                # Обновляем счетчик
+                self.image_counter.setText(f"{index + 1} / {len(self.images)}")
+                
+                # Обновляем состояние кнопок
+                self.prev_btn.setEnabled(index > 0)
+                self.next_btn.setEnabled(index < len(self.images) - 1)
+    
+    def request_image(self, index):
+        if index not in self.decoding:
+            task = ImageDecodeTask(self.decoder, index, self.images[index], self.thumbnails)
+            self.decoding[index] = task
+            self.decode_pool.start(task)
+    
+    def on_image_decoded(self, index, image):
+        self.decoding.pop(index, None)
+        # Пока изображение декодировалось, пользователь мог уйти далеко
+        if abs(index - self.current_image_index) > IMAGE_PREFETCH:
+            return
+        
+        if image.isNull():
+            if index == self.current_image_index:
+                self.image_label.setText("Не удалось загрузить изображение")
+            return
+        
+        self.frames[index] = QPixmap.fromImage(image)
+        while len(self.frames) > IMAGE_CACHE_SIZE:
+            # Вытесняем самый дальний от текущего кадр
+            farthest = max(self.frames, key=lambda i: abs(i - self.current_image_index))
+            del self.frames[farthest]
+        
+        if index == self.current_image_index:
+            self.image_label.setPixmap(self.frames[index])
+    
+    def done(self, result):
+        # Еще не начатые задачи этого просмотрщика снимаются с очереди,
+        # выполняющиеся доработают и отправят сигнал уже удаленному декодеру
+        for task in self.decoding.values():
+            try:
+                self.decode_pool.tryTake(task)
+            except RuntimeError:
+                # Задача уже выполнена и удалена пулом
+                pass
+        self.decoding.clear()
+        super().done(result)
+    
+    def show_next_image(self):
+        if self.current_image_index < len(self.images) - 1:
+            self.current_image_index += 1
+            self.load_current_image()
+    
+    def show_prev_image(self):
+        if self.current_image_index > 0:
+            self.current_image_index -= 1
+            self.load_current_image()
+    
+    def print_note(self):
+        from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
+        
+        printer = QPrinter(QPrinter.HighResolution)
+        print_dialog = QPrintDialog(printer, self)
+        
+        if print_dialog.exec_() == QPrintDialog.Accepted:
+            # Создаем документ для печати
+            document = QTextDocument()
+            # На бумаге всегда светлая тема
+            document.setDefaultStyleSheet(note_stylesheet())
+            html = f'''
+            <h1>{escape(self.note_data['title'], quote=False)}</h1>
+            <h3>Предмет: {escape(self.note_data.get('subject') or '', quote=False)} | 1 класс</h3>
+            <hr>
+            {self.note_body()}
+            '''
+            document.setHtml(html)
+            document.print_(printer)
+    
+    def export_note(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            "Сохранить конспект",
+            f"{self.note_data['title']}.txt",
+            "Текстовые файлы (*.txt);;Все файлы (*)"
+        )
+        
+        if file_path:
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(f"Конспект: {self.note_data['title']}\n")
+                    f.write(f"Предмет: {self.note_data.get('subject', '')}\n")
+                    f.write("Класс: 1\n")
+                    f.write("=" * 50 + "\n\n")
+                    f.write(self.note_data['content'])
+                
+                QMessageBox.information(self, "Успех", f"Конспект сохранен в файл:\n{file_path}")
+            except Exception as e:
+                QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить файл:\n{str(e)}")
+
+
+# ============================================
+# РЕДАКТОР КОНСПЕКТОВ
+# ============================================
+class NoteEditor(QDialog):
+    def __init__(self, parent=None, note_data=None, mode='create', thumbnails=None, image_store=None,
+                 ingestor=None):
+        super().__init__(parent)
+        self.note_data = note_data or {}
+        self.mode = mode
+        self.images = self.note_data.get('images', [])
+        self.thumbnails = thumbnails
+        self.image_store = image_store or ImageStore()
+        self.ingestor = ingestor
+        if ingestor is not None:
+            # Изображения, загруженные в других редакторах, сюда не попадают
+            self.ingest_batch = ingestor.new_batch()
+            ingestor.progress.connect(self.on_ingest_progress)
+            ingestor.finished.connect(self.on_image_ingested)
+            ingestor.failed.connect(self.on_ingest_failed)
+        if thumbnails is not None:
+            thumbnails.ready.connect(self.on_thumbnail_ready)
+        self.initUI()
+        
+        if mode == 'edit' and note_data:
+            self.load_existing_data()
+    
+    def initUI(self):
+        self.setWindowTitle("Редактор конспекта" if self.mode == 'edit' else "Создать конспект")
+        self.setMinimumSize(700, 600)
+        
+        main_layout = QVBoxLayout()
+        
+        # Заголовок редактора
+        title_label = QLabel("📝 Редактор конспекта")
+        title_label.setObjectName('editorTitle')
+        main_layout.addWidget(title_label)
+        
+        # Форма
+        form_layout = QFormLayout()
+        form_layout.setLabelAlignment(Qt.AlignRight)
+        
+        # Предмет
+        self.subject_combo = QComboBox()
+        self.subject_combo.addItems([
+            "Математика", "Русский язык", "Чтение", 
+            "Письмо", "Окружающий мир", "Технология",
+            "Физкультура", "Музыка"
+        ])
+        form_layout.addRow("Предмет:", self.subject_combo)
+        
+        # Заголовок
+        self.title_edit = QLineEdit()
+        self.title_edit.setPlaceholderText("Введите название конспекта")
+        form_layout.addRow("Заголовок:", self.title_edit)
+        
+        # Контент
+        self.content_edit = QTextEdit()
+        self.content_edit.setPlaceholderText("Введите текст конспекта...\n\nИспользуйте:\n• для списков\n📌 для важных пунктов\n🎯 для правил")
+        self.content_edit.setMinimumHeight(200)
+        
+        # Панель форматирования
+        format_toolbar = QToolBar()
         
         bold_btn = QAction("Ж", self)
         bold_btn.triggered.connect(lambda: self.format_text('bold'))
@@ -683,249 +2735,1674 @@ class NoteEditor(QDialog):
         images_group = QGroupBox("📷 Изображения")
         images_layout = QVBoxLayout()
         
-        # Кнопки загрузки
-        upload_layout = QHBoxLayout()
-        self.upload_btn = QPushButton("📁 Загрузить изображение")
-        self.upload_btn.clicked.connect(self.upload_image)
+        # Кнопки загрузки
+        upload_layout = QHBoxLayout()
+        self.upload_btn = QPushButton("📁 Загрузить изображение")
+        self.upload_btn.clicked.connect(self.upload_image)
+        
+        self.capture_btn = QPushButton("📷 Сделать фото (если есть камера)")
+        self.capture_btn.clicked.connect(self.capture_photo)
+        self.capture_btn.setEnabled(False)  # Отключаем, пока не реализовано
+        
+        self.ingest_label = QLabel()
+        self.ingest_label.setObjectName('ingestLabel')
+        self.ingest_label.hide()
+        
+        upload_layout.addWidget(self.upload_btn)
+        upload_layout.addWidget(self.capture_btn)
+        upload_layout.addWidget(self.ingest_label)
+        upload_layout.addStretch()
+        
+        # Список изображений
+        self.image_list = QListWidget()
+        self.image_list.setIconSize(QSize(80, 60))
+        self.image_list.setMaximumHeight(140)
+        
+        # Кнопки управления изображениями
+        image_buttons_layout = QHBoxLayout()
+        self.remove_image_btn = QPushButton("Удалить выбранное")
+        self.remove_image_btn.clicked.connect(self.remove_image)
+        self.remove_image_btn.setEnabled(False)
+        
+        self.image_list.itemSelectionChanged.connect(
+            lambda: self.remove_image_btn.setEnabled(bool(self.image_list.selectedItems()))
+        )
+        
+        image_buttons_layout.addWidget(self.remove_image_btn)
+        image_buttons_layout.addStretch()
+        
+        images_layout.addLayout(upload_layout)
+        images_layout.addWidget(self.image_list)
+        images_layout.addLayout(image_buttons_layout)
+        images_group.setLayout(images_layout)
+        
+        main_layout.addWidget(images_group)
+        
+        # Шаблоны
+        templates_group = QGroupBox("📋 Шаблоны")
+        templates_layout = QHBoxLayout()
+        
+        math_template_btn = QPushButton("Математика")
+        math_template_btn.clicked.connect(lambda: self.insert_template('math'))
+        
+        reading_template_btn = QPushButton("Чтение")
+        reading_template_btn.clicked.connect(lambda: self.insert_template('reading'))
+        
+        world_template_btn = QPushButton("Окружающий мир")
+        world_template_btn.clicked.connect(lambda: self.insert_template('world'))
+        
+        templates_layout.addWidget(math_template_btn)
+        templates_layout.addWidget(reading_template_btn)
+        templates_layout.addWidget(world_template_btn)
+        templates_group.setLayout(templates_layout)
+        
+        main_layout.addWidget(templates_group)
+        
+        # Кнопки сохранения/отмены
+        button_layout = QHBoxLayout()
+        
+        self.save_btn = QPushButton("💾 Сохранить")
+        self.save_btn.clicked.connect(self.save_note)
+        self.save_btn.setProperty('role', 'success')
+        
+        cancel_btn = QPushButton("✕ Отмена")
+        cancel_btn.clicked.connect(self.reject)
+        cancel_btn.setProperty('role', 'danger')
+        
+        button_layout.addStretch()
+        button_layout.addWidget(self.save_btn)
+        button_layout.addWidget(cancel_btn)
+        
+        main_layout.addLayout(button_layout)
+        self.setLayout(main_layout)
+    
+    def load_existing_data(self):
+        if 'subject' in self.note_data:
+            index = self.subject_combo.findText(self.note_data['subject'])
+            if index >= 0:
+                self.subject_combo.setCurrentIndex(index)
+        
+        if 'title' in self.note_data:
+            self.title_edit.setText(self.note_data['title'])
+        
+        if 'content' in self.note_data:
+            self.content_edit.setPlainText(self.note_data['content'])
+        
+        if 'images' in self.note_data:
+            self.images = self.note_data['images']
+            for img in self.images:
+                self.add_image_item(img, os.path.basename(img))
+    
+    def add_image_item(self, reference, name):
+        path = self.image_store.path(reference)
+        item = QListWidgetItem(name)
+        item.setData(Qt.UserRole, path)
+        self.image_list.addItem(item)
+        
+        if self.thumbnails is not None and os.path.exists(path):
+            thumbnail = self.thumbnails.thumbnail_path(path, 'list')
+            if thumbnail:
+                item.setIcon(QIcon(thumbnail))
+            else:
+                self.thumbnails.request(path, 'list')
+    
+    def on_thumbnail_ready(self, source, size_name, thumbnail):
+        if size_name != 'list':
+            return
+        for row in range(self.image_list.count()):
+            item = self.image_list.item(row)
+            if item.data(Qt.UserRole) == source:
+                item.setIcon(QIcon(thumbnail))
+    
+    def format_text(self, style):
+        cursor = self.content_edit.textCursor()
+        
+        if style == 'bold':
+            format = QTextCharFormat()
+            format.setFontWeight(QFont.Bold)
+            cursor.mergeCharFormat(format)
+        elif style == 'italic':
+            format = QTextCharFormat()
+            format.setFontItalic(True)
+            cursor.mergeCharFormat(format)
+        elif style == 'bullet':
+            self.content_edit.insertPlainText('• ')
+    
+    def insert_template(self, template_type):
+        templates = {
+            'math': '''📌 ТЕМА:
+• Правило 1
+• Правило 2
+• Правило 3
+
+🎯 ПРИМЕРЫ:
+1) Пример 1
+2) Пример 2
+3) Пример 3
+
+❗ ЗАПОМНИ:
+Важное правило''',
+            
+            'reading': '''📖 ПРОИЗВЕДЕНИЕ:
+Автор: 
+Жанр: 
+
+👥 ГЕРОИ:
+• Персонаж 1
+• Персонаж 2
+
+🎯 ГЛАВНАЯ МЫСЛЬ:
+Текст главной мысли''',
+            
+            'world': '''🌍 ТЕМА:
+📅 Время года/период:
+📍 Место:
+
+📌 ОСОБЕННОСТИ:
+• Особенность 1
+• Особенность 2
+• Особенность 3
+
+🖼️ ИЛЛЮСТРАЦИИ:
+[описание изображения]'''
+        }
+        
+        if template_type in templates:
+            self.content_edit.insertPlainText(templates[template_type])
+    
+    def upload_image(self):
+        file_dialog = QFileDialog()
+        file_dialog.setNameFilter("Изображения (*.png *.jpg *.jpeg *.bmp *.gif)")
+        file_dialog.setFileMode(QFileDialog.ExistingFiles)
         
-        self.capture_btn = QPushButton("📷 Сделать фото (если есть камера)")
-        self.capture_btn.clicked.connect(self.capture_photo)
-        self.capture_btn.setEnabled(False)  # Отключаем, пока не реализовано
+        if file_dialog.exec_():
+            filenames = file_dialog.selectedFiles()
+            if self.ingestor is not None:
+                # Поворот, уменьшение и пересжатие выполняются в фоне
+                self.ingestor.submit(self.ingest_batch, filenames)
+                return
+            
+            for filename in filenames:
+                try:
+                    # Одинаковые файлы хранятся в папке приложения один раз
+                    dest_path = self.image_store.add(filename)
+                    if dest_path not in self.images:
+                        self.images.append(dest_path)
+                        self.add_image_item(dest_path, os.path.basename(filename))
+                except Exception as e:
+                    QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить изображение:\n{str(e)}")
+    
+    def on_ingest_progress(self, batch, done, total):
+        if batch != self.ingest_batch:
+            return
+        busy = done < total
+        self.ingest_label.setText(f"Обработка изображений: {done} / {total}")
+        self.ingest_label.setVisible(busy)
+        # Сохранять конспект можно, когда все изображения обработаны
+        self.save_btn.setEnabled(not busy)
+    
+    def on_image_ingested(self, batch, source, reference):
+        if batch != self.ingest_batch:
+            return
+        if reference not in self.images:
+            self.images.append(reference)
+            self.add_image_item(reference, os.path.basename(source))
+    
+    def on_ingest_failed(self, batch, source, message):
+        if batch != self.ingest_batch:
+            return
+        QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить изображение:\n{message}")
+    
+    def capture_photo(self):
+        # Заглушка для функции фото
+        QMessageBox.information(self, "Информация", "Функция фото будет добавлена в будущей версии")
+    
+    def remove_image(self):
+        selected_items = self.image_list.selectedItems()
+        if not selected_items:
+            return
         
-        upload_layout.addWidget(self.upload_btn)
-        upload_layout.addWidget(self.capture_btn)
-        upload_layout.addStretch()
+        for item in selected_items:
+            row = self.image_list.row(item)
+            self.image_list.takeItem(row)
+            
+            # Файл может использоваться другими конспектами, поэтому его
+            # удалит сборка мусора хранилища, когда ссылок не останется
+            if row < len(self.images):
+                self.images.pop(row)
+    
+    def save_note(self):
+        subject = self.subject_combo.currentText().strip()
+        title = self.title_edit.text().strip()
+        content = self.content_edit.toPlainText().strip()
         
-        # Список изображений
-        self.image_list = QListWidget()
-        self.image_list.setMaximumHeight(100)
+        # Валидация
+        errors = []
         
-        # Кнопки управления изображениями
-        image_buttons_layout = QHBoxLayout()
-        self.remove_image_btn = QPushButton("Удалить выбранное")
-        self.remove_image_btn.clicked.connect(self.remove_image)
-        self.remove_image_btn.setEnabled(False)
+        if not subject:
+            errors.append("Выберите предмет")
         
-        self.image_list.itemSelectionChanged.connect(
-            lambda: self.remove_image_btn.setEnabled(bool(self.image_list.selectedItems()))
-        )
+        if not title:
+            errors.append("Введите название конспекта")
         
-        image_buttons_layout.addWidget(self.remove_image_btn)
-        image_buttons_layout.addStretch()
+        if not content:
+            errors.append("Введите содержание конспекта")
         
-        images_layout.addLayout(upload_layout)
-        images_layout.addWidget(self.image_list)
-        images_layout.addLayout(image_buttons_layout)
-        images_group.setLayout(images_layout)
+        if errors:
+            QMessageBox.warning(self, "Ошибка", "Исправьте следующие ошибки:\n• " + "\n• ".join(errors))
+            return
         
-        main_layout.addWidget(images_group)
+        self.note_data = {
+            'subject': subject,
+            'title': title,
+            'content': content,
+            'images': self.images,
+            'grade': 1
+        }
         
-        # Шаблоны
-        templates_group = QGroupBox("📋 Шаблоны")
-        templates_layout = QHBoxLayout()
+        self.accept()
+    
+    def get_note_data(self):
+        return self.note_data
+    
+    def done(self, result):
+        # Редактор остается дочерним окном MainWindow, поэтому отключаемся
+        # от общих сигналов, чтобы закрытый редактор не получал изображения
+        if self.thumbnails is not None:
+            self.thumbnails.ready.disconnect(self.on_thumbnail_ready)
+        if self.ingestor is not None:
+            self.ingestor.progress.disconnect(self.on_ingest_progress)
+            self.ingestor.finished.disconnect(self.on_image_ingested)
+            self.ingestor.failed.disconnect(self.on_ingest_failed)
+            self.ingestor.cancel(self.ingest_batch)
+        super().done(result)
+
+
+# ============================================
+# ЭКСПОРТ КОНСПЕКТОВ
+# ============================================
+def safe_filename(title):
+    """Имя файла из заголовка: только буквы, цифры, пробел, '-' и '_'"""
+    safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
+    return safe_title or "Без названия"
+
+
+def note_text(title, subject, created_at, content, image_names=()):
+    """Текст конспекта в формате экспорта"""
+    lines = [
+        f"Конспект: {title}\n",
+        f"Предмет: {subject}\n",
+        f"Дата создания: {created_at}\n",
+    ]
+    if image_names:
+        lines.append(f"Изображения: {', '.join(image_names)}\n")
+    lines.append("=" * 50 + "\n\n")
+    lines.append(content)
+    return ''.join(lines)
+
+
+class ExportTask(QRunnable):
+    """Экспорт пользовательских конспектов в папку или ZIP-архив.
+    
+    Строки читаются из курсора порциями, поэтому память не растет вместе с
+    библиотекой. В папку файлы пишет пул потоков (не больше EXPORT_WORKERS
+    задач в очереди одновременно), в архив - сам поток задачи, так как
+    ZipFile нельзя заполнять из нескольких потоков.
+    
+    Имена файлов не зависят от порядка завершения записи: конспекты
+    обходятся по возрастанию id, и при совпадении имен к более позднему
+    добавляется его id.
+    """
+    def __init__(self, exporter, folder, archive=False):
+        super().__init__()
+        self.exporter = exporter
+        self.folder = folder
+        self.archive = archive
+        self.cancelled = threading.Event()
+        self.used_names = set()
+    
+    def unique_name(self, title, note_id):
+        name = safe_filename(title)
+        # Сравнение без учета регистра: Windows и macOS его не различают
+        candidate = name
+        number = 1
+        # Запасное имя тоже может быть занято, перебираем до свободного
+        while candidate.casefold() in self.used_names:
+            candidate = f"{name} ({note_id})" if number == 1 else f"{name} ({note_id}-{number})"
+            number += 1
+        self.used_names.add(candidate.casefold())
+        return candidate
+    
+    def planned_files(self, note, name=None):
+        """Имя конспекта и пары (путь изображения, имя файла изображения)"""
+        note_id, subject, title, content, images, grade, created_at = note[:7]
+        if name is None:
+            name = self.unique_name(title, note_id)
+        
+        image_files = []
+        for number, reference in enumerate(json.loads(images) if images else [], 1):
+            path = self.exporter.image_store.path(reference)
+            extension = os.path.splitext(path)[1]
+            image_files.append((path, f"{name}_{number}{extension}"))
+        return name, image_files
+    
+    def run(self):
+        db = self.exporter.db
+        total = 0
+        
+        # Любой выход, в том числе ошибка подсчета, заканчивается сигналом finished
+        try:
+            total = db.count_user_notes()
+            self.exporter.progress.emit(0, total)
+            if self.archive:
+                result = self.export_archive(db, total)
+            else:
+                result = self.export_folder(db, total)
+        except Exception as e:
+            result = {'error': str(e)}
         
-        math_template_btn = QPushButton("Математика")
-        math_template_btn.clicked.connect(lambda: self.insert_template('math'))
+        result['cancelled'] = self.cancelled.is_set()
+        result['total'] = total
+        self.exporter.finished.emit(result)
+    
+    def load_manifest(self):
+        """Записи прошлого экспорта в эту папку: id -> name, files, revision, hash"""
+        try:
+            with open(os.path.join(self.folder, EXPORT_MANIFEST), encoding='utf-8') as f:
+                return json.load(f)['notes']
+        except (OSError, ValueError, KeyError):
+            return {}
+    
+    def save_manifest(self, notes):
+        path = os.path.join(self.folder, EXPORT_MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'notes': notes}, f, ensure_ascii=False, indent=1)
+        os.replace(path + '.tmp', path)
+    
+    def remove_files(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+    
+    def export_folder(self, db, total):
+        """Экспорт в папку, записывающий только изменившиеся конспекты.
+        
+        Манифест прошлого экспорта хранит для каждого конспекта имя, файлы,
+        ревизию и хэш текста со ссылками на изображения. Конспект с той же
+        ревизией или тем же хэшем пропускается, файлы удаленных конспектов
+        удаляются. Прежние имена файлов сохраняются, пока не изменится
+        заголовок.
+        """
+        from concurrent.futures import ThreadPoolExecutor
         
-        reading_template_btn = QPushButton("Чтение")
-        reading_template_btn.clicked.connect(lambda: self.insert_template('reading'))
+        old_manifest = self.load_manifest()
+        manifest = {}
+        self.used_names.update(entry['name'].casefold() for entry in old_manifest.values())
         
-        world_template_btn = QPushButton("Окружающий мир")
-        world_template_btn.clicked.connect(lambda: self.insert_template('world'))
+        done = failed = skipped = 0
+        slots = threading.BoundedSemaphore(EXPORT_WORKERS * 2)
+        lock = threading.Lock()
         
-        templates_layout.addWidget(math_template_btn)
-        templates_layout.addWidget(reading_template_btn)
-        templates_layout.addWidget(world_template_btn)
-        templates_group.setLayout(templates_layout)
+        def finish(ok=True, skip=False):
+            nonlocal done, failed, skipped
+            with lock:
+                done += 1
+                failed += not ok
+                skipped += skip
+                count = done
+            self.exporter.progress.emit(count, total)
         
-        main_layout.addWidget(templates_group)
+        def unchanged(entry):
+            return all(os.path.exists(os.path.join(self.folder, name)) for name in entry['files'])
         
-        # Кнопки сохранения/отмены
-        button_layout = QHBoxLayout()
+        def write(key, note, text, image_files, entry, old):
+            try:
+                for path, image_name in image_files:
+                    if os.path.exists(path):
+                        shutil.copyfile(path, os.path.join(self.folder, image_name))
+                
+                with open(os.path.join(self.folder, f"{entry['name']}.txt"), 'w', encoding='utf-8') as f:
+                    f.write(text)
+                
+                if old:
+                    self.remove_files(set(old['files']) - set(entry['files']))
+                ok = True
+            except Exception as e:
+                print(f"Ошибка экспорта {note[2]}: {e}")
+                ok = False
+            finally:
+                slots.release()
+            
+            with lock:
+                # Неудачно записанный конспект попадет в следующий экспорт
+                if ok or old:
+                    manifest[key] = entry if ok else old
+            finish(ok)
+        
+        with ThreadPoolExecutor(max_workers=EXPORT_WORKERS) as pool:
+            for note in db.iter_user_note_rows():
+                if self.cancelled.is_set():
+                    break
+                note_id, subject, title, content, images, grade, created_at, updated_at, revision = note[:9]
+                key = str(note_id)
+                old = old_manifest.pop(key, None)
+                
+                if old and old['revision'] == revision and unchanged(old):
+                    with lock:
+                        manifest[key] = old
+                    finish(skip=True)
+                    continue
+                
+                base = safe_filename(title)
+                name = None
+                if old and old['name'] in (base, f"{base} ({note_id})"):
+                    name = old['name']
+                name, image_files = self.planned_files(note, name)
+                
+                image_names = [image_name for path, image_name in image_files]
+                text = note_text(title, subject, created_at, content, image_names)
+                digest = hashlib.sha256('\0'.join([text, images or '']).encode('utf-8')).hexdigest()
+                entry = {
+                    'name': name,
+                    'files': [f"{name}.txt"] + image_names,
+                    'revision': revision,
+                    'hash': digest,
+                }
+                
+                if old and old['hash'] == digest and old['files'] == entry['files'] and unchanged(old):
+                    with lock:
+                        manifest[key] = entry
+                    finish(skip=True)
+                    continue
+                
+                slots.acquire()
+                pool.submit(write, key, note, text, image_files, entry, old)
         
-        save_btn = QPushButton("💾 Сохранить")
-        save_btn.clicked.connect(self.save_note)
-        save_btn.setStyleSheet('background-color: #2ecc71; color: white; font-weight: bold; padding: 8px;')
+        if self.cancelled.is_set():
+            # Необработанные конспекты остаются в манифесте как были
+            manifest.update(old_manifest)
+            removed = 0
+        else:
+            # Оставшиеся записи - конспекты, удаленные после прошлого экспорта
+            for entry in old_manifest.values():
+                self.remove_files(entry['files'])
+            removed = len(old_manifest)
+        self.save_manifest(manifest)
+        
+        return {'exported': done - failed - skipped, 'skipped': skipped, 'removed': removed,
+                'path': self.folder}
+    
+    def export_archive(self, db, total, chunk_size=1024 * 1024):
+        import zipfile
+        
+        stem = os.path.join(self.folder, f"конспекты_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        path = f"{stem}.zip"
+        number = 1
+        while os.path.exists(path):
+            number += 1
+            path = f"{stem}_{number}.zip"
+        
+        # Архив появляется под своим именем, только когда он дописан целиком
+        temp_path = path + '.part'
+        exported = 0
+        
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for note in db.iter_user_note_rows():
+                if self.cancelled.is_set():
+                    break
+                note_id, subject, title, content, images, grade, created_at = note[:7]
+                name, image_files = self.planned_files(note)
+                
+                image_names = []
+                for image_path, image_name in image_files:
+                    if os.path.exists(image_path):
+                        # Изображения уже сжаты, повторно их не упаковываем
+                        with open(image_path, 'rb') as src, \
+                                archive.open(zipfile.ZipInfo(image_name, date_time=time.localtime()[:6]), 'w') as dst:
+                            shutil.copyfileobj(src, dst, chunk_size)
+                        image_names.append(image_name)
+                
+                archive.writestr(f"{name}.txt", note_text(title, subject, created_at, content, image_names))
+                exported += 1
+                self.exporter.progress.emit(exported, total)
         
-        cancel_btn = QPushButton("✕ Отмена")
-        cancel_btn.clicked.connect(self.reject)
-        cancel_btn.setStyleSheet('background-color: #e74c3c; color: white; padding: 8px;')
+        if self.cancelled.is_set():
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        return {'exported': exported, 'path': path}
+
+
+class NoteExporter(QObject):
+    # Сигнал progress: экспортировано конспектов, всего конспектов
+    progress = pyqtSignal(int, int)
+    # Сигнал finished: словарь exported, total, path, cancelled и, при ошибке, error
+    finished = pyqtSignal(object)
+    
+    def __init__(self, db, image_store, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.image_store = image_store
+        self.task = None
+        self.thread_pool = db_thread_pool(self, 1)
+        self.finished.connect(self.on_finished)
+    
+    def start(self, folder, archive=False):
+        self.task = ExportTask(self, folder, archive)
+        self.thread_pool.start(self.task)
+    
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancelled.set()
+    
+    def running(self):
+        return self.task is not None
+    
+    def on_finished(self, result):
+        self.task = None
+    
+    def shutdown(self):
+        self.cancel()
+        self.thread_pool.waitForDone()
+
+
+# ============================================
+# МАССОВЫЙ ИМПОРТ КОНСПЕКТОВ
+# ============================================
+# Строки шапки файла, которые не входят в текст конспекта (формат экспорта)
+IMPORT_HEADER_KEYS = ('Конспект', 'Заголовок', 'Предмет', 'Класс', 'Дата создания', 'Изображения')
+IMPORT_HEADER_RE = re.compile(r'^(%s)\s*:\s*(.*)$' % '|'.join(IMPORT_HEADER_KEYS))
+
+
+def collect_import_files(paths):
+    """Пары (файл, корневая папка) для выбранных файлов и всех .txt/.md в выбранных папках"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend((os.path.join(folder, name), path) for name in sorted(names)
+                             if name.lower().endswith(IMPORT_EXTENSIONS))
+        else:
+            files.append((path, os.path.dirname(path)))
+    return files
+
+
+def read_text_file(path):
+    """Текст файла в UTF-8 (с BOM или без) или, если это не UTF-8, в cp1251"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251', errors='replace')
+
+
+def parse_note_file(path, root, subjects):
+    """Разбирает файл конспекта и возвращает (предмет, заголовок, текст).
+    
+    Заголовок и предмет берутся из шапки вида «Предмет: ...» (как в
+    экспорте) или из заголовка Markdown «# ...». Если предмета в шапке нет,
+    он определяется по ближайшей папке с названием известного предмета,
+    затем просто по ближайшей папке внутри выбранной. subjects - словарь
+    название.casefold() -> название.
+    """
+    lines = read_text_file(path).splitlines()
+    title = os.path.splitext(os.path.basename(path))[0]
+    subject = None
+    
+    body_start = 0
+    for number, line in enumerate(lines):
+        stripped = line.strip()
+        match = IMPORT_HEADER_RE.match(stripped)
+        if match:
+            key, value = match.groups()
+            if key == 'Предмет' and value:
+                subject = value
+            elif key in ('Конспект', 'Заголовок') and value:
+                title = value
+        elif stripped.startswith('# ') and number == body_start:
+            title = stripped[2:].strip() or title
+        elif stripped.startswith('=====') or (not stripped and number == body_start):
+            pass
+        else:
+            break
+        body_start = number + 1
+    
+    if subject is None:
+        relative = os.path.relpath(os.path.dirname(path), root)
+        folders = [] if relative == os.curdir else relative.split(os.sep)
+        for folder in reversed(folders):
+            if folder.casefold() in subjects:
+                subject = subjects[folder.casefold()]
+                break
+        else:
+            subject = folders[-1] if folders else IMPORT_DEFAULT_SUBJECT
+    
+    content = '\n'.join(lines[body_start:]).strip('\n')
+    return subject, title, content
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class ImportTask(QRunnable):
+    """Массовый импорт файлов конспектов.
+    
+    Файлы читаются и разбираются пулом потоков порциями по IMPORT_BATCH.
+    В режиме dry_run в базу ничего не пишется, а результат содержит сводку
+    для предпросмотра. Иначе все файлы сначала разбираются без блокировки
+    записи, а затем конспекты добавляются через executemany одной короткой
+    транзакцией: отмена или ошибка отменяют импорт целиком.
+    """
+    def __init__(self, importer, paths, dry_run=False):
+        super().__init__()
+        self.importer = importer
+        self.paths = paths
+        self.dry_run = dry_run
+        self.cancelled = threading.Event()
+    
+    def parsed_files(self, files, total):
+        """Генератор (файл, (предмет, заголовок, текст) или None, ошибка)"""
+        from concurrent.futures import ThreadPoolExecutor
         
-        button_layout.addStretch()
-        button_layout.addWidget(save_btn)
-        button_layout.addWidget(cancel_btn)
+        subjects = {name.casefold(): name for subject_id, name, color in self.importer.db.get_subjects()}
         
-        main_layout.addLayout(button_layout)
-        self.setLayout(main_layout)
+        def parse(item):
+            path, root = item
+            try:
+                return path, parse_note_file(path, root, subjects), None
+            except Exception as e:
+                return path, None, str(e)
+        
+        done = 0
+        with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+            for start in range(0, len(files), IMPORT_BATCH):
+                for result in pool.map(parse, files[start:start + IMPORT_BATCH]):
+                    if self.cancelled.is_set():
+                        raise ImportCancelled()
+                    done += 1
+                    yield result
+                self.importer.progress.emit(done, total)
+    
+    def run(self):
+        files = collect_import_files(self.paths)
+        total = len(files)
+        self.importer.progress.emit(0, total)
+        result = {'dry_run': self.dry_run, 'paths': self.paths, 'files': total, 'errors': []}
+        
+        try:
+            if self.dry_run:
+                result.update(self.preview(files, total))
+            else:
+                # Разбор идет до транзакции, чтобы не держать блокировку записи
+                # на время чтения файлов
+                rows = list(self.rows(files, total, result['errors']))
+                if self.cancelled.is_set():
+                    raise ImportCancelled()
+                result['imported'] = self.importer.db.add_user_notes(rows)
+        except ImportCancelled:
+            pass
+        except Exception as e:
+            result['error'] = str(e)
+        
+        result['cancelled'] = self.cancelled.is_set()
+        self.importer.finished.emit(result)
+    
+    def rows(self, files, total, errors):
+        for path, parsed, error in self.parsed_files(files, total):
+            if parsed is None:
+                errors.append((path, error))
+            else:
+                subject, title, content = parsed
+                yield subject, title, content, []
+    
+    def preview(self, files, total):
+        subjects = {}
+        sample = []
+        errors = []
+        for path, parsed, error in self.parsed_files(files, total):
+            if parsed is None:
+                errors.append((path, error))
+                continue
+            subject, title, content = parsed
+            subjects[subject] = subjects.get(subject, 0) + 1
+            if len(sample) < IMPORT_PREVIEW_SIZE:
+                sample.append((path, subject, title, len(content)))
+        return {'subjects': subjects, 'sample': sample, 'errors': errors}
+
+
+class BulkImporter(QObject):
+    # Сигнал progress: разобрано файлов, всего файлов
+    progress = pyqtSignal(int, int)
+    # Сигнал finished: словарь с итогами предпросмотра или импорта
+    finished = pyqtSignal(object)
+    
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.task = None
+        self.thread_pool = db_thread_pool(self, 1)
+        self.finished.connect(self.on_finished)
+    
+    def start(self, paths, dry_run=False):
+        self.task = ImportTask(self, paths, dry_run)
+        self.thread_pool.start(self.task)
+    
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancelled.set()
+    
+    def running(self):
+        return self.task is not None
+    
+    def on_finished(self, result):
+        self.task = None
+    
+    def shutdown(self):
+        self.cancel()
+        self.thread_pool.waitForDone()
+
+
+# ============================================
+# АРХИВ БИБЛИОТЕКИ
+# ============================================
+# Архив - файл NDJSON: по одному JSON-объекту на строку. Первая строка -
+# заголовок {"type": "header", ...}, дальше записи subject, note (готовые
+# конспекты), image и user_note. Запись image всегда идет раньше первого
+# ссылающегося на нее конспекта; изображения конспекта перечислены как
+# "<sha256><расширение>". Без встроенных изображений (embed_images=False)
+# при загрузке они ищутся в хранилище по хэшу.
+ARCHIVE_FORMAT = 'school-notes'
+ARCHIVE_VERSION = 1
+
+
+def open_archive(path, mode, name=None):
+    """Открывает архив как текст; сжатие выбирается по расширению name (.gz, .zst).
+    
+    Возвращает (текстовый поток, исходный файл) - по позиции исходного
+    файла считается прогресс чтения.
+    """
+    import io
+    
+    name = name or path
+    raw = open(path, mode + 'b')
+    try:
+        if name.endswith('.gz'):
+            import gzip
+            stream = gzip.GzipFile(fileobj=raw, mode=mode + 'b')
+        elif name.endswith('.zst'):
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("Для архивов .zst установите: pip install zstandard")
+            if mode == 'w':
+                stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+            else:
+                stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=False))
+        else:
+            stream = raw
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='\n'), raw
+    except Exception:
+        raw.close()
+        raise
+
+
+def archive_records(db, image_store, embed_images=True):
+    """Генератор записей архива всей библиотеки"""
+    import base64
+    
+    yield {
+        'type': 'header',
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'created': datetime.now().isoformat(),
+        'embed_images': embed_images,
+    }
+    
+    for subject_id, name, color in db.get_subjects():
+        yield {'type': 'subject', 'name': name, 'color': color}
+    
+    for row in db.iter_rows('''
+        SELECT s.name, n.title, n.content, n.grade, n.created_at
+        FROM notes n JOIN subjects s ON s.id = n.subject_id
+        ORDER BY n.id
+    '''):
+        subject, title, content, grade, created_at = row
+        yield {'type': 'note', 'subject': subject, 'title': title, 'content': content,
+               'grade': grade, 'created_at': created_at}
+    
+    written = {}
+    for note in db.iter_user_note_rows():
+        note_id, subject, title, content, images, grade, created_at, updated_at, revision = note[:9]
+        
+        names = []
+        for reference in json.loads(images) if images else []:
+            if reference not in written:
+                path = image_store.path(reference)
+                if not os.path.exists(path):
+                    written[reference] = None
+                    continue
+                name = file_digest(path) + os.path.splitext(path)[1].lower()
+                written[reference] = name
+                if embed_images:
+                    with open(path, 'rb') as f:
+                        data = base64.b64encode(f.read()).decode('ascii')
+                    yield {'type': 'image', 'name': name, 'data': data}
+            if written[reference]:
+                names.append(written[reference])
+        
+        yield {'type': 'user_note', 'subject': subject, 'title': title, 'content': content,
+               'images': names, 'grade': grade, 'created_at': created_at,
+               'updated_at': updated_at, 'revision': revision}
+
+
+def write_archive(db, image_store, path, embed_images=True, cancelled=None, progress=None):
+    """Записывает архив библиотеки в path. Возвращает число записей"""
+    temp_path = path + '.part'
+    count = 0
+    
+    stream, raw = open_archive(temp_path, 'w', name=path)
+    try:
+        with raw, stream:
+            for record in archive_records(db, image_store, embed_images):
+                if cancelled is not None and cancelled.is_set():
+                    break
+                stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+                if progress and count % 100 == 0:
+                    progress(count)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    
+    if cancelled is not None and cancelled.is_set():
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, path)
+    return count
+
+
+def read_archive(path, progress=None):
+    """Генератор пар (номер строки, запись) архива"""
+    stream, raw = open_archive(path, 'r')
+    with raw, stream:
+        header = None
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if header is None:
+                header = record
+                if record.get('type') != 'header' or record.get('format') != ARCHIVE_FORMAT:
+                    raise ValueError("Файл не является архивом конспектов")
+                if record.get('version', 0) > ARCHIVE_VERSION:
+                    raise ValueError("Архив создан более новой версией приложения")
+            yield number, record
+            if progress and number % 100 == 0:
+                progress(raw.tell())
+
+
+def load_archive(db, image_store, path, batch_size=ARCHIVE_BATCH, cancelled=None, progress=None):
+    """Загружает архив в библиотеку порциями по batch_size записей.
     
-    def load_existing_data(self):
-        if 'subject' in self.note_data:
-            index = self.subject_combo.findText(self.note_data['subject'])
-            if index >= 0:
-                self.subject_combo.setCurrentIndex(index)
-        
-        if 'title' in self.note_data:
-            self.title_edit.setText(self.note_data['title'])
-        
-        if 'content' in self.note_data:
-            self.content_edit.setPlainText(self.note_data['content'])
-        
-        if 'images' in self.note_data:
-            self.images = self.note_data['images']
-            for img in self.images:
-                self.image_list.addItem(os.path.basename(img))
+    Каждая порция записывается одной транзакцией вместе с номером последней
+    строки в app_meta, поэтому прерванную загрузку того же архива можно
+    продолжить: уже записанные строки пропускаются. Возвращает словарь
+    с числом загруженных конспектов и ненайденных изображений.
+    """
+    import base64
     
-    def format_text(self, style):
-        cursor = self.content_edit.textCursor()
+    stat = os.stat(path)
+    archive_key = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    checkpoint = json.loads(db.get_meta('archive_import', 'null') or 'null')
+    skip_until = checkpoint['line'] if checkpoint and checkpoint['archive'] == archive_key else 0
+    
+    subjects, notes, user_notes = [], [], []
+    images = {}
+    result = {'notes': 0, 'user_notes': 0, 'missing_images': 0, 'resumed_from': skip_until}
+    incoming = image_store.incoming_directory
+    last_line = skip_until
+    
+    def flush(line):
+        added_notes, added_user_notes = db.import_archive_batch(
+            subjects, notes, user_notes, json.dumps({'archive': archive_key, 'line': line})
+        )
+        result['notes'] += added_notes
+        result['user_notes'] += added_user_notes
+        subjects.clear()
+        notes.clear()
+        user_notes.clear()
+    
+    pending = 0
+    for number, record in read_archive(path, progress):
+        if cancelled is not None and cancelled.is_set():
+            break
+        kind = record.get('type')
+        
+        if kind == 'image':
+            # Изображения сохраняются и до точки продолжения: повторно по хэшу
+            # они не дублируются, а ссылки на них нужны следующим конспектам
+            name = record['name']
+            digest, extension = os.path.splitext(name)
+            found = image_store.find(digest, extension)
+            if found is None:
+                os.makedirs(incoming, exist_ok=True)
+                temp_path = os.path.join(incoming, f"archive_{threading.get_ident()}{extension}")
+                with open(temp_path, 'wb') as f:
+                    f.write(base64.b64decode(record['data']))
+                try:
+                    found = image_store.add(temp_path)
+                finally:
+                    os.remove(temp_path)
+            images[name] = found
+            continue
+        
+        if number <= skip_until:
+            continue
+        
+        if kind == 'subject':
+            subjects.append((record['name'], record.get('color')))
+        elif kind == 'note':
+            notes.append((record['subject'], record['title'], record['content'],
+                          record.get('grade', 1), record.get('created_at')))
+        elif kind == 'user_note':
+            references = []
+            for name in record.get('images', []):
+                if name not in images:
+                    digest, extension = os.path.splitext(name)
+                    images[name] = image_store.find(digest, extension)
+                if images[name]:
+                    references.append(images[name])
+                else:
+                    result['missing_images'] += 1
+            user_notes.append((record['subject'], record['title'], record['content'],
+                               references, record.get('grade', 1), record.get('created_at'),
+                               record.get('updated_at'), record.get('revision', 1)))
+        else:
+            continue
         
-        if style == 'bold':
-            format = QTextCharFormat()
-            format.setFontWeight(QFont.Bold)
-            cursor.mergeCharFormat(format)
-        elif style == 'italic':
-            format = QTextCharFormat()
-            format.setFontItalic(True)
-            cursor.mergeCharFormat(format)
-        elif style == 'bullet':
-            self.content_edit.insertPlainText('• ')
+        last_line = number
+        pending += 1
+        if pending >= batch_size:
+            flush(last_line)
+            pending = 0
     
-    def insert_template(self, template_type):
-        templates = {
-            'math': '''📌 ТЕМА:
-• Правило 1
-• Правило 2
-• Правило 3
+    if pending:
+        flush(last_line)
+    
+    result['cancelled'] = cancelled is not None and cancelled.is_set()
+    if not result['cancelled']:
+        db.set_meta('archive_import', None)
+    return result
 
-🎯 ПРИМЕРЫ:
-1) Пример 1
-2) Пример 2
-3) Пример 3
 
-❗ ЗАПОМНИ:
-Важное правило''',
-            
-            'reading': '''📖 ПРОИЗВЕДЕНИЕ:
-Автор: 
-Жанр: 
+class ArchiveTask(QRunnable):
+    def __init__(self, archiver, path, load=False, embed_images=True):
+        super().__init__()
+        self.archiver = archiver
+        self.path = path
+        self.load = load
+        self.embed_images = embed_images
+        self.cancelled = threading.Event()
+    
+    def run(self):
+        archiver = self.archiver
+        result = {'load': self.load, 'path': self.path}
+        try:
+            if self.load:
+                total = os.path.getsize(self.path)
+                archiver.progress.emit(0, total)
+                result.update(load_archive(
+                    archiver.db, archiver.image_store, self.path, cancelled=self.cancelled,
+                    progress=lambda done: archiver.progress.emit(done, total)
+                ))
+            else:
+                db = archiver.db
+                cursor = db.pool.reader().cursor()
+                cursor.execute('SELECT (SELECT COUNT(*) FROM subjects) + (SELECT COUNT(*) FROM notes)'
+                               ' + (SELECT COUNT(*) FROM user_notes)')
+                total = cursor.fetchone()[0]
+                archiver.progress.emit(0, total)
+                result['records'] = write_archive(
+                    db, archiver.image_store, self.path, self.embed_images, self.cancelled,
+                    progress=lambda done: archiver.progress.emit(min(done, total), total)
+                )
+        except Exception as e:
+            result['error'] = str(e)
+        
+        result['cancelled'] = self.cancelled.is_set()
+        archiver.finished.emit(result)
 
-👥 ГЕРОИ:
-• Персонаж 1
-• Персонаж 2
 
-🎯 ГЛАВНАЯ МЫСЛЬ:
-Текст главной мысли''',
-            
-            'world': '''🌍 ТЕМА:
-📅 Время года/период:
-📍 Место:
+class LibraryArchiver(QObject):
+    # Сигнал progress: сделано, всего (записей при сохранении, байтов при загрузке)
+    progress = pyqtSignal(int, int)
+    # Сигнал finished: словарь с итогами
+    finished = pyqtSignal(object)
+    
+    def __init__(self, db, image_store, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.image_store = image_store
+        self.task = None
+        self.thread_pool = db_thread_pool(self, 1)
+        self.finished.connect(self.on_finished)
+    
+    def start(self, path, load=False, embed_images=True):
+        self.task = ArchiveTask(self, path, load, embed_images)
+        self.thread_pool.start(self.task)
+    
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancelled.set()
+    
+    def running(self):
+        return self.task is not None
+    
+    def on_finished(self, result):
+        self.task = None
+    
+    def shutdown(self):
+        self.cancel()
+        self.thread_pool.waitForDone()
 
-📌 ОСОБЕННОСТИ:
-• Особенность 1
-• Особенность 2
-• Особенность 3
 
-🖼️ ИЛЛЮСТРАЦИИ:
-[описание изображения]'''
-        }
-        
-        if template_type in templates:
-            self.content_edit.insertPlainText(templates[template_type])
+# ============================================
+# РЕЗЕРВНЫЕ КОПИИ
+# ============================================
+def create_backup(db, directory='backups', pages=BACKUP_PAGES, cancelled=None, progress=None):
+    """Копирует работающую базу в directory/school_notes_<время>.db.gz.
     
-    def upload_image(self):
-        file_dialog = QFileDialog()
-        file_dialog.setNameFilter("Изображения (*.png *.jpg *.jpeg *.bmp *.gif)")
-        file_dialog.setFileMode(QFileDialog.ExistingFiles)
+    Копия снимается через sqlite3 backup API порциями по pages страниц,
+    так что запись в базу не блокируется надолго. Перед сжатием копия
+    проверяется через PRAGMA integrity_check. Возвращает путь к копии.
+    """
+    import gzip
+    
+    os.makedirs(directory, exist_ok=True)
+    name = f"school_notes_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    path = os.path.join(directory, name + '.db.gz')
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = os.path.join(directory, f"{name}_{number}.db.gz")
+    temp_path = path[:-len('.gz')] + '.part'
+    
+    def step(status, remaining, total):
+        if cancelled is not None and cancelled.is_set():
+            raise InterruptedError()
+        if progress:
+            progress(total - remaining, total)
+    
+    try:
+        source = db.pool.connect()
+        target = sqlite3.connect(temp_path)
+        try:
+            source.backup(target, pages=pages, progress=step)
+            check = target.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+        if check != 'ok':
+            raise RuntimeError(f"Копия базы повреждена: {check}")
+        
+        with open(temp_path, 'rb') as src, gzip.open(path + '.part', 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(path + '.part', path)
+    finally:
+        for leftover in (temp_path, path + '.part'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return path
+
+
+def list_backups(directory='backups'):
+    """Резервные копии от новых к старым"""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory)
+             if name.startswith('school_notes_') and name.endswith('.db.gz')]
+    return [os.path.join(directory, name) for name in sorted(names, reverse=True)]
+
+
+def rotate_backups(directory='backups', keep=BACKUP_KEEP):
+    """Удаляет резервные копии старше keep последних"""
+    for path in list_backups(directory)[keep:]:
+        os.remove(path)
+
+
+def restore_backup(db, path, pages=BACKUP_PAGES):
+    """Заменяет содержимое работающей базы копией из path (.db.gz или .db).
+    
+    Копия распаковывается и проверяется до того, как база будет изменена;
+    запись идет через backup API на пишущее соединение, поэтому остальные
+    соединения пула сразу видят восстановленные данные. Копирование и
+    миграции выполняются под одной блокировкой записи, чтобы другие записи
+    не попали в базу со старой схемой.
+    """
+    import gzip
+    
+    temp_path = os.path.join(os.path.dirname(path) or '.', 'restore.db.part')
+    try:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as src, open(temp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        
+        source = sqlite3.connect(temp_path)
+        try:
+            check = source.execute('PRAGMA integrity_check').fetchone()[0]
+            if check != 'ok':
+                raise RuntimeError(f"Резервная копия повреждена: {check}")
+            with db.pool.write_lock:
+                with db.pool.write() as conn:
+                    source.backup(conn, pages=pages)
+                # Копия могла быть сделана более старой версией приложения;
+                # миграции идут мимо pool.write(), поэтому номер меняем сами
+                db.create_tables()
+                db.pool.version += 1
+        finally:
+            source.close()
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class BackupTask(QRunnable):
+    def __init__(self, manager, restore_path=None, automatic=False):
+        super().__init__()
+        self.manager = manager
+        self.restore_path = restore_path
+        self.automatic = automatic
+        self.cancelled = threading.Event()
+    
+    def run(self):
+        manager = self.manager
+        result = {'restore': self.restore_path is not None, 'automatic': self.automatic}
+        try:
+            # Перед восстановлением сохраняем текущее состояние
+            result['path'] = create_backup(
+                manager.db, manager.directory, cancelled=self.cancelled,
+                progress=lambda done, total: manager.progress.emit(done, total)
+            )
+            # После начала восстановления отмена уже не действует
+            if self.restore_path is not None and not self.cancelled.is_set():
+                restore_backup(manager.db, self.restore_path)
+                result['restored'] = True
+            rotate_backups(manager.directory, manager.keep)
+        except InterruptedError:
+            pass
+        except Exception as e:
+            result['error'] = str(e)
+        
+        result['cancelled'] = self.cancelled.is_set() and not result.get('restored')
+        manager.finished.emit(result)
+
+
+class BackupManager(QObject):
+    """Резервные копии базы в папке backups: по запросу, по расписанию
+    (если последней копии больше BACKUP_INTERVAL_HOURS часов) и перед
+    восстановлением. Хранятся keep последних копий.
+    """
+    # Сигнал progress: скопировано страниц, всего страниц
+    progress = pyqtSignal(int, int)
+    # Сигнал finished: словарь path, restore, automatic, cancelled и, при ошибке, error
+    finished = pyqtSignal(object)
+    
+    def __init__(self, db, directory='backups', keep=BACKUP_KEEP, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.directory = directory
+        self.keep = keep
+        self.task = None
+        self.thread_pool = db_thread_pool(self, 1)
+        self.finished.connect(self.on_finished)
+        
+        self.timer = QTimer(self)
+        self.timer.setInterval(60 * 60 * 1000)
+        self.timer.timeout.connect(self.backup_if_due)
+    
+    def start(self, restore_path=None, automatic=False):
+        if self.task is not None:
+            return False
+        self.task = BackupTask(self, restore_path, automatic)
+        self.thread_pool.start(self.task)
+        return True
+    
+    def schedule(self):
+        """Проверяет каждый час, не пора ли сделать резервную копию"""
+        self.timer.start()
+        self.backup_if_due()
+    
+    def backup_if_due(self):
+        backups = list_backups(self.directory)
+        if backups and time.time() - os.path.getmtime(backups[0]) < BACKUP_INTERVAL_HOURS * 3600:
+            return
+        self.start(automatic=True)
+    
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancelled.set()
+    
+    def running(self):
+        return self.task is not None
+    
+    def on_finished(self, result):
+        self.task = None
+    
+    def shutdown(self):
+        self.timer.stop()
+        self.cancel()
+        self.thread_pool.waitForDone()
+
+
+# ============================================
+# МОДЕЛЬ И ДЕЛЕГАТ СПИСКА КОНСПЕКТОВ
+# ============================================
+class NoteListModel(QAbstractListModel):
+    """Модель списка конспектов, подгружающая строки порциями.
+    
+    Строка модели - кортеж (kind, id, title, subject, color, preview),
+    где kind - 'header', 'note' (готовый) или 'user' (пользовательский).
+    Перед группой готовых конспектов одного предмета вставляется заголовок.
+    
+    Страницы запрашиваются через AsyncDatabase: fetchMore() только ставит
+    запрос в очередь, а строки добавляются, когда он выполнится.
+    """
+    ItemRole = Qt.UserRole + 1
+    
+    # Сигнал loaded: запрошенная страница добавлена в модель
+    loaded = pyqtSignal()
+    
+    def __init__(self, async_db, parent=None):
+        super().__init__(parent)
+        self.async_db = async_db
+        self.items = []
+        self.last_subject = None
+        self.fetch_page = None
+        self.after = None
+        self.exhausted = True
+        self.task = None
+    
+    def set_rows(self, rows):
+        """Показывает готовый список строк"""
+        self.reset(None)
+        self.append_rows(rows)
+    
+    def set_pages(self, fetch_page):
+        """Подгружает строки страницами по мере прокрутки.
         
-        if file_dialog.exec_():
-            filenames = file_dialog.selectedFiles()
-            for filename in filenames:
-                # Копируем изображение в папку приложения
-                app_images_dir = "user_images"
-                os.makedirs(app_images_dir, exist_ok=True)
-                
-                dest_filename = f"{int(datetime.now().timestamp())}_{os.path.basename(filename)}"
-                dest_path = os.path.join(app_images_dir, dest_filename)
-                
-                try:
-                    shutil.copy2(filename, dest_path)
-                    self.images.append(dest_path)
-                    self.image_list.addItem(dest_filename)
-                except Exception as e:
-                    QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить изображение:\n{str(e)}")
+        fetch_page(after=курсор) выполняется в фоновом потоке и возвращает
+        (строки, курсор следующей страницы или None).
+        """
+        self.reset(fetch_page)
+        self.fetchMore()
     
-    def capture_photo(self):
-        # Заглушка для функции фото
-        QMessageBox.information(self, "Информация", "Функция фото будет добавлена в будущей версии")
+    def reset(self, fetch_page):
+        # Ответ на запрос прежнего списка сюда уже не попадет
+        if self.task is not None:
+            self.async_db.cancel(self.task.task_id)
+            self.task = None
+        
+        self.beginResetModel()
+        self.items = []
+        self.last_subject = None
+        self.fetch_page = fetch_page
+        self.after = None
+        self.exhausted = fetch_page is None
+        self.endResetModel()
     
-    def remove_image(self):
-        selected_items = self.image_list.selectedItems()
-        if not selected_items:
+    def loading(self):
+        return self.task is not None
+    
+    def append_rows(self, rows):
+        items = []
+        for row in rows:
+            if row[0] == 'note' and row[3] != self.last_subject:
+                self.last_subject = row[3]
+                items.append(('header', None, row[3], row[3], row[4], ''))
+            items.append(row)
+        
+        if items:
+            first = len(self.items)
+            self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+            self.items.extend(items)
+            self.endInsertRows()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.items)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.items):
+            return None
+        
+        item = self.items[index.row()]
+        if role == Qt.DisplayRole:
+            return item[2]
+        if role == self.ItemRole:
+            return item
+        return None
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if self.items[index.row()][0] == 'header':
+            return Qt.ItemIsEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and self.task is None
+    
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
             return
+        self.task = self.async_db.submit(self.fetch_page, after=self.after,
+                                         callback=self.on_page, errback=self.on_page_failed)
+    
+    def on_page(self, result):
+        self.task = None
+        rows, self.after = result
+        self.exhausted = self.after is None
+        self.append_rows(rows)
+        self.loaded.emit()
+    
+    def on_page_failed(self, exception):
+        self.task = None
+        self.exhausted = True
+        self.loaded.emit()
+        self.async_db.error.emit(str(exception))
+
+
+class NoteCardDelegate(QStyledItemDelegate):
+    """Рисует карточки конспектов вместо отдельных виджетов"""
+    actionTriggered = pyqtSignal(str, object)
+    
+    HEADER_HEIGHT = 50
+    CARD_HEIGHT = 140
+    
+    # Кнопки карточки: (действие, текст, цвет фона)
+    ACTIONS = {
+        'note': [
+            ('view', '👁️ Просмотр', None),
+            ('copy', '💾 Сохранить копию', '#2ecc71'),
+        ],
+        'user': [
+            ('view', '👁️ Просмотр', None),
+            ('edit', '✏️ Редактировать', '#f39c12'),
+            ('delete', '🗑️ Удалить', '#e74c3c'),
+        ],
+    }
+    
+    def __init__(self, parent=None, theme=None):
+        super().__init__(parent)
+        self.theme = theme
         
-        for item in selected_items:
-            row = self.image_list.row(item)
-            self.image_list.takeItem(row)
-            
-            # Удаляем файл
-            if row < len(self.images):
-                try:
-                    if os.path.exists(self.images[row]):
-                        os.remove(self.images[row])
-                except:
-                    pass
-                self.images.pop(row)
+        self.title_font = QFont()
+        self.title_font.setPixelSize(16)
+        self.title_font.setBold(True)
+        
+        self.subject_font = QFont()
+        self.subject_font.setBold(True)
+        
+        self.small_font = QFont()
+        self.small_font.setPixelSize(12)
+        
+        self.text_font = QFont()
     
-    def save_note(self):
-        subject = self.subject_combo.currentText().strip()
-        title = self.title_edit.text().strip()
-        content = self.content_edit.toPlainText().strip()
+    def sizeHint(self, option, index):
+        item = index.data(NoteListModel.ItemRole)
+        height = self.HEADER_HEIGHT if item[0] == 'header' else self.CARD_HEIGHT
+        return QSize(option.rect.width(), height)
+    
+    def card_rect(self, rect):
+        return rect.adjusted(5, 5, -5, -5)
+    
+    def button_rects(self, rect, kind):
+        """Возвращает кнопки карточки вместе с их прямоугольниками"""
+        card = self.card_rect(rect)
+        metrics = QFontMetrics(self.text_font)
+        x = card.left() + 10
+        y = card.bottom() - 10 - 26
+        
+        buttons = []
+        for action, text, color in self.ACTIONS.get(kind, []):
+            width = metrics.horizontalAdvance(text) + 20
+            buttons.append((action, text, color, QRect(x, y, width, 26)))
+            x += width + 6
+        return buttons
+    
+    def paint(self, painter, option, index):
+        item = index.data(NoteListModel.ItemRole)
+        kind, note_id, title, subject, color, preview = item
+        colors = self.theme.colors if self.theme else THEMES['light']
+        
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        
+        if kind == 'header':
+            rect = option.rect.adjusted(0, 15, 0, 0)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(colors['header']))
+            painter.drawRoundedRect(rect, 5, 5)
+            
+            painter.setFont(self.title_font)
+            painter.setPen(QColor(colors['header_text']))
+            painter.drawText(rect.adjusted(10, 0, -10, 0), Qt.AlignVCenter | Qt.AlignLeft, title)
+            painter.restore()
+            return
         
-        # Валидация
-        errors = []
+        card = self.card_rect(option.rect)
+        hovered = bool(option.state & QStyle.State_MouseOver)
+        painter.setPen(QPen(QColor(colors['accent'] if hovered else colors['frame']), 1))
+        painter.setBrush(QColor(colors['card_hover'] if hovered else colors['card']))
+        painter.drawRoundedRect(card, 8, 8)
         
-        if not subject:
-            errors.append("Выберите предмет")
+        inner = card.adjusted(10, 8, -10, -8)
         
-        if not title:
-            errors.append("Введите название конспекта")
+        # Заголовок
+        painter.setFont(self.title_font)
+        painter.setPen(QColor(colors['text']))
+        title_rect = QRect(inner.left(), inner.top(), inner.width(), 24)
+        painter.drawText(title_rect, Qt.AlignVCenter | Qt.AlignLeft,
+                         QFontMetrics(self.title_font).elidedText(title, Qt.ElideRight, title_rect.width()))
+        
+        # Предмет и класс
+        subject_rect = QRect(inner.left(), title_rect.bottom() + 2, inner.width(), 22)
+        painter.setFont(self.subject_font)
+        painter.setPen(QColor(color or '#3498db'))
+        painter.drawText(subject_rect, Qt.AlignVCenter | Qt.AlignLeft, subject or 'Предмет')
+        
+        painter.setFont(self.small_font)
+        grade_text = "1 класс"
+        grade_width = QFontMetrics(self.small_font).horizontalAdvance(grade_text) + 16
+        grade_rect = QRect(subject_rect.right() - grade_width, subject_rect.top() + 2, grade_width, 18)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor('#3498db'))
+        painter.drawRoundedRect(grade_rect, 9, 9)
+        painter.setPen(Qt.white)
+        painter.drawText(grade_rect, Qt.AlignCenter, grade_text)
         
-        if not content:
-            errors.append("Введите содержание конспекта")
+        # Краткое содержание
+        painter.setFont(self.text_font)
+        painter.setPen(QColor(colors['muted']))
+        preview_rect = QRect(inner.left(), subject_rect.bottom() + 4, inner.width(), 20)
+        painter.drawText(preview_rect, Qt.AlignVCenter | Qt.AlignLeft,
+                         QFontMetrics(self.text_font).elidedText(preview, Qt.ElideRight, preview_rect.width()))
         
-        if errors:
-            QMessageBox.warning(self, "Ошибка", "Исправьте следующие ошибки:\n• " + "\n• ".join(errors))
-            return
+        # Кнопки
+        for action, text, button_color, rect in self.button_rects(option.rect, kind):
+            painter.setPen(QPen(QColor(button_color or colors['border']), 1))
+            painter.setBrush(QColor(button_color or colors['button']))
+            painter.drawRoundedRect(rect, 4, 4)
+            painter.setPen(Qt.white if button_color else QColor(colors['text']))
+            painter.drawText(rect, Qt.AlignCenter, text)
+        
+        painter.restore()
+    
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            item = index.data(NoteListModel.ItemRole)
+            for action, text, color, rect in self.button_rects(option.rect, item[0]):
+                if rect.contains(event.pos()):
+                    self.actionTriggered.emit(action, item)
+                    return True
+        return super().editorEvent(event, model, option, index)
+
+
+class NotesPage(QWidget):
+    """Страница со списком конспектов, обновляемая на месте"""
+    def __init__(self, on_action, async_db, parent=None, theme=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
         
-        self.note_data = {
-            'subject': subject,
-            'title': title,
-            'content': content,
-            'images': self.images,
-            'grade': 1
-        }
+        # Заголовок
+        self.title_label = QLabel()
+        self.title_label.setObjectName('pageTitle')
+        layout.addWidget(self.title_label)
+        
+        # Сообщение, если конспектов нет
+        self.empty_label = QLabel("Конспектов не найдено")
+        self.empty_label.setObjectName('emptyLabel')
+        self.empty_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.empty_label)
+        
+        self.model = NoteListModel(async_db, parent=self)
+        self.model.loaded.connect(self.update_empty)
+        
+        # Действия выполняем после возврата из обработчика клика,
+        # потому что они могут перезагрузить эту же модель
+        self.delegate = NoteCardDelegate(self, theme)
+        self.delegate.actionTriggered.connect(on_action, Qt.QueuedConnection)
+        
+        self.view = QListView()
+        self.view.setModel(self.model)
+        self.view.setItemDelegate(self.delegate)
+        self.view.setMouseTracking(True)
+        self.view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.view.setObjectName('noteList')
+        self.view.doubleClicked.connect(
+            lambda index: on_action('view', index.data(NoteListModel.ItemRole))
+        )
+        layout.addWidget(self.view)
+    
+    def set_content(self, title, rows=None, fetch_page=None):
+        """Показывает новые строки, не пересоздавая виджеты: готовый список
+        rows или страницы fetch_page, которые подгружаются по мере прокрутки"""
+        self.title_label.setText(f"📚 {title.title()}")
         
-        self.accept()
+        if fetch_page is not None:
+            self.model.set_pages(fetch_page)
+        else:
+            self.model.set_rows(rows)
+        self.update_empty()
+        self.view.scrollToTop()
     
-    def get_note_data(self):
-        return self.note_data
+    def update_empty(self):
+        # Пока загружается первая страница, сообщение о пустом списке не показываем
+        has_notes = self.model.rowCount() > 0 or self.model.loading()
+        self.empty_label.setVisible(not has_notes)
+        self.view.setVisible(has_notes)
+
+
+class ViewManager:
+    """Держит в QStackedWidget ограниченное число страниц (LRU).
+    
+    Страницы различаются ключом вида: ('all',), ('user',),
+    ('subject', subject_id) или ('search',). Страница поиска одна: новый
+    запрос обновляет ее модель, а не вытесняет страницы других видов.
+    Вытесненные страницы удаляются из стека и уничтожаются.
+    """
+    def __init__(self, stack, create_page, max_pages=VIEW_CACHE_SIZE):
+        self.stack = stack
+        self.create_page = create_page
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+    
+    def page(self, key):
+        """Возвращает страницу для ключа, создавая ее при необходимости"""
+        if key in self.pages:
+            self.pages.move_to_end(key)
+            return self.pages[key]
+        
+        page = self.create_page()
+        self.pages[key] = page
+        self.stack.addWidget(page)
+        
+        while len(self.pages) > self.max_pages:
+            old_key, old_page = self.pages.popitem(last=False)
+            self.stack.removeWidget(old_page)
+            old_page.deleteLater()
+        
+        return page
+    
+    def show(self, key):
+        self.stack.setCurrentWidget(self.page(key))
+    
+    def current_key(self):
+        current = self.stack.currentWidget()
+        for key, page in self.pages.items():
+            if page is current:
+                return key
+        return None
 
 
 # ============================================
 # ГЛАВНОЕ ОКНО ПРИЛОЖЕНИЯ
 # ============================================
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, profiler=None, db_path='school_notes.db'):
         super().__init__()
-        self.db = Database()
-        self.current_notes = []
+        self.profiler = profiler
+        self.subject_ids = {}
+        self.search_keyword = ''
+        
+        self.db = Database(db_path)
+        self.mark('database')
+        
+        self.theme = ThemeEngine(parent=self)
+        self.theme.apply(self.db.get_meta('theme', 'light'))
+        
+        self.async_db = AsyncDatabase(self.db, self)
+        self.thumbnails = ThumbnailCache(parent=self)
+        self.image_store = ImageStore(self.db)
+        self.ingestor = ImageIngestor(self.image_store, self)
+        self.exporter = NoteExporter(self.db, self.image_store, self)
+        self.exporter.progress.connect(self.on_job_progress)
+        self.exporter.finished.connect(self.on_export_finished)
+        self.importer = BulkImporter(self.db, self)
+        self.importer.progress.connect(self.on_job_progress)
+        self.importer.finished.connect(self.on_import_finished)
+        self.archiver = LibraryArchiver(self.db, self.image_store, self)
+        self.archiver.progress.connect(self.on_job_progress)
+        self.archiver.finished.connect(self.on_archive_finished)
+        self.backups = BackupManager(self.db, parent=self)
+        self.backups.progress.connect(self.on_backup_progress)
+        self.backups.finished.connect(self.on_backup_finished)
+        self.progress_dialog = None
+        self.search_cache = SearchCache(self.db)
+        self.render_cache = RenderCache(self.db)
+        self.async_db.error.connect(
+            lambda message: self.statusBar().showMessage(f"Ошибка базы данных: {message}", 5000)
+        )
         self.initUI()
-        self.load_initial_data()
+        self.mark('main_window')
         
         # Создаем необходимые папки
         self.create_folders()
+        
+        # Предметы и статистику загружаем в фоне, когда окно уже показано
+        QTimer.singleShot(0, self.load_initial_data)
+    
+    def mark(self, phase):
+        if self.profiler is not None:
+            self.profiler.mark(phase)
     
     def create_folders(self):
-        folders = ['user_images', 'exports', 'backups']
+        folders = ['user_images', 'exports', 'backups', 'thumbnails']
         for folder in folders:
             os.makedirs(folder, exist_ok=True)
     
@@ -946,15 +4423,7 @@ class MainWindow(QMainWindow):
         
         # Логотип и заголовок
         logo_label = QLabel("📚 ШКОЛЬНЫЕ\nКОНСПЕКТЫ")
-        logo_label.setStyleSheet('''
-            font-size: 20px;
-            font-weight: bold;
-            color: #2c3e50;
-            padding: 15px;
-            background-color: #ecf0f1;
-            border-radius: 10px;
-            text-align: center;
-        ''')
+        logo_label.setObjectName('logo')
         logo_label.setAlignment(Qt.AlignCenter)
         sidebar_layout.addWidget(logo_label)
         
@@ -966,7 +4435,14 @@ class MainWindow(QMainWindow):
         
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Введите запрос...")
-        self.search_input.textChanged.connect(self.on_search)
+        
+        # Поиск при вводе запускается после паузы в наборе
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.on_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.search_input.returnPressed.connect(self.on_search)
         
         search_layout.addWidget(self.search_input)
         search_group.setLayout(search_layout)
@@ -977,22 +4453,12 @@ class MainWindow(QMainWindow):
         # Предметы
         subjects_group = QGroupBox("📖 Предметы")
         subjects_layout = QVBoxLayout()
+        self.subjects_layout = subjects_layout
         
         self.all_notes_btn = QPushButton("📚 Все конспекты")
         self.all_notes_btn.clicked.connect(self.show_all_notes)
-        self.all_notes_btn.setStyleSheet('''
-            QPushButton {
-                text-align: left;
-                padding: 10px;
-                font-size: 14px;
-                border: none;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #3498db;
-                color: white;
-            }
-        ''')
+        self.all_notes_btn.setObjectName('allNotesButton')
+        self.all_notes_btn.setProperty('nav', True)
         subjects_layout.addWidget(self.all_notes_btn)
         
         subjects_layout.addWidget(QLabel(" "))
@@ -1010,56 +4476,20 @@ class MainWindow(QMainWindow):
         
         self.my_notes_btn = QPushButton("📓 Мои записи")
         self.my_notes_btn.clicked.connect(self.show_user_notes)
-        self.my_notes_btn.setStyleSheet('''
-            QPushButton {
-                text-align: left;
-                padding: 10px;
-                font-size: 14px;
-                border: none;
-                border-radius: 5px;
-                background-color: #f39c12;
-                color: white;
-            }
-            QPushButton:hover {
-                background-color: #e67e22;
-            }
-        ''')
+        self.my_notes_btn.setObjectName('myNotesButton')
+        self.my_notes_btn.setProperty('nav', True)
         my_notes_layout.addWidget(self.my_notes_btn)
         
         create_note_btn = QPushButton("✏️ Создать конспект")
         create_note_btn.clicked.connect(self.create_user_note)
-        create_note_btn.setStyleSheet('''
-            QPushButton {
-                text-align: left;
-                padding: 10px;
-                font-size: 14px;
-                border: none;
-                border-radius: 5px;
-                background-color: #2ecc71;
-                color: white;
-            }
-            QPushButton:hover {
-                background-color: #27ae60;
-            }
-        ''')
+        create_note_btn.setObjectName('createNoteButton')
+        create_note_btn.setProperty('nav', True)
         my_notes_layout.addWidget(create_note_btn)
         
         import_note_btn = QPushButton("📥 Импорт из файла")
         import_note_btn.clicked.connect(self.import_note)
-        import_note_btn.setStyleSheet('''
-            QPushButton {
-                text-align: left;
-                padding: 10px;
-                font-size: 14px;
-                border: none;
-                border-radius: 5px;
-                background-color: #9b59b6;
-                color: white;
-            }
-            QPushButton:hover {
-                background-color: #8e44ad;
-            }
-        ''')
+        import_note_btn.setObjectName('importNoteButton')
+        import_note_btn.setProperty('nav', True)
         my_notes_layout.addWidget(import_note_btn)
         
         my_notes_group.setLayout(my_notes_layout)
@@ -1073,12 +4503,12 @@ class MainWindow(QMainWindow):
         
         self.stats_label = QLabel("Загрузка...")
         self.stats_label.setWordWrap(True)
-        self.stats_label.setStyleSheet('font-size: 12px; color: #7f8c8d;')
+        self.stats_label.setObjectName('statsLabel')
         stats_layout.addWidget(self.stats_label)
         
         refresh_stats_btn = QPushButton("🔄 Обновить")
         refresh_stats_btn.clicked.connect(self.update_statistics)
-        refresh_stats_btn.setStyleSheet('padding: 5px;')
+        refresh_stats_btn.setObjectName('refreshStatsButton')
         stats_layout.addWidget(refresh_stats_btn)
         
         stats_group.setLayout(stats_layout)
@@ -1091,6 +4521,7 @@ class MainWindow(QMainWindow):
         # Основная область
         self.main_area = QStackedWidget()
         main_layout.addWidget(self.main_area)
+        self.views = ViewManager(self.main_area, lambda: NotesPage(self.on_note_action, self.async_db, theme=self.theme))
         
         # Создаем начальный экран
         self.create_welcome_screen()
@@ -1115,12 +4546,44 @@ class MainWindow(QMainWindow):
         import_action.triggered.connect(self.import_note)
         file_menu.addAction(import_action)
         
+        bulk_import_action = QAction('Импорт папки или нескольких файлов...', self)
+        bulk_import_action.triggered.connect(self.bulk_import)
+        file_menu.addAction(bulk_import_action)
+        
         export_action = QAction('Экспорт всех...', self)
         export_action.triggered.connect(self.export_all_notes)
         file_menu.addAction(export_action)
         
         file_menu.addSeparator()
         
+        save_archive_action = QAction('Сохранить архив библиотеки...', self)
+        save_archive_action.triggered.connect(self.save_library_archive)
+        file_menu.addAction(save_archive_action)
+        
+        load_archive_action = QAction('Загрузить архив библиотеки...', self)
+        load_archive_action.triggered.connect(self.load_library_archive)
+        file_menu.addAction(load_archive_action)
+        
+        file_menu.addSeparator()
+        
+        backup_action = QAction('Создать резервную копию', self)
+        backup_action.triggered.connect(self.create_backup)
+        file_menu.addAction(backup_action)
+        
+        restore_action = QAction('Восстановить из резервной копии...', self)
+        restore_action.triggered.connect(self.restore_backup)
+        file_menu.addAction(restore_action)
+        
+        file_menu.addSeparator()
+        
+        self.image_storage_action = QAction('Хранить изображения в базе данных', self)
+        self.image_storage_action.setCheckable(True)
+        self.image_storage_action.setChecked(self.image_store.storage == 'database')
+        self.image_storage_action.triggered.connect(self.change_image_storage)
+        file_menu.addAction(self.image_storage_action)
+        
+        file_menu.addSeparator()
+        
         exit_action = QAction('Выход', self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
@@ -1141,6 +4604,18 @@ class MainWindow(QMainWindow):
         refresh_action.triggered.connect(self.refresh_view)
         view_menu.addAction(refresh_action)
         
+        rebuild_stats_action = QAction('Пересчитать статистику', self)
+        rebuild_stats_action.triggered.connect(self.rebuild_statistics)
+        view_menu.addAction(rebuild_stats_action)
+        
+        view_menu.addSeparator()
+        
+        dark_theme_action = QAction('Темная тема', self)
+        dark_theme_action.setCheckable(True)
+        dark_theme_action.setChecked(self.theme.name == 'dark')
+        dark_theme_action.triggered.connect(self.change_theme)
+        view_menu.addAction(dark_theme_action)
+        
         # Меню Справка
         help_menu = menubar.addMenu('Справка')
         
@@ -1159,12 +4634,12 @@ class MainWindow(QMainWindow):
         
         # Заголовок
         title = QLabel("Добро пожаловать!")
-        title.setStyleSheet('font-size: 32px; font-weight: bold; color: #2c3e50;')
+        title.setObjectName('welcomeTitle')
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
         
         subtitle = QLabel("Школьные конспекты - 1 класс")
-        subtitle.setStyleSheet('font-size: 18px; color: #7f8c8d; margin-bottom: 30px;')
+        subtitle.setObjectName('welcomeSubtitle')
         subtitle.setAlignment(Qt.AlignCenter)
         layout.addWidget(subtitle)
         
@@ -1184,29 +4659,21 @@ class MainWindow(QMainWindow):
         for i, (name, color, desc) in enumerate(subjects):
             card = QFrame()
             card.setMinimumSize(200, 150)
-            card.setStyleSheet(f'''
-                QFrame {{
-                    background-color: {color};
-                    border-radius: 10px;
-                    padding: 15px;
-                }}
-                QLabel {{
-                    color: white;
-                }}
-            ''')
+            card.setObjectName('subjectCard')
+            card.setProperty('subjectColor', subject_key(color))
             
             card_layout = QVBoxLayout(card)
             
             icon_label = QLabel("📘" if name == "Математика" else "📗")
-            icon_label.setStyleSheet('font-size: 24px;')
+            icon_label.setObjectName('cardIcon')
             icon_label.setAlignment(Qt.AlignCenter)
             
             name_label = QLabel(name)
-            name_label.setStyleSheet('font-size: 16px; font-weight: bold;')
+            name_label.setObjectName('cardName')
             name_label.setAlignment(Qt.AlignCenter)
             
             desc_label = QLabel(desc)
-            desc_label.setStyleSheet('font-size: 12px;')
+            desc_label.setObjectName('cardDescription')
             desc_label.setAlignment(Qt.AlignCenter)
             desc_label.setWordWrap(True)
             
@@ -1226,19 +4693,7 @@ class MainWindow(QMainWindow):
         # Кнопка быстрого старта
         quick_start_btn = QPushButton("🚀 Начать использование")
         quick_start_btn.clicked.connect(self.show_all_notes)
-        quick_start_btn.setStyleSheet('''
-            QPushButton {
-                font-size: 16px;
-                padding: 15px;
-                background-color: #2c3e50;
-                color: white;
-                border-radius: 8px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #3498db;
-            }
-        ''')
+        quick_start_btn.setObjectName('quickStartButton')
         quick_start_btn.setFixedWidth(300)
         
         btn_container = QWidget()
@@ -1254,59 +4709,60 @@ class MainWindow(QMainWindow):
     
     def on_subject_click(self, subject_name):
         # Находим ID предмета по имени
-        subjects = self.db.get_subjects()
-        for subject_id, name, color in subjects:
-            if name == subject_name:
-                self.show_subject_notes(subject_id)
-                break
+        if subject_name in self.subject_ids:
+            self.show_subject_notes(self.subject_ids[subject_name])
     
     def load_initial_data(self):
-        # Загружаем предметы
-        subjects = self.db.get_subjects()
+        # Загружаем предметы и статистику
+        self.async_db.submit(self.db.get_subjects, callback=self.show_subjects, key='subjects')
+        self.update_statistics()
+        self.collect_image_garbage()
+        
+        if not self.backups.timer.isActive():
+            # Автоматическая копия не должна замедлять запуск
+            QTimer.singleShot(60 * 1000, self.backups.schedule)
+    
+    def show_subjects(self, subjects):
+        self.subject_ids = {name: subject_id for subject_id, name, color in subjects}
+        
+        subjects_layout = self.subjects_layout
+        
+        # Удаляем существующие кнопки (кроме первых двух виджетов)
+        while subjects_layout.count() > 2:
+            item = subjects_layout.takeAt(2)
+            if item.widget():
+                item.widget().deleteLater()
         
-        # Находим layout предметов
-        subjects_group = self.sidebar.findChild(QGroupBox, "📖 Предметы")
-        if subjects_group:
-            subjects_layout = subjects_group.layout()
-            
-            # Удаляем существующие кнопки (кроме первых двух виджетов)
-            while subjects_layout.count() > 2:
-                item = subjects_layout.takeAt(2)
-                if item.widget():
-                    item.widget().deleteLater()
-            
-            self.subject_buttons = []
-            
-            # Добавляем кнопки предметов
-            for subject_id, name, color in subjects:
-                btn = QPushButton(f"📘 {name}")
-                btn.setProperty('subject_id', subject_id)
-                btn.setProperty('color', color)
-                btn.setStyleSheet(f'''
-                    QPushButton {{
-                        text-align: left;
-                        padding: 10px;
-                        font-size: 14px;
-                        border: none;
-                        border-radius: 5px;
-                        background-color: {color}20;
-                        color: {color};
-                    }}
-                    QPushButton:hover {{
-                        background-color: {color};
-                        color: white;
-                    }}
-                ''')
-                btn.clicked.connect(lambda checked, sid=subject_id: self.show_subject_notes(sid))
-                subjects_layout.addWidget(btn)
-                self.subject_buttons.append(btn)
+        self.subject_buttons = []
         
-        # Обновляем статистику
-        self.update_statistics()
+        # Цвета предметов берутся из общей таблицы стилей
+        self.theme.add_subject_colors([color for subject_id, name, color in subjects])
+        
+        # Добавляем кнопки предметов
+        for subject_id, name, color in subjects:
+            btn = QPushButton(f"📘 {name}")
+            btn.setProperty('subject_id', subject_id)
+            btn.setProperty('color', color)
+            btn.setProperty('nav', True)
+            btn.setProperty('subjectColor', subject_key(color))
+            btn.clicked.connect(lambda checked, sid=subject_id: self.show_subject_notes(sid))
+            subjects_layout.addWidget(btn)
+            self.subject_buttons.append(btn)
+        
+        self.mark('subjects_loaded')
     
     def update_statistics(self):
-        stats = self.db.get_statistics()
-        
+        self.async_db.submit(self.db.get_statistics, callback=self.show_statistics, key='statistics')
+    
+    def rebuild_statistics(self):
+        """Пересчитывает счетчики статистики, если они разошлись с данными"""
+        self.async_db.submit(self.db.rebuild_statistics, callback=self.on_statistics_rebuilt)
+    
+    def on_statistics_rebuilt(self, result):
+        self.statusBar().showMessage("Статистика пересчитана", 3000)
+        self.update_statistics()
+    
+    def show_statistics(self, stats):
         stats_text = f"""📊 Статистика:
 
 Готовых конспектов: {stats['default_notes']}
@@ -1314,215 +4770,113 @@ class MainWindow(QMainWindow):
 
 По предметам:
 """
-        for subject, count in stats['by_subject']:
-            stats_text += f"  {subject}: {count}\n"
+        for subject, default_count, user_count in stats['by_subject']:
+            stats_text += f"  {subject}: {default_count}"
+            if user_count:
+                stats_text += f" (+{user_count} моих)"
+            stats_text += "\n"
         
         self.stats_label.setText(stats_text)
+        self.mark('statistics_loaded')
     
     def show_subject_notes(self, subject_id):
-        self.current_notes = self.db.get_notes_by_subject(subject_id)
-        self.show_notes_list("конспекты")
+        self.show_notes_list("конспекты", key=('subject', subject_id),
+                             fetch_page=lambda after: self.db.get_notes_page(subject_id, after))
     
     def show_all_notes(self):
-        self.current_notes = self.db.get_all_notes()
-        self.show_notes_list("все конспекты")
+        self.show_notes_list("все конспекты", key=('all',), fetch_page=self.db.get_notes_page)
     
     def show_user_notes(self):
-        self.current_notes = self.db.get_user_notes()
-        self.show_notes_list("мои конспекты", is_user_notes=True)
+        self.show_notes_list("мои конспекты", key=('user',), fetch_page=self.db.get_user_notes_page)
     
-    def show_notes_list(self, title, is_user_notes=False):
-        # Создаем виджет со списком
-        notes_widget = QWidget()
-        layout = QVBoxLayout(notes_widget)
-        
-        # Заголовок
-        title_label = QLabel(f"📚 {title.title()}")
-        title_label.setStyleSheet('''
-            font-size: 20px;
-            font-weight: bold;
-            color: #2c3e50;
-            padding: 15px;
-            border-bottom: 2px solid #3498db;
-        ''')
-        layout.addWidget(title_label)
-        
-        if not self.current_notes:
-            # Сообщение, если конспектов нет
-            no_notes_label = QLabel("Конспектов не найдено")
-            no_notes_label.setStyleSheet('font-size: 16px; color: #7f8c8d; padding: 50px;')
-            no_notes_label.setAlignment(Qt.AlignCenter)
-            layout.addWidget(no_notes_label)
-        else:
-            # Создаем scroll area
-            scroll_area = QScrollArea()
-            scroll_area.setWidgetResizable(True)
-            
-            container = QWidget()
-            container_layout = QVBoxLayout(container)
-            
-            # Группируем по предметам, если это не пользовательские заметки
-            if not is_user_notes:
-                notes_by_subject = {}
-                for note in self.current_notes:
-                    subject_name = note[7]  # subject_name из запроса
-                    if subject_name not in notes_by_subject:
-                        notes_by_subject[subject_name] = []
-                    notes_by_subject[subject_name].append(note)
-                
-                for subject_name, notes in notes_by_subject.items():
-                    # Заголовок предмета
-                    subject_header = QLabel(subject_name)
-                    subject_header.setStyleSheet('''
-                        font-size: 16px;
-                        font-weight: bold;
-                        color: #34495e;
-                        background-color: #ecf0f1;
-                        padding: 10px;
-                        border-radius: 5px;
-                        margin-top: 20px;
-                    ''')
-                    container_layout.addWidget(subject_header)
-                    
-                    # Конспекты этого предмета
-                    for note in notes:
-                        container_layout.addWidget(self.create_note_card(note, is_user_notes))
-            else:
-                # Для пользовательских заметок - просто список
-                for note in self.current_notes:
-                    container_layout.addWidget(self.create_note_card(note, is_user_notes))
-            
-            container_layout.addStretch()
-            scroll_area.setWidget(container)
-            layout.addWidget(scroll_area)
-        
-        # Добавляем виджет в стек
-        self.main_area.addWidget(notes_widget)
-        self.main_area.setCurrentWidget(notes_widget)
-    
-    def create_note_card(self, note, is_user_note=False):
-        """Создает карточку конспекта"""
-        card = QFrame()
-        card.setFrameStyle(QFrame.StyledPanel)
-        card.setStyleSheet('''
-            QFrame {
-                background-color: white;
-                border: 1px solid #ddd;
-                border-radius: 8px;
-                margin: 5px;
-            }
-            QFrame:hover {
-                border-color: #3498db;
-                background-color: #f8f9fa;
-            }
-        ''')
-        
-        card_layout = QVBoxLayout(card)
-        
-        # Заголовок
-        title_label = QLabel(note[2])  # title
-        title_label.setStyleSheet('font-size: 16px; font-weight: bold; color: #2c3e50;')
-        title_label.setWordWrap(True)
-        
-        # Предмет и цвет
-        subject_color = note[8] if len(note) > 8 else '#3498db'
-        subject_name = note[7] if len(note) > 7 else 'Предмет'
-        
-        subject_widget = QWidget()
-        subject_layout = QHBoxLayout(subject_widget)
-        
-        subject_label = QLabel(subject_name)
-        subject_label.setStyleSheet(f'color: {subject_color}; font-weight: bold;')
-        
-        grade_label = QLabel("1 класс")
-        grade_label.setStyleSheet('''
-            background-color: #3498db;
-            color: white;
-            padding: 2px 8px;
-            border-radius: 10px;
-            font-size: 12px;
-        ''')
-        
-        subject_layout.addWidget(subject_label)
-        subject_layout.addStretch()
-        subject_layout.addWidget(grade_label)
-        
-        # Краткое содержание
-        content_preview = QLabel(note[3][:100] + "..." if len(note[3]) > 100 else note[3])
-        content_preview.setWordWrap(True)
-        content_preview.setStyleSheet('color: #7f8c8d; padding: 5px 0;')
-        
-        # Кнопки
-        buttons_layout = QHBoxLayout()
-        
-        view_btn = QPushButton("👁️ Просмотр")
-        view_btn.clicked.connect(lambda checked, n=note, u=is_user_note: self.open_note(n, u))
-        view_btn.setStyleSheet('padding: 5px;')
+    def show_notes_list(self, title, rows=None, key=('all',), fetch_page=None):
+        # Переиспользуем страницу этого вида, если она еще в кэше; страницы
+        # списков читаются из базы в фоне
+        page = self.views.page(key)
+        page.set_content(title, rows, fetch_page)
+        self.views.show(key)
+    
+    def on_note_action(self, action, item):
+        """Обрабатывает нажатие кнопки на карточке конспекта"""
+        kind, note_id = item[0], item[1]
+        if kind == 'header':
+            return
         
-        if is_user_note:
-            edit_btn = QPushButton("✏️ Редактировать")
-            edit_btn.clicked.connect(lambda checked, n=note: self.edit_user_note(n))
-            edit_btn.setStyleSheet('padding: 5px; background-color: #f39c12; color: white;')
-            
-            delete_btn = QPushButton("🗑️ Удалить")
-            delete_btn.clicked.connect(lambda checked, nid=note[0]: self.delete_user_note(nid))
-            delete_btn.setStyleSheet('padding: 5px; background-color: #e74c3c; color: white;')
-            
-            buttons_layout.addWidget(view_btn)
-            buttons_layout.addWidget(edit_btn)
-            buttons_layout.addWidget(delete_btn)
-        else:
-            save_copy_btn = QPushButton("💾 Сохранить копию")
-            save_copy_btn.clicked.connect(lambda checked, n=note: self.save_as_user_note(n))
-            save_copy_btn.setStyleSheet('padding: 5px; background-color: #2ecc71; color: white;')
-            
-            buttons_layout.addWidget(view_btn)
-            buttons_layout.addWidget(save_copy_btn)
+        if action == 'delete':
+            self.delete_user_note(note_id)
+            return
         
-        # Собираем карточку
-        card_layout.addWidget(title_label)
-        card_layout.addWidget(subject_widget)
-        card_layout.addWidget(content_preview)
-        card_layout.addLayout(buttons_layout)
+        # Полный текст загружаем только при открытии конспекта
+        self.async_db.submit(
+            self.load_note, kind, note_id, action == 'view',
+            callback=lambda result: self.on_note_loaded(action, kind, *result),
+            key='open_note'
+        )
+    
+    def load_note(self, kind, note_id, render=False):
+        """Читает конспект целиком и для просмотра сразу готовит его HTML
+        (выполняется в фоновом потоке)"""
+        note = self.load_user_note(note_id) if kind == 'user' else self.db.get_note(note_id)
+        html = self.render_cache.render(kind, note_id, note[3]) if note and render else None
+        return note, html
+    
+    def load_user_note(self, note_id):
+        """Читает пользовательский конспект и выгружает его изображения из базы
+        (выполняется в фоновом потоке)"""
+        note = self.db.get_user_note(note_id)
+        if note and note[4]:
+            self.image_store.prefetch(json.loads(note[4]))
+        return note
+    
+    def on_note_loaded(self, action, kind, note, html=None):
+        if not note:
+            return
         
-        return card
+        if action == 'view':
+            self.open_note(note, kind == 'user', html)
+        elif action == 'edit':
+            self.edit_user_note(note)
+        elif action == 'copy':
+            self.save_as_user_note(note)
     
-    def open_note(self, note, is_user_note=False):
+    def open_note(self, note, is_user_note=False, html=None):
         """Открывает конспект для просмотра"""
         if is_user_note:
             note_data = {
                 'title': note[2],
                 'subject': note[1],
                 'content': note[3],
-                'images': json.loads(note[4]) if note[4] else []
+                'images': [self.image_store.path(image) for image in json.loads(note[4])] if note[4] else [],
+                'html': html
             }
         else:
             note_data = {
                 'title': note[2],
-                'subject': note[7],
+                'subject': note[6],
                 'content': note[3],
-                'images': []
+                'images': [],
+                'html': html
             }
         
-        viewer = NoteViewer(note_data)
+        viewer = NoteViewer(note_data, thumbnails=self.thumbnails, theme=self.theme)
         viewer.exec_()
     
     def create_user_note(self):
         """Создание нового конспекта"""
-        editor = NoteEditor(self)
+        editor = NoteEditor(self, thumbnails=self.thumbnails, image_store=self.image_store,
+                            ingestor=self.ingestor)
         if editor.exec_():
             note_data = editor.get_note_data()
             
             # Сохраняем в базу данных
-            self.db.add_user_note(
+            self.async_db.submit(
+                self.db.add_user_note,
                 note_data['subject'],
                 note_data['title'],
                 note_data['content'],
-                note_data['images']
+                note_data['images'],
+                callback=lambda note_id: self.on_user_notes_changed("Конспект сохранен!")
             )
-            
-            self.statusBar().showMessage("Конспект сохранен!", 3000)
-            self.show_user_notes()
     
     def edit_user_note(self, note):
         """Редактирование пользовательского конспекта"""
@@ -1533,40 +4887,39 @@ class MainWindow(QMainWindow):
             'images': json.loads(note[4]) if note[4] else []
         }
         
-        editor = NoteEditor(self, note_data, mode='edit')
+        editor = NoteEditor(self, note_data, mode='edit', thumbnails=self.thumbnails,
+                            image_store=self.image_store, ingestor=self.ingestor)
         if editor.exec_():
             updated_data = editor.get_note_data()
             
             # Обновляем в базе данных
-            self.db.update_user_note(
+            self.async_db.submit(
+                self.db.update_user_note,
                 note[0],
                 updated_data['subject'],
                 updated_data['title'],
                 updated_data['content'],
-                updated_data['images']
+                updated_data['images'],
+                callback=lambda result: self.on_user_notes_changed("Конспект обновлен!")
             )
-            
-            self.statusBar().showMessage("Конспект обновлен!", 3000)
-            self.show_user_notes()
     
     def save_as_user_note(self, note):
         """Сохраняет готовый конспект как пользовательский"""
         note_data = {
-            'subject': note[7],  # subject_name
+            'subject': note[6],  # subject_name
             'title': f"Копия: {note[2]}",
             'content': note[3],
             'images': []
         }
         
-        self.db.add_user_note(
+        self.async_db.submit(
+            self.db.add_user_note,
             note_data['subject'],
             note_data['title'],
             note_data['content'],
-            note_data['images']
+            note_data['images'],
+            callback=lambda note_id: self.on_user_notes_changed("Конспект скопирован в 'Мои конспекты'!")
         )
-        
-        self.statusBar().showMessage("Конспект скопирован в 'Мои конспекты'!", 3000)
-        self.show_user_notes()
     
     def delete_user_note(self, note_id):
         """Удаляет пользовательский конспект"""
@@ -1579,9 +4932,49 @@ class MainWindow(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            self.db.delete_user_note(note_id)
-            self.statusBar().showMessage("Конспект удален", 3000)
-            self.show_user_notes()
+            self.async_db.submit(
+                self.db.delete_user_note, note_id,
+                callback=lambda result: self.on_user_notes_changed("Конспект удален")
+            )
+    
+    def on_user_notes_changed(self, message):
+        """Показывает сообщение и обновленный список после записи в базу"""
+        self.statusBar().showMessage(message, 3000)
+        self.show_user_notes()
+        self.collect_image_garbage()
+    
+    def change_image_storage(self, in_database):
+        """Переносит изображения всех конспектов в базу данных или обратно в файлы"""
+        storage = 'database' if in_database else 'files'
+        self.image_storage_action.setEnabled(False)
+        self.statusBar().showMessage("Перенос изображений...")
+        self.async_db.submit(
+            self.image_store.convert, storage,
+            callback=self.on_image_storage_changed,
+            errback=self.on_image_storage_failed
+        )
+    
+    def on_image_storage_changed(self, moved):
+        self.image_storage_action.setEnabled(True)
+        self.statusBar().showMessage(f"Перенесено изображений: {moved}", 3000)
+    
+    def on_image_storage_failed(self, error):
+        self.image_storage_action.setEnabled(True)
+        self.image_storage_action.setChecked(self.image_store.storage == 'database')
+        QMessageBox.warning(self, "Ошибка", f"Не удалось перенести изображения:\n{error}")
+    
+    def change_theme(self, dark):
+        """Переключает светлую и темную тему и запоминает выбор"""
+        name = 'dark' if dark else 'light'
+        self.theme.apply(name)
+        # Карточки списков рисует делегат, их достаточно перерисовать
+        for page in self.views.pages.values():
+            page.view.viewport().update()
+        self.async_db.submit(self.db.set_meta, 'theme', name)
+    
+    def collect_image_garbage(self):
+        """Удаляет в фоне изображения, на которые больше не ссылаются конспекты"""
+        self.async_db.submit(self.image_store.collect_garbage, key='image_gc')
     
     def import_note(self):
         """Импорт конспекта из файла"""
@@ -1596,82 +4989,323 @@ class MainWindow(QMainWindow):
                     content = f.read()
                 
                 # Предлагаем пользователю отредактировать
-                editor = NoteEditor(self)
+                editor = NoteEditor(self, thumbnails=self.thumbnails, image_store=self.image_store,
+                                    ingestor=self.ingestor)
                 editor.title_edit.setText(os.path.basename(filename).replace('.txt', '').replace('.md', ''))
                 editor.content_edit.setPlainText(content)
                 
                 if editor.exec_():
                     note_data = editor.get_note_data()
-                    self.db.add_user_note(
+                    self.async_db.submit(
+                        self.db.add_user_note,
                         note_data['subject'],
                         note_data['title'],
                         note_data['content'],
-                        note_data['images']
+                        note_data['images'],
+                        callback=lambda note_id: self.on_user_notes_changed("Конспект импортирован!")
                     )
                     
-                    self.statusBar().showMessage("Конспект импортирован!", 3000)
-                    self.show_user_notes()
-                    
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл:\n{str(e)}")
     
+    def bulk_import(self):
+        """Импорт многих файлов или папки: предпросмотр, затем запись одной транзакцией"""
+        if self.importer.running():
+            return
+        
+        choice = QMessageBox(self)
+        choice.setWindowTitle("Импорт")
+        choice.setText("Что импортировать?")
+        folder_btn = choice.addButton("Папку", QMessageBox.AcceptRole)
+        files_btn = choice.addButton("Файлы", QMessageBox.AcceptRole)
+        choice.addButton("Отмена", QMessageBox.RejectRole)
+        choice.exec_()
+        
+        if choice.clickedButton() is folder_btn:
+            folder = QFileDialog.getExistingDirectory(self, "Выберите папку с конспектами")
+            paths = [folder] if folder else []
+        elif choice.clickedButton() is files_btn:
+            paths, _ = QFileDialog.getOpenFileNames(
+                self, "Выберите файлы конспектов", "", "Текстовые файлы (*.txt *.md);;Все файлы (*)"
+            )
+        else:
+            return
+        
+        if paths:
+            self.show_progress("Импорт", "Чтение файлов...", self.importer.cancel)
+            self.importer.start(paths, dry_run=True)
+    
+    def on_import_finished(self, result):
+        self.close_progress()
+        
+        if 'error' in result:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить импорт:\n{result['error']}")
+        elif result['cancelled']:
+            self.statusBar().showMessage("Импорт отменен", 3000)
+        elif result['dry_run']:
+            self.confirm_import(result)
+        else:
+            message = f"Импортировано конспектов: {result['imported']}"
+            if result['errors']:
+                message += f", не прочитано файлов: {len(result['errors'])}"
+            self.on_user_notes_changed(message)
+            self.update_statistics()
+    
+    def confirm_import(self, preview):
+        """Показывает, что будет импортировано, и запускает импорт после подтверждения"""
+        count = sum(preview['subjects'].values())
+        if not count:
+            QMessageBox.information(self, "Импорт", "Не найдено файлов .txt или .md")
+            return
+        
+        by_subject = '\n'.join(f"{subject}: {number}"
+                               for subject, number in sorted(preview['subjects'].items()))
+        details = [f"{os.path.basename(path)} → {subject} / {title} ({length} симв.)"
+                   for path, subject, title, length in preview['sample']]
+        if count > len(details):
+            details.append(f"... и еще {count - len(details)}")
+        details.extend(f"Ошибка: {path}: {error}" for path, error in preview['errors'])
+        
+        box = QMessageBox(self)
+        box.setWindowTitle("Импорт")
+        box.setText(f"Будет импортировано конспектов: {count}\n\n{by_subject}")
+        if preview['errors']:
+            box.setInformativeText(f"Не удалось прочитать файлов: {len(preview['errors'])}")
+        box.setDetailedText('\n'.join(details))
+        box.setStandardButtons(QMessageBox.Ok | QMessageBox.Cancel)
+        box.button(QMessageBox.Ok).setText("Импортировать")
+        
+        if box.exec_() == QMessageBox.Ok:
+            self.show_progress("Импорт", "Импорт конспектов...", self.importer.cancel)
+            self.importer.start(preview['paths'])
+    
+    def save_library_archive(self):
+        """Сохраняет предметы, все конспекты и изображения в один файл NDJSON"""
+        if self.archiver.running():
+            return
+        
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить архив библиотеки", "konspekty.ndjson.gz",
+            "Архив конспектов (*.ndjson.gz *.ndjson *.ndjson.zst)"
+        )
+        if not path:
+            return
+        
+        reply = QMessageBox.question(
+            self, "Архив библиотеки",
+            "Включить изображения в архив?\n\nБез них архив меньше, но на другом компьютере "
+            "изображения найдутся, только если туда скопирована папка user_images.",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+        )
+        
+        self.show_progress("Архив библиотеки", "Сохранение архива...", self.archiver.cancel)
+        self.archiver.start(path, embed_images=reply == QMessageBox.Yes)
+    
+    def load_library_archive(self):
+        """Добавляет в библиотеку содержимое архива NDJSON"""
+        if self.archiver.running():
+            return
+        
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Загрузить архив библиотеки", "",
+            "Архив конспектов (*.ndjson.gz *.ndjson *.ndjson.zst);;Все файлы (*)"
+        )
+        if path:
+            self.show_progress("Архив библиотеки", "Загрузка архива...", self.archiver.cancel)
+            self.archiver.start(path, load=True)
+    
+    def on_archive_finished(self, result):
+        self.close_progress()
+        
+        if 'error' in result:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось обработать архив:\n{result['error']}")
+        elif not result['load']:
+            if result['cancelled']:
+                self.statusBar().showMessage("Сохранение архива отменено", 3000)
+            else:
+                self.statusBar().showMessage(f"Архив сохранен: {result['path']}", 5000)
+        else:
+            message = (f"Загружено готовых конспектов: {result['notes']}, "
+                       f"своих конспектов: {result['user_notes']}")
+            if result['missing_images']:
+                message += f", не найдено изображений: {result['missing_images']}"
+            if result['cancelled']:
+                message = "Загрузка прервана, ее можно продолжить. " + message
+            self.load_initial_data()
+            self.on_user_notes_changed(message)
+    
+    def create_backup(self):
+        """Резервная копия базы по запросу"""
+        if self.backups.start():
+            self.show_progress("Резервная копия", "Копирование базы...", self.backups.cancel)
+        else:
+            self.statusBar().showMessage("Резервная копия уже создается", 3000)
+    
+    def restore_backup(self):
+        """Восстанавливает базу из выбранной резервной копии"""
+        if self.backups.running():
+            self.statusBar().showMessage("Резервная копия уже создается", 3000)
+            return
+        
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Восстановить из резервной копии", self.backups.directory,
+            "Резервные копии (*.db.gz *.db)"
+        )
+        if not path:
+            return
+        
+        reply = QMessageBox.question(
+            self, "Восстановление",
+            f"Заменить все конспекты содержимым копии\n{os.path.basename(path)}?\n\n"
+            "Перед этим будет сохранена копия текущей базы.",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            self.backups.start(restore_path=path)
+            self.show_progress("Восстановление", "Копирование текущей базы...", self.backups.cancel)
+    
+    def on_backup_progress(self, done, total):
+        # Автоматическая копия идет без окна прогресса и не должна двигать
+        # окно другой операции
+        task = self.backups.task
+        if task is not None and not task.automatic:
+            self.on_job_progress(done, total)
+    
+    def on_backup_finished(self, result):
+        if result['automatic']:
+            if 'error' in result:
+                self.statusBar().showMessage(f"Не удалось создать резервную копию: {result['error']}", 5000)
+            return
+        
+        self.close_progress()
+        if 'error' in result:
+            QMessageBox.critical(self, "Ошибка", f"Операция с резервной копией не выполнена:\n{result['error']}")
+        elif result['cancelled']:
+            self.statusBar().showMessage("Резервное копирование отменено", 3000)
+        elif result['restore']:
+            self.image_store.storage = self.db.get_meta('image_storage', 'files')
+            self.image_storage_action.setChecked(self.image_store.storage == 'database')
+            self.load_initial_data()
+            self.on_user_notes_changed("База восстановлена из резервной копии")
+        else:
+            self.statusBar().showMessage(f"Резервная копия сохранена: {result['path']}", 5000)
+    
     def export_all_notes(self):
         """Экспорт всех пользовательских конспектов"""
+        if self.exporter.running():
+            return
+        
         folder = QFileDialog.getExistingDirectory(self, "Выберите папку для экспорта")
         
         if folder:
-            notes = self.db.get_user_notes()
-            export_count = 0
-            
-            for note in notes:
-                note_id, subject, title, content, images, grade, created_at = note
-                
-                # Создаем безопасное имя файла
-                safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                filename = os.path.join(folder, f"{safe_title}.txt")
-                
-                try:
-                    with open(filename, 'w', encoding='utf-8') as f:
-                        f.write(f"Конспект: {title}\n")
-                        f.write(f"Предмет: {subject}\n")
-                        f.write(f"Дата создания: {created_at}\n")
-                        f.write("=" * 50 + "\n\n")
-                        f.write(content)
-                    
-                    export_count += 1
-                except Exception as e:
-                    print(f"Ошибка экспорта {title}: {e}")
+            choice = QMessageBox(self)
+            choice.setWindowTitle("Экспорт")
+            choice.setText("Как сохранить конспекты?")
+            folder_btn = choice.addButton("Файлы в папку", QMessageBox.AcceptRole)
+            archive_btn = choice.addButton("ZIP-архив", QMessageBox.AcceptRole)
+            choice.addButton("Отмена", QMessageBox.RejectRole)
+            choice.exec_()
+            if choice.clickedButton() not in (folder_btn, archive_btn):
+                return
             
+            self.show_progress("Экспорт", "Экспорт конспектов...", self.exporter.cancel)
+            self.exporter.start(folder, archive=choice.clickedButton() is archive_btn)
+    
+    def show_progress(self, title, label, cancel):
+        """Окно прогресса фоновой операции; кнопка «Отмена» вызывает cancel"""
+        self.progress_dialog = QProgressDialog(label, "Отмена", 0, 0, self)
+        self.progress_dialog.setWindowTitle(title)
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setMinimumDuration(300)
+        self.progress_dialog.canceled.connect(cancel)
+    
+    def on_job_progress(self, done, total):
+        if self.progress_dialog is not None:
+            self.progress_dialog.setMaximum(total)
+            self.progress_dialog.setValue(done)
+    
+    def close_progress(self):
+        if self.progress_dialog is not None:
+            self.progress_dialog.canceled.disconnect()
+            self.progress_dialog.close()
+            self.progress_dialog = None
+    
+    def on_export_finished(self, result):
+        self.close_progress()
+        
+        if 'error' in result:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить экспорт:\n{result['error']}")
+        elif result['cancelled']:
+            self.statusBar().showMessage("Экспорт отменен", 3000)
+        else:
+            details = ""
+            if 'skipped' in result:
+                details = (f"Без изменений: {result['skipped']}\n"
+                           f"Удалено файлов удаленных конспектов: {result['removed']}\n")
             QMessageBox.information(
                 self,
                 "Экспорт завершен",
-                f"Экспортировано конспектов: {export_count} из {len(notes)}\n\nПапка: {folder}"
+                f"Экспортировано конспектов: {result['exported']} из {result['total']}\n{details}\n"
+                f"Путь: {result['path']}"
             )
     
     def on_search(self):
         """Обработка поиска"""
+        self.search_timer.stop()
         keyword = self.search_input.text().strip()
         
         if keyword:
-            self.current_notes = self.db.search_notes(keyword)
-            self.show_notes_list(f"результаты поиска: '{keyword}'")
+            self.show_search_results(keyword)
+        else:
+            self.async_db.cancel_key('search')
+    
+    def show_search_results(self, keyword):
+        cached = self.search_cache.lookup(keyword)
+        if cached is not None:
+            self.async_db.cancel_key('search')
+            self.on_search_results(keyword, *cached)
+            return
+        
+        # Новый запрос прерывает предыдущий, если тот еще выполняется
+        self.statusBar().showMessage("Поиск...")
+        self.async_db.submit(
+            self.search_cache.search, keyword,
+            callback=lambda result: self.on_search_results(keyword, *result),
+            key='search'
+        )
+    
+    def on_search_results(self, keyword, hits, user_hits):
+        self.statusBar().clearMessage()
+        
+        # Ранжированные результаты из готовых и пользовательских конспектов,
+        # сгруппированные по предметам в порядке первого появления
+        subject_order = {}
+        for row in hits:
+            subject_order.setdefault(row[3], len(subject_order))
+        rows = sorted(hits, key=lambda row: subject_order[row[3]])
+        
+        if user_hits:
+            rows.append(('header', None, "💼 Мои конспекты", '', None, ''))
+            rows.extend(user_hits)
+        
+        self.search_keyword = keyword
+        self.show_notes_list(f"результаты поиска: '{keyword}'", rows, key=('search',))
     
     def refresh_view(self):
         """Обновление текущего вида"""
-        current_widget = self.main_area.currentWidget()
-        if current_widget:
-            # Определяем, какой вид активен и обновляем его
-            if "Мои конспекты" in current_widget.layout().itemAt(0).widget().text():
-                self.show_user_notes()
-            elif "Все конспекты" in current_widget.layout().itemAt(0).widget().text():
-                self.show_all_notes()
-            else:
-                # Проверяем, не список ли это конспектов по предмету
-                for subject_btn in self.subject_buttons:
-                    if subject_btn.property('subject_id'):
-                        # Это немного упрощенно, но показывает идею
-                        self.show_all_notes()
-                        break
+        key = self.views.current_key()
+        if key is None:
+            return
+        
+        # Повторно загружаем данные активного вида
+        if key[0] == 'user':
+            self.show_user_notes()
+        elif key[0] == 'all':
+            self.show_all_notes()
+        elif key[0] == 'subject':
+            self.show_subject_notes(key[1])
+        elif key[0] == 'search':
+            self.show_search_results(self.search_keyword)
     
     def show_about(self):
         """Показывает информацию о программе"""
@@ -1765,44 +5399,625 @@ class MainWindow(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            self.db.close()
+            self.shutdown()
             event.accept()
         else:
             event.ignore()
+    
+    def shutdown(self):
+        """Останавливает фоновые задачи и закрывает базу"""
+        self.async_db.shutdown()
+        self.thumbnails.shutdown()
+        self.ingestor.shutdown()
+        self.exporter.shutdown()
+        self.importer.shutdown()
+        self.archiver.shutdown()
+        self.backups.shutdown()
+        self.db.close()
+
+
+# ============================================
+# ЗАМЕР ВРЕМЕНИ ЗАПУСКА
+# ============================================
+class StartupProfiler(QObject):
+    """Замеряет этапы запуска до первой отрисовки окна и загрузки данных"""
+    # Этапы, после которых запуск считается завершенным
+    FINAL_PHASES = {'first_paint', 'subjects_loaded', 'statistics_loaded'}
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.marks = [('start', STARTUP_STARTED), ('imports', IMPORTS_FINISHED)]
+        self.window = None
+    
+    def mark(self, phase):
+        if phase in dict(self.marks):
+            return
+        
+        self.marks.append((phase, time.perf_counter()))
+        if self.FINAL_PHASES <= set(dict(self.marks)):
+            self.report()
+            QApplication.quit()
+    
+    def watch_first_paint(self, window):
+        self.window = window
+        window.installEventFilter(self)
+    
+    def eventFilter(self, obj, event):
+        if obj is self.window and event.type() == QEvent.Paint:
+            self.window.removeEventFilter(self)
+            self.mark('first_paint')
+        return False
+    
+    def report(self):
+        print(f"{'Этап':<20}{'мс':>10}{'с начала, мс':>16}")
+        previous = STARTUP_STARTED
+        for phase, moment in self.marks[1:]:
+            print(f"{phase:<20}{(moment - previous) * 1000:>10.1f}"
+                  f"{(moment - STARTUP_STARTED) * 1000:>16.1f}")
+            previous = moment
+
+
+# ============================================
+# НАГРУЗОЧНЫЕ ЗАМЕРЫ
+# ============================================
+# Меняется вместе с генератором, чтобы старые базы для замеров пересоздавались
+CORPUS_VERSION = 1
+
+
+def corpus_vocabulary():
+    """Словарь генератора: слова встроенных конспектов в порядке частоты"""
+    counts = {}
+    for subject_id, title, content, grade in DEFAULT_NOTES:
+        for word in re.findall(r'[а-яё]{2,}', f'{title} {content}'.lower()):
+            counts[word] = counts.get(word, 0) + 1
+    return sorted(counts, key=lambda word: (-counts[word], word))
+
+
+class CorpusGenerator:
+    """Воспроизводимые синтетические конспекты: одинаковый seed - одинаковый текст.
+    
+    Слова берутся из встроенных конспектов с частотами по закону Ципфа,
+    текст состоит из разделов с маркерами и пунктами списка, как в
+    настоящих конспектах. Примерно каждый сотый конспект длинный.
+    """
+    MARKERS = ('📌', '🔢', '🎯', '📝', '❗', '🎵', '📅')
+    
+    def __init__(self, seed=BENCHMARK_SEED):
+        self.random = random.Random(seed)
+        self.words = corpus_vocabulary()
+        self.cum_weights = list(accumulate(1 / rank for rank in range(1, len(self.words) + 1)))
+    
+    def phrase(self, low, high):
+        return ' '.join(self.random.choices(self.words, cum_weights=self.cum_weights,
+                                            k=self.random.randint(low, high)))
+    
+    def content(self):
+        sections = 40 if self.random.random() < 0.01 else self.random.randint(1, 4)
+        lines = []
+        for _ in range(sections):
+            lines.append(f"{self.random.choice(self.MARKERS)} {self.phrase(1, 3).upper()}:")
+            for _ in range(self.random.randint(2, 6)):
+                lines.append(f"• {self.phrase(3, 10)}")
+            lines.append('')
+        return '\n'.join(lines).rstrip()
+    
+    def note(self):
+        """(предмет, заголовок, текст, класс) готового конспекта"""
+        subject_id = self.random.randint(1, len(DEFAULT_SUBJECTS))
+        grade = 1 if self.random.random() < 0.75 else self.random.randint(2, 4)
+        return subject_id, self.phrase(2, 5).capitalize(), self.content(), grade
+    
+    def user_note(self, images):
+        """(предмет, заголовок, текст, изображения) пользовательского конспекта"""
+        subject = DEFAULT_SUBJECTS[self.random.randrange(len(DEFAULT_SUBJECTS))][0]
+        count = min(self.random.choice((0, 0, 0, 1, 2, 3)), len(images))
+        return subject, self.phrase(2, 5).capitalize(), self.content(), self.random.sample(images, count)
+
+
+def corpus_images(db, count=BENCHMARK_IMAGES):
+    """Кладет в таблицу images несколько картинок и возвращает ссылки на них"""
+    import tempfile
+    
+    references = []
+    with tempfile.TemporaryDirectory() as directory:
+        for number in range(count):
+            image = QImage(640, 480, QImage.Format_RGB32)
+            image.fill(QColor.fromHsv(number * 360 // count, 160, 220))
+            path = os.path.join(directory, f'{number}.png')
+            image.save(path)
+            
+            digest = file_digest(path)
+            db.put_image_blob(digest, '.png', path)
+            references.append(f'{ImageStore.DB_PREFIX}{digest}.png')
+    
+    db.set_meta('image_storage', 'database')
+    return references
+
+
+def generate_corpus(path, notes, seed=BENCHMARK_SEED, progress=None):
+    """Создает базу path с notes синтетическими конспектами.
+    
+    Четыре пятых конспектов попадают в готовые, остальные - в
+    пользовательские, со ссылками на изображения из базы. Готовая база
+    помечается в app_meta, и повторный вызов с теми же параметрами ее
+    не пересоздает.
+    """
+    marker = json.dumps({'notes': notes, 'seed': seed, 'version': CORPUS_VERSION}, sort_keys=True)
+    if os.path.exists(path):
+        db = Database(path)
+        complete = db.get_meta('benchmark_corpus') == marker
+        db.close()
+        if complete:
+            return path
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    db = Database(path)
+    generator = CorpusGenerator(seed)
+    images = corpus_images(db)
+    
+    default_count = notes * 4 // 5
+    done = 0
+    while done < notes:
+        batch = min(BENCHMARK_BATCH, notes - done)
+        default_batch = max(0, min(batch, default_count - done))
+        if default_batch:
+            db.add_notes(generator.note() for _ in range(default_batch))
+        if batch > default_batch:
+            db.add_user_notes(generator.user_note(images) for _ in range(batch - default_batch))
+        done += batch
+        if progress:
+            progress(done, notes)
+    
+    db.set_meta('benchmark_corpus', marker)
+    db.close()
+    return path
+
+
+def corpus_path(notes, directory=BENCHMARK_DIRECTORY, seed=BENCHMARK_SEED):
+    return os.path.join(directory, f'corpus_{notes}_{seed}.db')
+
+
+def measure(func, repeat):
+    """Время вызовов func в мс после одного прогревочного вызова"""
+    func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': len(samples),
+        'min_ms': round(min(samples), 4),
+        'median_ms': round(statistics.median(samples), 4),
+        'max_ms': round(max(samples), 4),
+    }
+
+
+def benchmark_database(path, notes, repeat=BENCHMARK_REPEAT):
+    """Замеры операций Database и форматирования на одной базе"""
+    db = Database(path)
+    words = corpus_vocabulary()
+    results = {}
+    
+    # Частое слово, слово из середины словаря, префикс и запрос из двух слов
+    queries = {
+        'frequent': words[0],
+        'rare': words[len(words) // 2],
+        'prefix': words[1][:3],
+        'two_words': f'{words[2]} {words[5]}',
+    }
+    for name, query in queries.items():
+        results[f'search_notes:{name}'] = measure(lambda: db.search_notes(query), repeat)
+    
+    # Списки в интерфейсе открываются первой страницей и листаются дальше
+    results['notes_page'] = measure(db.get_notes_page, repeat)
+    results['subject_notes_page'] = measure(lambda: db.get_notes_page(1), repeat)
+    results['user_notes_page'] = measure(db.get_user_notes_page, repeat)
+    if notes <= BENCHMARK_FULL_SCAN_LIMIT:
+        results['iter_notes'] = measure(lambda: sum(1 for row in db.iter_notes()), repeat)
+    else:
+        # Обход всех страниц большой базы занимает минуты
+        results['iter_notes'] = {'skipped': f'больше {BENCHMARK_FULL_SCAN_LIMIT} конспектов'}
+    results['get_statistics'] = measure(db.get_statistics, repeat)
+    
+    # Каждая запись - отдельная транзакция, как при сохранении из редактора
+    added = []
+    generator = CorpusGenerator(BENCHMARK_SEED + 1)
+    samples = [generator.user_note([]) for _ in range(BENCHMARK_WRITES + 1)]
+    results['add_user_note'] = measure(
+        lambda: added.append(db.add_user_note(*samples[len(added)])), BENCHMARK_WRITES
+    )
+    for note_id in added:
+        db.delete_user_note(note_id)
+    
+    # Обычный конспект и самый длинный из первых строк базы
+    contents = sorted((row[0] for row in db.iter_rows('SELECT content FROM notes LIMIT 1000')), key=len)
+    typical, longest = contents[len(contents) // 2], contents[-1]
+    results['format_content:typical'] = measure(lambda: render_note_body(typical), repeat * 20)
+    results['format_content:long'] = measure(lambda: render_note_body(longest), repeat * 20)
+    cache = RenderCache()
+    results['format_content:cached'] = measure(lambda: cache.render('note', 0, longest), repeat * 20)
+    
+    db.close()
+    return results
+
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, repeat=BENCHMARK_REPEAT, directory=BENCHMARK_DIRECTORY,
+                   output=None):
+    """Создает (или берет готовые) базы нужных размеров, замеряет их и
+    записывает результаты в JSON. Возвращает путь к файлу результатов."""
+    import platform
+    
+    report = {
+        'version': 1,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'corpora': {},
+    }
+    
+    for notes in sizes:
+        path = corpus_path(notes, directory)
+        print(f"База на {notes} конспектов: {path}")
+        started = time.perf_counter()
+        generate_corpus(path, notes, progress=lambda done, total: print(
+            f"\r  создано {done} из {total}", end='', flush=True
+        ))
+        print(f"\r  готова за {time.perf_counter() - started:.1f} с")
+        
+        results = benchmark_database(path, notes, repeat)
+        report['corpora'][str(notes)] = {
+            'notes': notes,
+            'seed': BENCHMARK_SEED,
+            'size_bytes': os.path.getsize(path),
+            'results': results,
+        }
+        for name, result in results.items():
+            value = result.get('skipped') or f"{result['median_ms']:.3f} мс"
+            print(f"  {name:<28}{value}")
+    
+    if output is None:
+        output = os.path.join(directory, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+    return output
+
+
+def compare_benchmarks(old_path, new_path, threshold=BENCHMARK_THRESHOLD):
+    """Сравнивает два прогона run_benchmarks() или run_ui_benchmarks()
+    по BENCHMARK_METRICS, возвращает код выхода.
+    
+    Замедление больше threshold (доля) считается регрессией; разница
+    меньше BENCHMARK_NOISE_MS не учитывается, это шум измерения.
+    """
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    
+    regressions = 0
+    print(f"{'Операция':<36}{'было, мс':>12}{'стало, мс':>12}{'изменение':>12}")
+    for size, corpus in new['corpora'].items():
+        old_results = old['corpora'].get(size, {}).get('results', {})
+        print(f"-- {size} конспектов")
+        for name, result in corpus['results'].items():
+            for metric in BENCHMARK_METRICS:
+                before = old_results.get(name, {}).get(metric)
+                after = result.get(metric)
+                if before is None or after is None:
+                    continue
+                
+                change = (after - before) / before if before else 0.0
+                slower = change > threshold and after - before > BENCHMARK_NOISE_MS
+                regressions += slower
+                label = name if metric == 'median_ms' else f'{name} ({metric})'
+                print(f"{label:<36}{before:>12.3f}{after:>12.3f}{change:>+11.0%}"
+                      f"{'  медленнее' if slower else ''}")
+    
+    if regressions:
+        print(f"Регрессий: {regressions}")
+        return 1
+    return 0
+
+
+# ============================================
+# ЗАМЕРЫ ИНТЕРФЕЙСА
+# ============================================
+def peak_rss_kb():
+    """Пиковый размер памяти процесса в КБ (None, если модуля resource нет)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS отдает байты, Linux - килобайты
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class UiHarness(QObject):
+    """Прогоняет сценарии MainWindow и меряет каждый.
+    
+    Для сценария записываются время, задержки цикла событий (промежутки
+    между тиками частого таймера длиннее UI_STALL_MS), число виджетов до и
+    после и пиковая память. Объект подставляется в MainWindow вместо
+    StartupProfiler и собирает этапы загрузки через mark().
+    """
+    def __init__(self, app, parent=None):
+        super().__init__(parent)
+        self.app = app
+        self.phases = set()
+        self.results = {}
+        self.stalls = []
+        self.last_beat = None
+        self.viewers_closed = 0
+        
+        self.heartbeat = QTimer(self)
+        self.heartbeat.setInterval(UI_HEARTBEAT_MS)
+        self.heartbeat.timeout.connect(self.on_beat)
+    
+    def mark(self, phase):
+        self.phases.add(phase)
+    
+    def on_beat(self):
+        now = time.perf_counter()
+        if self.last_beat is not None:
+            delay = (now - self.last_beat) * 1000 - UI_HEARTBEAT_MS
+            if delay >= UI_STALL_MS:
+                self.stalls.append(delay)
+        self.last_beat = now
+    
+    def wait_until(self, predicate, timeout=UI_BENCHMARK_TIMEOUT):
+        """Крутит цикл событий, пока predicate() не станет истинным"""
+        deadline = time.perf_counter() + timeout
+        while not predicate():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Сценарий не завершился вовремя")
+            # Таймер пульса будит цикл не реже раза в UI_HEARTBEAT_MS
+            self.app.processEvents(QEventLoop.AllEvents | QEventLoop.WaitForMoreEvents)
+    
+    def settle(self):
+        """Доставляет отложенные события и удаления"""
+        self.app.processEvents()
+        QApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+        self.app.processEvents()
+    
+    @contextmanager
+    def flow(self, name):
+        self.settle()
+        result = {'widgets_before': len(QApplication.allWidgets())}
+        self.stalls = []
+        self.heartbeat.start()
+        # Первый промежуток считается от начала сценария: так в задержки
+        # попадает и синхронная работа до первого возврата в цикл событий
+        started = self.last_beat = time.perf_counter()
+        
+        yield result
+        
+        result['wall_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        self.heartbeat.stop()
+        self.settle()
+        result.update({
+            'stalls': len(self.stalls),
+            'stall_total_ms': round(sum(self.stalls), 2),
+            'stall_max_ms': round(max(self.stalls, default=0.0), 2),
+            'widgets_after': len(QApplication.allWidgets()),
+            'peak_rss_kb': peak_rss_kb(),
+        })
+        self.results[name] = result
+    
+    def eventFilter(self, obj, event):
+        # Открытый просмотрщик закрывается, как только дойдет до цикла событий
+        if event.type() == QEvent.Show and isinstance(obj, NoteViewer):
+            QTimer.singleShot(0, lambda: self.close_viewer(obj))
+        return False
+    
+    def close_viewer(self, viewer):
+        viewer.repaint()
+        viewer.accept()
+        self.viewers_closed += 1
+    
+    def run(self, db_path, viewer_runs=UI_BENCHMARK_VIEWER_RUNS):
+        """Сценарии: запуск, список всех конспектов, поиск при наборе,
+        открытие и закрытие просмотра viewer_runs раз"""
+        self.results = {}
+        self.phases = set()
+        
+        with self.flow('startup'):
+            window = MainWindow(self, db_path=db_path)
+            window.show()
+            self.wait_until(lambda: {'subjects_loaded', 'statistics_loaded'} <= self.phases)
+        
+        with self.flow('open_all_notes') as result:
+            window.show_all_notes()
+            page = window.views.page(('all',))
+            self.wait_until(lambda: page.model.rowCount() > 0)
+            # Прокрутка до конца подгружает следующие страницы в фоне
+            for _ in range(UI_BENCHMARK_SCROLLS):
+                page.view.scrollToBottom()
+                self.app.processEvents()
+                self.wait_until(lambda: not page.model.loading())
+            result['rows'] = page.model.rowCount()
+        
+        words = corpus_vocabulary()
+        queries = [words[3][:length] for length in range(2, len(words[3]) + 1)]
+        queries += [words[0], words[len(words) // 2], f'{words[2]} {words[5]}']
+        with self.flow('search') as result:
+            for query in queries:
+                window.search_input.setText(query)
+                window.on_search()
+                self.wait_until(lambda: window.views.current_key() == ('search',)
+                                and window.search_keyword == query
+                                and 'search' not in window.async_db.keys)
+            result['queries'] = len(queries)
+        
+        items = [('note', row[0]) for row in window.db.iter_rows('SELECT id FROM notes ORDER BY id LIMIT 50')]
+        items += [('user', row[0]) for row in window.db.iter_rows('SELECT id FROM user_notes ORDER BY id LIMIT 50')]
+        self.app.installEventFilter(self)
+        try:
+            with self.flow('viewer') as result:
+                self.viewers_closed = 0
+                for number in range(viewer_runs):
+                    window.on_note_action('view', items[number % len(items)])
+                    self.wait_until(lambda: self.viewers_closed > number)
+                result['opened'] = viewer_runs
+        finally:
+            self.app.removeEventFilter(self)
+        
+        window.shutdown()
+        window.hide()
+        window.deleteLater()
+        self.settle()
+        return self.results
+
+
+def run_ui_benchmarks(sizes=UI_BENCHMARK_SIZES, viewer_runs=UI_BENCHMARK_VIEWER_RUNS,
+                      directory=BENCHMARK_DIRECTORY, output=None):
+    """Прогоняет сценарии интерфейса на базах нужных размеров и записывает
+    отчет в JSON в формате run_benchmarks(). Возвращает путь к отчету."""
+    import platform
+    import tempfile
+    
+    app = QApplication.instance() or QApplication(sys.argv)
+    app.setStyle('Fusion')
+    harness = UiHarness(app)
+    
+    report = {
+        'version': 1,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'qt': QT_VERSION_STR,
+            'platform': platform.platform(),
+            'qpa': app.platformName(),
+        },
+        'corpora': {},
+    }
+    
+    # Пиковая память считается за весь процесс, поэтому базы идут по возрастанию
+    for notes in sorted(sizes):
+        path = os.path.abspath(corpus_path(notes, directory))
+        print(f"База на {notes} конспектов: {path}")
+        generate_corpus(path, notes)
+        
+        # Папки приложения (изображения, миниатюры, копии) - во временной папке
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                results = harness.run(path, viewer_runs)
+            finally:
+                os.chdir(cwd)
+        
+        report['corpora'][str(notes)] = {'notes': notes, 'seed': BENCHMARK_SEED, 'results': results}
+        for name, result in results.items():
+            print(f"  {name:<16}{result['wall_ms']:>10.1f} мс, задержек {result['stalls']}"
+                  f" (макс. {result['stall_max_ms']:.0f} мс), виджетов {result['widgets_after']},"
+                  f" память {result['peak_rss_kb']} КБ")
+    
+    if output is None:
+        output = os.path.join(directory, f"ui_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+    return output
 
 
 # ============================================
 # ЗАПУСК ПРИЛОЖЕНИЯ
 # ============================================
+def check_query_plans(path='school_notes.db'):
+    """Проверяет планы частых запросов, возвращает код выхода"""
+    db = Database(path)
+    problems = db.check_query_plans()
+    db.close()
+    
+    for name, detail in problems:
+        print(f"{name}: {detail}")
+    
+    if problems:
+        print(f"Запросов без индекса: {len(problems)}")
+        return 1
+    
+    print("Все частые запросы используют индексы")
+    return 0
+
+
+def rebuild_statistics(path='school_notes.db'):
+    """Пересчитывает счетчики статистики, возвращает код выхода"""
+    db = Database(path)
+    db.rebuild_statistics()
+    stats = db.get_statistics()
+    db.close()
+    
+    print(f"Готовых конспектов: {stats['default_notes']}, своих: {stats['user_notes']}")
+    return 0
+
+
 def main():
+    # Проверка планов запросов без запуска интерфейса
+    if '--check-query-plans' in sys.argv:
+        sys.exit(check_query_plans())
+    
+    # Пересчет счетчиков статистики без запуска интерфейса
+    if '--rebuild-statistics' in sys.argv:
+        sys.exit(rebuild_statistics())
+    
+    # Нагрузочные замеры: --benchmark [1000,100000], сравнение двух прогонов:
+    # --compare-benchmarks было.json стало.json
+    if '--benchmark' in sys.argv:
+        index = sys.argv.index('--benchmark')
+        sizes = BENCHMARK_SIZES
+        if index + 1 < len(sys.argv) and not sys.argv[index + 1].startswith('--'):
+            sizes = [int(size) for size in sys.argv[index + 1].split(',')]
+        run_benchmarks(sizes)
+        sys.exit(0)
+    
+    # Сценарии интерфейса без экрана: --ui-benchmark [1000,100000]
+    if '--ui-benchmark' in sys.argv:
+        os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+        index = sys.argv.index('--ui-benchmark')
+        sizes = UI_BENCHMARK_SIZES
+        if index + 1 < len(sys.argv) and not sys.argv[index + 1].startswith('--'):
+            sizes = [int(size) for size in sys.argv[index + 1].split(',')]
+        run_ui_benchmarks(sizes)
+        sys.exit(0)
+    
+    if '--compare-benchmarks' in sys.argv:
+        index = sys.argv.index('--compare-benchmarks')
+        sys.exit(compare_benchmarks(*sys.argv[index + 1:index + 3]))
+    
+    # Отчет о времени запуска по этапам, после первой отрисовки - выход
+    profiler = None
+    
     app = QApplication(sys.argv)
+    if '--profile-startup' in sys.argv:
+        profiler = StartupProfiler()
+        profiler.mark('qapplication')
     
-    # Устанавливаем стиль
+    # Устанавливаем стиль; палитру и таблицу стилей выбирает ThemeEngine
     app.setStyle('Fusion')
     
-    # Создаем палитру для темной темы (опционально)
-    palette = QPalette()
-    palette.setColor(QPalette.Window, QColor(53, 53, 53))
-    palette.setColor(QPalette.WindowText, Qt.white)
-    palette.setColor(QPalette.Base, QColor(25, 25, 25))
-    palette.setColor(QPalette.AlternateBase, QColor(53, 53, 53))
-    palette.setColor(QPalette.ToolTipBase, Qt.white)
-    palette.setColor(QPalette.ToolTipText, Qt.white)
-    palette.setColor(QPalette.Text, Qt.white)
-    palette.setColor(QPalette.Button, QColor(53, 53, 53))
-    palette.setColor(QPalette.ButtonText, Qt.white)
-    palette.setColor(QPalette.BrightText, Qt.red)
-    palette.setColor(QPalette.Link, QColor(42, 130, 218))
-    palette.setColor(QPalette.Highlight, QColor(42, 130, 218))
-    palette.setColor(QPalette.HighlightedText, Qt.black)
-    # app.setPalette(palette)  # Раскомментируйте для темной темы
-    
     # Устанавливаем иконку приложения
     app.setWindowIcon(QIcon.fromTheme("document-edit"))
     
     # Запускаем главное окно
-    window = MainWindow()
+    window = MainWindow(profiler)
+    if profiler is not None:
+        profiler.watch_first_paint(window)
     window.show()
+    if profiler is not None:
+        profiler.mark('show')
     
     sys.exit(app.exec_())
 